@@ -0,0 +1,59 @@
+# -*- coding: UTF-8 -*-
+'''
+Rendering time and HTML size of the LDS and analysis charts for every chart
+backend. Run it with carto_report installed (pip install -e .):
+
+    python benchmarks/bench_charts.py [--repeat 20]
+'''
+
+import argparse
+import time
+
+import pandas as pd
+
+from carto_report import charts
+from carto_report.classify import ANALYSIS_IDS
+from carto_report.report import Reporter
+
+
+def synthetic():
+    '''
+    LDS and analysis types dfs shaped like the ones built by Reporter
+    '''
+    lds_df = pd.DataFrame({
+        'Monthly Quota': [5000, 5000, 5000, 10000],
+        'Provider': ['heremaps', 'heremaps', 'heremaps', 'carto'],
+        'Used': [1200, 300, 4700, 2100.5],
+        '% Used': [24.0, 6.0, 94.0, 21.0],
+        'Left': [3800, 4700, 300, 7899.5],
+        '% Left': [76.0, 94.0, 6.0, 79.0]
+    }, index=pd.Index(['geocoding', 'routing', 'isolines', 'storage'], name='Service'))
+
+    names = [name for _, name in ANALYSIS_IDS[:12]]
+    analysis_types_df = pd.DataFrame({'Analysis Count': list(range(len(names), 0, -1))}, index=names)
+
+    return lds_df, analysis_types_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chart backends benchmark')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    lds_df, analysis_types_df = synthetic()
+
+    print('{:>8} {:>14} {:>14}'.format('backend', 'time (ms)', 'html (bytes)'))
+    for backend in charts.CHART_BACKENDS:
+        reporter = Reporter('benchmark', None, None, None, 5000, chart_backend=backend)
+        reporter.getCharts(analysis_types_df, lds_df)
+
+        start = time.time()
+        for _ in range(args.repeat):
+            html = reporter.getCharts(analysis_types_df, lds_df)
+        elapsed = (time.time() - start) * 1000.0 / args.repeat
+
+        print('{:>8} {:>14.1f} {:>14}'.format(backend, elapsed, sum(len(part) for part in html)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# -*- coding: UTF-8 -*-
+'''
+Micro-benchmark of the tables classification: the previous per-row loops
+against carto_report.classify, on synthetic inventories. Run it with
+carto_report installed (pip install -e .):
+
+    python benchmarks/bench_classify.py [--sizes 1000 100000 1000000] [--legacy-max 100000]
+'''
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from carto_report import classify
+
+GEOMETRIES = [['ST_Point'], ['ST_MultiPolygon'], ['ST_Polygon'], ['ST_LineString'],
+              ['MultiLineString'], ['Polygon'], [], None]
+
+
+def synthetic(size, seed=0):
+    '''
+    Build datasets and tables dfs, half of the tables being cached analyses
+    '''
+    rng = np.random.RandomState(seed)
+    datasets = size // 2
+    ids = [analysis_id for analysis_id, _ in classify.ANALYSIS_IDS]
+
+    dsets_df = pd.DataFrame({
+        'name': ['table_{}'.format(i) for i in range(datasets)],
+        'geometry': [GEOMETRIES[i] for i in rng.randint(0, len(GEOMETRIES), datasets)]
+    })
+    analysis_names = ['analysis_{}_{:x}'.format(ids[i], n)
+                      for n, i in enumerate(rng.randint(0, len(ids), size - datasets))]
+    tables_df = pd.DataFrame({'name': list(dsets_df['name']) + analysis_names})
+    tables_df = tables_df.merge(dsets_df, on='name', how='left')
+
+    return dsets_df, tables_df
+
+
+def legacy(dsets_df, tables_df):
+    '''
+    Previous implementation: per-row geocoded loop, Yes/No strings and
+    equivalences normalized and merged on every call
+    '''
+    dsets_df = dsets_df.copy()
+    dsets_df['geom_type'] = dsets_df.geometry.str[0]
+    dsets_df['geocoded'] = False
+    for i in range(len(dsets_df)):
+        if dsets_df.geom_type[i] in ('ST_Point', 'ST_MultiPolygon', 'ST_Polygon', 'ST_MultiLineString', 'ST_LineString'):
+            dsets_df.loc[i, 'geocoded'] = True
+        else:
+            dsets_df.loc[i, 'geocoded'] = False
+
+    tables_df = tables_df.copy()
+    tables_df['cartodbfied'] = np.where(tables_df['name'].isin(dsets_df['name']), 'Yes', 'No')
+    analysis_df = tables_df.loc[tables_df['cartodbfied'] == 'No'].copy()
+    analysis_df['id'] = analysis_df['name'].str.split("_", n=3, expand=True)[1]
+    equivalences_df = pd.DataFrame([{'type': t, 'id': i} for i, t in classify.ANALYSIS_IDS])
+    analysis_df = pd.merge(analysis_df, equivalences_df, on='id', how='left')
+
+    return analysis_df['type'].value_counts()
+
+
+def current(dsets_df, tables_df):
+    geom_type = classify.geometry_class(dsets_df['geometry'])
+    classified_df = classify.classify(tables_df['name'], dsets_df['name'], geom_type)
+
+    return classified_df['type'].value_counts()
+
+
+def timed(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tables classification benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--legacy-max', type=int, default=100000,
+                        help='Largest size to run the per-row implementation with')
+    args = parser.parse_args()
+
+    print('{:>10} {:>12} {:>12}'.format('rows', 'legacy (s)', 'classify (s)'))
+    for size in args.sizes:
+        dsets_df, tables_df = synthetic(size)
+        legacy_time = timed(legacy, dsets_df, tables_df) if size <= args.legacy_max else float('nan')
+        current_time = timed(current, dsets_df, tables_df)
+        print('{:>10} {:>12.3f} {:>12.3f}'.format(size, legacy_time, current_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# -*- coding: UTF-8 -*-
+'''
+Micro-benchmark of the snapshot diff on synthetic snapshots: 1% of the
+tables removed, 1% added and 10% grown between both. Run it with
+carto_report installed (pip install -e .):
+
+    python benchmarks/bench_diff.py [--sizes 10000 100000 1000000]
+'''
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from carto_report.diff import SnapshotDiff
+
+
+def synthetic(size, seed=0):
+    '''
+    Build two snapshots of size tables, maps and datasets
+    '''
+    rng = np.random.RandomState(seed)
+    names = np.array(['table_{}'.format(i) for i in range(size + size // 100)], dtype=object)
+    sizes = rng.randint(8192, 10 ** 9, len(names)).astype(np.int64)
+
+    def snapshot(start, end, grown):
+        tables_df = pd.DataFrame({
+            'schema': 'public',
+            'name': names[start:end],
+            'size': sizes[start:end] * np.where(grown[start:end], 2, 1)
+        })
+        maps_df = pd.DataFrame({'name': names[start:end], 'url': names[start:end]})
+        datasets_df = pd.DataFrame({'name': names[start:end]})
+        return {'date': str(start), 'tables': tables_df, 'maps': maps_df, 'datasets': datasets_df}
+
+    grown = rng.rand(len(names)) < 0.1
+    old = snapshot(0, size, np.zeros(len(names), dtype=bool))
+    new = snapshot(size // 100, len(names), grown)
+
+    return old, new
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Snapshot diff benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    print('{:>10} {:>10} {:>10} {:>10} {:>10}'.format('tables', 'diff (s)', 'added', 'removed', 'grown'))
+    for size in args.sizes:
+        old, new = synthetic(size)
+
+        start = time.time()
+        figures = SnapshotDiff(old, new).figures()
+        elapsed = time.time() - start
+
+        print('{:>10} {:>10.2f} {:>10} {:>10} {:>10}'.format(
+            size, elapsed, figures['tables_added'], figures['tables_removed'], figures['tables_grown']))
+
+
+if __name__ == '__main__':
+    main()
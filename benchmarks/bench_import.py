@@ -0,0 +1,88 @@
+# -*- coding: UTF-8 -*-
+'''
+Import-time regression guard for the command line entry points. It runs
+python -X importtime for every module and fails if any of them loads a
+heavy dependency or takes longer than the allowed time. Run it with
+carto_report installed (pip install -e .):
+
+    python benchmarks/bench_import.py [--max-ms 150]
+
+carto_report.report is also checked not to load matplotlib or mpld3.
+'''
+
+import argparse
+import subprocess
+import sys
+
+HEAVY_MODULES = ['pandas', 'numpy', 'matplotlib', 'mpld3', 'jinja2', 'carto', 'requests']
+PLOTTING_MODULES = ['matplotlib', 'mpld3']
+
+# module, top level packages it must not load, whether --max-ms applies
+GUARDS = [
+    ('carto_report.cli', HEAVY_MODULES, True),
+    ('carto_report.batch', HEAVY_MODULES, True),
+    ('carto_report.report', PLOTTING_MODULES, False)
+]
+
+
+IMPORT_CODE = '''
+import sys
+before = set(sys.modules)
+import {module}
+print('\\n'.join(sorted(set(sys.modules) - before)))
+'''
+
+
+def importtime(module):
+    '''
+    Get the (cumulative microseconds, module name) of every import and the
+    names of the modules loaded by importing module, leaving out the ones
+    loaded at interpreter startup
+    '''
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', IMPORT_CODE.format(module=module)],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    loaded = set(result.stdout.split())
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = [field.strip() for field in line[len('import time:'):].split('|')]
+        if name in loaded:
+            imports.append((int(cumulative), name))
+
+    return imports, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import time regression guard')
+    parser.add_argument('--max-ms', type=float, default=150,
+                        help='Maximum cumulative import time of every module in ms')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Number of slowest imports to show')
+    args = parser.parse_args()
+
+    failed = False
+    for module, forbidden, timed in GUARDS:
+        imports, loaded = importtime(module)
+        names = set(name.split('.')[0] for name in loaded)
+        total = dict((name, cumulative) for cumulative, name in imports)[module] / 1000.0
+
+        print('{}: {:.1f} ms'.format(module, total))
+        for cumulative, name in sorted(imports, reverse=True)[:args.top]:
+            print('  {:>8.1f} ms  {}'.format(cumulative / 1000.0, name))
+
+        heavy = sorted(names.intersection(forbidden))
+        if heavy:
+            print('  FAIL: imports {}'.format(', '.join(heavy)))
+            failed = True
+        if timed and total > args.max_ms:
+            print('  FAIL: slower than {} ms'.format(args.max_ms))
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
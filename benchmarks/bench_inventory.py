@@ -0,0 +1,130 @@
+# -*- coding: UTF-8 -*-
+'''
+Memory and time of the inventory model on a synthetic account: the tables
+inventory read in chunks from a stand-in of the SQL API, the maps and
+datasets records, and the processing stages building the snapshot and its
+counts. Every size runs in its own process to measure its peak RSS. Run it
+with carto_report installed (pip install -e .):
+
+    python benchmarks/bench_inventory.py [--sizes 100000 1000000]
+'''
+
+import argparse
+import multiprocessing
+import re
+import resource
+import time
+import warnings
+
+from carto_report.classify import ANALYSIS_IDS
+
+warnings.filterwarnings('ignore')
+
+FIRST_OID = 100000
+DATE = '2018-12-01T10:00:00+00:00'
+PRIVACIES = ['PRIVATE', 'LINK', 'PUBLIC']
+GEOMETRIES = [['ST_Point'], ['ST_MultiPolygon'], ['ST_LineString'], []]
+
+
+def table_name(index, datasets):
+    if index < datasets:
+        return 'table_{}'.format(index)
+    return 'analysis_{}_{:010x}'.format(ANALYSIS_IDS[index % len(ANALYSIS_IDS)][0], index)
+
+
+def fake_query(tables, datasets):
+    '''
+    Answer the inventory queries of a Reporter with synthetic relations, half of them datasets
+    '''
+
+    def query(sql):
+        match = re.search(r'c\.oid > (\d+)\s+order by c\.oid\s+limit (\d+)', sql)
+        last_oid, limit = int(match.group(1)), int(match.group(2))
+        start = max(last_oid + 1, FIRST_OID)
+        rows = []
+        for oid in range(start, min(start + limit, FIRST_OID + tables)):
+            table_size = 8192 * (1 + oid * 7919 % 5000)
+            indexes_size = 8192 * (1 + oid % 40)
+            rows.append({
+                'oid': oid, 'name': table_name(oid - FIRST_OID, datasets), 'schema': 'public',
+                'relfilenode': oid, 'index_count': 1, 'index_relfilenodes': oid + 1, 'n_tup_ins': oid % 1000, 'n_tup_upd': 0, 'n_tup_del': 0,
+                'last_vacuum': None, 'last_autovacuum': DATE, 'last_analyze': None, 'last_autoanalyze': DATE,
+                'n_live_tup': oid % 1000, 'n_dead_tup': oid % 100, 'estimated_rows': oid % 1000,
+                'size': table_size + indexes_size, 'table_size': table_size,
+                'indexes_size': indexes_size, 'toast_size': 0
+            })
+        return rows
+
+    return query
+
+
+def rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run(tables, queue):
+    '''
+    Build the snapshot of the synthetic account, in a child process to measure its peak RSS
+    '''
+    import pandas as pd
+    from carto_report.report import Reporter
+
+    datasets = tables // 2
+    reporter = Reporter('bench', None, None, None, 5000)
+    reporter.query = fake_query(tables, datasets)
+
+    vizs = [('map_{}'.format(i), DATE, 'https://example.com/viz/map-{}'.format(i), DATE) for i in range(datasets // 10)]
+    dsets = [(table_name(i, datasets), PRIVACIES[i % 3], DATE, DATE if i % 10 == 0 else None, GEOMETRIES[i % 4])
+             for i in range(datasets)]
+    lds = pd.DataFrame([{'monthly_quota': 5000, 'provider': 'heremaps', 'service': 'routing',
+                         'soft_limit': False, 'used_quota': 10}])
+
+    timings = {}
+    start_rss = rss()
+
+    start = time.time()
+    inventory_df = reporter.getInventory()
+    timings['inventory'] = time.time() - start
+
+    start = time.time()
+    snapshot = reporter.processResults({'vizs': vizs, 'dsets': dsets, 'inventory': inventory_df,
+                                        'storage': 100.0, 'lds': lds})
+    del inventory_df
+    timings['process'] = time.time() - start
+
+    start = time.time()
+    reporter.getCounts(snapshot)
+    reporter.getSummary(snapshot)
+    timings['counts'] = time.time() - start
+
+    memory = dict((name, snapshot[name].memory_usage(deep=True).sum() / 1000000.0)
+                  for name in ('maps', 'datasets', 'tables', 'analysis'))
+
+    queue.put({'timings': timings, 'memory': memory, 'rss': rss() - start_rss})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inventory model memory and time benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000],
+                        help='Number of relations, half of them datasets')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('fork')
+    print('{:>9} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+        'tables', 'inventory', 'process', 'counts', 'rss (MB)', 'tables MB', 'dsets MB', 'analys MB'))
+
+    for size in args.sizes:
+        queue = context.Queue()
+        process = context.Process(target=run, args=(size, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+
+        timings, memory = result['timings'], result['memory']
+        print('{:>9} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+            size, timings['inventory'], timings['process'], timings['counts'], result['rss'],
+            memory['tables'], memory['datasets'], memory['analysis']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# -*- coding: UTF-8 -*-
+'''
+Time to render the HTML report of a synthetic snapshot again, as done by
+--watch, without a render cache and with one when nothing changed and when
+only the LDS usage changed, and the size of the report, with the full
+inventory embedded when --full-inventory is given. Run it with carto_report
+installed (pip install -e .):
+
+    python benchmarks/bench_render.py [--tables 100000] [--charts mpld3] [--repeat 5] [--full-inventory gzip]
+'''
+
+import argparse
+import io
+import time
+import warnings
+
+import pandas as pd
+
+from carto_report.classify import ANALYSIS_IDS
+from carto_report.report import Reporter
+from carto_report.sections import RenderCache
+
+warnings.filterwarnings('ignore')
+
+DATE = '2018-12-01T10:00:00+00:00'
+
+
+def lds(used):
+    return pd.DataFrame([{'monthly_quota': 5000, 'provider': 'heremaps', 'service': 'routing',
+                          'soft_limit': False, 'used_quota': used}])
+
+
+def synthetic(reporter, tables):
+    '''
+    Build a snapshot with tables relations, half of them datasets and half cached analyses
+    '''
+    datasets = tables // 2
+    names = ['table_{}'.format(i) if i < datasets else
+             'analysis_{}_{:010x}'.format(ANALYSIS_IDS[i % len(ANALYSIS_IDS)][0], i) for i in range(tables)]
+    inventory_df = pd.DataFrame({
+        'oid': range(tables), 'name': names, 'schema': 'public',
+        'n_live_tup': [i % 1000 for i in range(tables)], 'n_dead_tup': [i % 100 for i in range(tables)],
+        'size': [8192 * (1 + i * 7919 % 5000) for i in range(tables)], 'approximate': False
+    })
+    for column in ('table_size', 'indexes_size', 'toast_size'):
+        inventory_df[column] = inventory_df['size'] // 3
+    inventory_df['last_autovacuum'] = pd.Timestamp(DATE)
+
+    vizs = [('map_{}'.format(i), DATE, 'https://example.com/viz/map-{}'.format(i), DATE) for i in range(100)]
+    dsets = [(names[i], 'PRIVATE', DATE, None, ['ST_Point']) for i in range(datasets)]
+
+    return reporter.processResults({'vizs': vizs, 'dsets': dsets, 'inventory': inventory_df,
+                                    'storage': 100.0, 'lds': lds(10)})
+
+
+def timed(reporter, snapshot, counts, repeat):
+    start = time.time()
+    for _ in range(repeat):
+        reporter.renderSnapshot(snapshot, io.StringIO(), counts)
+    return (time.time() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report refresh rendering benchmark')
+    parser.add_argument('--tables', type=int, default=100000)
+    parser.add_argument('--charts', type=str, choices=['mpld3', 'svg'], default='mpld3')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--full-inventory', type=str, choices=['json', 'gzip'], default=None)
+    args = parser.parse_args()
+
+    reporter = Reporter('bench', None, None, None, 5000, chart_backend=args.charts,
+                        full_inventory=args.full_inventory)
+    snapshot = synthetic(reporter, args.tables)
+    counts = reporter.getCounts(snapshot)
+
+    uncached = timed(reporter, snapshot, counts, args.repeat)
+    size = len(reporter.renderSnapshot(snapshot, None, counts).encode('utf-8'))
+
+    reporter.render_cache = RenderCache()
+    reporter.renderSnapshot(snapshot, io.StringIO(), counts)
+    unchanged = timed(reporter, snapshot, counts, args.repeat)
+
+    lds_changed = 0.0
+    for i in range(args.repeat):
+        snapshot['quota'] = reporter.getQuota('bench', 5000, 100.0, lds(11 + i))
+        lds_changed += timed(reporter, snapshot, counts, 1) / args.repeat
+    sections = reporter.render_cache
+
+    print('{:>9} {:>8} {:>12} {:>12} {:>12} {:>12}'.format(
+        'tables', 'charts', 'no cache', 'unchanged', 'lds changed', 'html MB'))
+    print('{:>9} {:>8} {:>12.3f} {:>12.3f} {:>12.3f} {:>12.2f}'.format(
+        args.tables, args.charts, uncached, unchanged, lds_changed, size / 1000000.0))
+    print('sections rendered on the last refresh: {} of {}'.format(sections.rendered, sections.rendered + sections.reused))
+
+
+if __name__ == '__main__':
+    main()
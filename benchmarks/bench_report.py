@@ -0,0 +1,395 @@
+# -*- coding: UTF-8 -*-
+'''
+End-to-end benchmark of Reporter.reportTo against a local fake CARTO API:
+the SQL API (tables inventory, sizes, storage and LDS queries) and the
+paginated api/v1/viz/ endpoint used to list maps and datasets.
+Every scale point runs in its own process and reports wall
+time, API requests, peak RSS and the time of every stage. Run it with
+carto_report installed (pip install -e .):
+
+    python benchmarks/bench_report.py [--scales 1000 10000 100000] [--latency 0.02]
+        [--maps N] [--datasets N] [--analyses N] [--page-size 20] [--concurrency 4] [--throttle 0.1]
+        [--approximate] [--exact-top N]
+
+With --org-users N it benchmarks the organization admin scan (--org-admin) of
+datasets + analyses tables spread over N users instead.
+'''
+
+import argparse
+import json
+import multiprocessing
+import random
+import re
+import resource
+import threading
+import time
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from carto_report.classify import ANALYSIS_IDS
+
+warnings.filterwarnings('ignore')
+
+FIRST_OID = 100000
+DATE = '2018-12-01T10:00:00+00:00'
+PRIVACIES = ['PRIVATE', 'LINK', 'PUBLIC']
+GEOMETRIES = [['ST_Point'], ['ST_MultiPolygon'], ['ST_LineString'], []]
+SERVICES = [('hires_geocoder', 'heremaps'), ('routing', 'heremaps'),
+            ('isolines', 'heremaps'), ('observatory', 'data observatory')]
+
+### fake CARTO API
+
+class FakeCarto(object):
+    '''
+    Synthetic account with maps, datasets and cached analysis tables. Tables
+    0 to datasets - 1 are the datasets, the rest are analyses.
+    '''
+
+    def __init__(self, maps, datasets, analyses, latency=0.0, page_size=20, throttle=0.0, users=1):
+        self.maps = maps
+        self.datasets = datasets
+        self.analyses = analyses
+        self.latency = latency
+        self.page_size = page_size
+        self.throttle = throttle
+        self.users = users
+
+        self.lock = threading.Lock()
+        self.requests = {}
+
+    def count(self, endpoint):
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def reset(self):
+        with self.lock:
+            requests, self.requests = self.requests, {}
+        return requests
+
+    ### catalog
+
+    def tableName(self, index):
+        if index < self.datasets:
+            return 'table_{}'.format(index)
+        analysis_id = ANALYSIS_IDS[index % len(ANALYSIS_IDS)][0]
+        return 'analysis_{}_{:010x}'.format(analysis_id, index)
+
+    def tableSizes(self, oid):
+        table_size = 8192 * (1 + oid * 7919 % 5000)
+        indexes_size = 8192 * (1 + oid % 40)
+        toast_size = 8192 * (oid % 3)
+        return {
+            'oid': oid,
+            'size': table_size + indexes_size + toast_size,
+            'table_size': table_size,
+            'indexes_size': indexes_size,
+            'toast_size': toast_size
+        }
+
+    def approximateSizes(self, oid):
+        # statistics lag behind: the catalog counts 90% of the table pages
+        sizes = self.tableSizes(oid)
+        sizes['table_size'] = 8192 * (sizes['table_size'] * 9 // 81920)
+        sizes['size'] = sizes['table_size'] + sizes['indexes_size'] + sizes['toast_size']
+        return sizes
+
+    def tableRow(self, oid, sizes):
+        row = {
+            'oid': oid,
+            'name': self.tableName(oid - FIRST_OID),
+            'schema': 'public' if self.users == 1 else 'user_{}'.format(oid % self.users),
+            'relfilenode': oid,
+            'index_count': 1,
+            'index_relfilenodes': oid + 1,
+            'n_tup_ins': oid % 1000,
+            'n_tup_upd': 0,
+            'n_tup_del': 0,
+            'last_vacuum': None,
+            'last_autovacuum': None,
+            'last_analyze': None,
+            'last_autoanalyze': DATE,
+            'n_live_tup': oid % 1000,
+            'n_dead_tup': oid * 7 % 400,
+            'estimated_rows': oid % 1000
+        }
+        if sizes == 'exact':
+            row.update(self.tableSizes(oid))
+        elif sizes == 'approximate':
+            row.update(self.approximateSizes(oid))
+        return row
+
+    def sql(self, query):
+        tables = self.datasets + self.analyses
+
+        if 'json_agg(q)' in query:
+            # batch of queries, one JSON array column per query
+            queries = re.findall(r'from \(\n(.*?)\n    \) q\) as (q\d+)', query, re.S)
+            return [dict((name, self.sql(sub)) for sub, name in queries)]
+
+        if 'cdb_service_quota_info' in query:
+            return [{'monthly_quota': 5000, 'provider': provider, 'service': service,
+                     'soft_limit': False, 'used_quota': 100 * (i + 1)}
+                    for i, (service, provider) in enumerate(SERVICES)]
+
+        if 'from pg_tables' in query.lower():
+            total = sum(self.tableSizes(FIRST_OID + i)['size'] for i in range(tables))
+            return [{'total': total / 1000000.0}]
+
+        if 'relpages' in query and 'c.oid >' not in query:
+            total = sum(self.approximateSizes(FIRST_OID + i)['size'] for i in range(tables))
+            return [{'total': total / 1000000.0}]
+
+        match = re.search(r'c\.oid > (\d+)\s+and n\.nspname .*\s+order by c\.oid\s+limit (\d+)', query)
+        if match:
+            last_oid, limit = int(match.group(1)), int(match.group(2))
+            start = max(last_oid + 1, FIRST_OID)
+            end = min(start + limit, FIRST_OID + tables)
+            rows = []
+            for oid in range(start, end):
+                row = self.tableSizes(oid)
+                row['name'] = self.tableName(oid - FIRST_OID)
+                row['schema'] = row['owner'] = 'user_{}'.format(oid % self.users)
+                rows.append(row)
+            return rows
+
+        match = re.search(r'c\.oid > (\d+)\s+order by c\.oid\s+limit (\d+)', query)
+        if match:
+            last_oid, limit = int(match.group(1)), int(match.group(2))
+            start = max(last_oid + 1, FIRST_OID)
+            end = min(start + limit, FIRST_OID + tables)
+            if 'pg_total_relation_size' in query:
+                sizes = 'exact'
+            elif 'relpages' in query:
+                sizes = 'approximate'
+            else:
+                sizes = None
+            return [self.tableRow(oid, sizes) for oid in range(start, end)]
+
+        match = re.search(r'c\.oid in \(([\d,\s]+)\)', query)
+        if match:
+            oids = [int(oid) for oid in match.group(1).split(',')]
+            return [self.tableSizes(oid) for oid in oids if FIRST_OID <= oid < FIRST_OID + tables]
+
+        raise ValueError('Unknown query')
+
+    def viz(self, kind, page, per_page=None):
+        total = self.maps if kind == 'derived' else self.datasets
+        per_page = per_page or self.page_size
+        start = (page - 1) * per_page
+        items = []
+        for i in range(start, min(start + per_page, total)):
+            if kind == 'derived':
+                items.append({'id': 'map-{}'.format(i), 'name': 'map_{}'.format(i), 'type': 'derived',
+                              'created_at': DATE, 'updated_at': DATE,
+                              'url': 'https://example.com/viz/map-{}'.format(i)})
+            else:
+                items.append({'id': 'dataset-{}'.format(i), 'name': self.tableName(i), 'type': 'table',
+                              'privacy': PRIVACIES[i % len(PRIVACIES)],
+                              'created_at': DATE, 'updated_at': DATE,
+                              'synchronization': {'updated_at': DATE} if i % 10 == 0 else {},
+                              'table': {'geometry_types': GEOMETRIES[i % len(GEOMETRIES)]}})
+        return {'visualizations': items, 'total_entries': total}
+
+
+def start_server(fake):
+    '''
+    Serve a FakeCarto in a daemon thread, returns the server
+    '''
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def respond(self, params):
+            path = urlparse(self.path).path
+            time.sleep(fake.latency)
+            try:
+                if path.endswith('/api/v2/sql') and random.random() < fake.throttle:
+                    fake.count('throttled')
+                    self.send_response(429)
+                    for header, value in (('Retry-After', '0'), ('Carto-Rate-Limit-Limit', '10'),
+                                          ('Carto-Rate-Limit-Remaining', '0'), ('Carto-Rate-Limit-Reset', '0')):
+                        self.send_header(header, value)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                elif path.endswith('/api/v2/sql'):
+                    fake.count('sql')
+                    body = {'rows': fake.sql(params['q'][0]), 'time': 0.0}
+                elif path.endswith('/api/v1/viz/'):
+                    fake.count('viz')
+                    body = fake.viz(params.get('type', ['derived'])[0], int(params.get('page', ['1'])[0]),
+                                    int(params.get('per_page', ['0'])[0]))
+                else:
+                    self.send_error(404)
+                    return
+            except (KeyError, ValueError) as e:
+                self.send_response(400)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps({'error': [str(e)]}).encode('utf-8'))
+                return
+
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self.respond(parse_qs(urlparse(self.path).query))
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+            params = parse_qs(urlparse(self.path).query)
+            params.update(parse_qs(body))
+            self.respond(params)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+### benchmark
+
+def run_report(base_url, concurrency, queue, approximate=False, exact_top=0):
+    '''
+    Write the report of the fake account, in a child process to measure its peak RSS
+    '''
+    from carto_report.report import Reporter
+
+    class Discard(object):
+        def write(self, text):
+            return len(text)
+
+    reporter = Reporter('bench', base_url, None, 'bench-key', 5000,
+                        concurrency=concurrency, chart_backend='svg',
+                        approximate=approximate, exact_top=exact_top)
+    start = time.time()
+    try:
+        reporter.reportTo(Discard())
+    except Exception as e:
+        queue.put({'error': str(e)})
+        return
+    wall = time.time() - start
+
+    queue.put({
+        'wall': wall,
+        'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        'timings': reporter.timings['stages']
+    })
+
+
+def run_org(base_url, queue):
+    '''
+    Scan and roll up the fake organization, in a child process to measure its peak RSS
+    '''
+    from carto_report.report import Reporter
+
+    reporter = Reporter('bench', base_url, 'bench', 'bench-key', 5000)
+    start = time.time()
+    try:
+        rollup = reporter.getOrgInventory()
+    except Exception as e:
+        queue.put({'error': str(e)})
+        return
+    wall = time.time() - start
+
+    queue.put({
+        'wall': wall,
+        'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        'users': len(rollup.users),
+        'tables': rollup.totals()['tables']
+    })
+
+
+def main_org(args, fake, base_url, context):
+    print('{:>8} {:>8} {:>9} {:>9} {:>9}'.format('users', 'tables', 'wall (s)', 'requests', 'rss (MB)'))
+
+    for scale in args.scales:
+        fake.maps = 0
+        fake.datasets = scale if args.datasets is None else args.datasets
+        fake.analyses = scale if args.analyses is None else args.analyses
+        fake.reset()
+
+        queue = context.Queue()
+        process = context.Process(target=run_org, args=(base_url, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        requests = fake.reset()
+
+        if 'error' in result:
+            print('{:>8} {:>8}  failed: {}'.format(fake.users, fake.datasets + fake.analyses, result['error']))
+            continue
+
+        print('{:>8} {:>8} {:>9.2f} {:>9} {:>9.1f}'.format(
+            result['users'], result['tables'], result['wall'], sum(requests.values()), result['rss']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end report benchmark against a fake CARTO API')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Number of maps, datasets and analyses of every scale point')
+    parser.add_argument('--maps', type=int, default=None, help='Fixed number of maps')
+    parser.add_argument('--datasets', type=int, default=None, help='Fixed number of datasets')
+    parser.add_argument('--analyses', type=int, default=None, help='Fixed number of cached analysis tables')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request')
+    parser.add_argument('--page-size', type=int, default=20,
+                        help='Maps and datasets per api/v1/viz/ page when the client does not ask for per_page')
+    parser.add_argument('--throttle', type=float, default=0.0,
+                        help='Fraction of SQL API requests answered with 429 Too Many Requests')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--approximate', action='store_true', help='Estimate the sizes from the catalog')
+    parser.add_argument('--exact-top', type=int, default=0, help='Largest tables measured with --approximate')
+    parser.add_argument('--org-users', type=int, default=None,
+                        help='Benchmark the --org-admin scan of an organization with these users instead')
+    args = parser.parse_args()
+
+    fake = FakeCarto(0, 0, 0, args.latency, args.page_size, args.throttle, args.org_users or 1)
+    server = start_server(fake)
+    base_url = 'http://127.0.0.1:{}/user/bench/'.format(server.server_address[1])
+    context = multiprocessing.get_context('fork')
+
+    if args.org_users:
+        main_org(args, fake, base_url, context)
+        server.shutdown()
+        return
+
+    stages = ['vizs', 'dsets', 'inventory', 'storage', 'lds', 'process', 'charts', 'render']
+    print('{:>8} {:>8} {:>8} {:>9} {:>9} {:>8} {:>8} {:>9} {:>9}  {}'.format(
+        'maps', 'dsets', 'analyses', 'wall (s)', 'requests', 'sql', 'viz', 'throttled', 'rss (MB)',
+        ' '.join('{:>9}'.format(stage) for stage in stages)))
+
+    for scale in args.scales:
+        fake.maps = scale if args.maps is None else args.maps
+        fake.datasets = scale if args.datasets is None else args.datasets
+        fake.analyses = scale if args.analyses is None else args.analyses
+        fake.reset()
+
+        queue = context.Queue()
+        process = context.Process(target=run_report,
+                                  args=(base_url, args.concurrency, queue, args.approximate, args.exact_top))
+        process.start()
+        result = queue.get()
+        process.join()
+        requests = fake.reset()
+
+        if 'error' in result:
+            print('{:>8} {:>8} {:>8}  failed: {}'.format(fake.maps, fake.datasets, fake.analyses, result['error']))
+            continue
+
+        print('{:>8} {:>8} {:>8} {:>9.2f} {:>9} {:>8} {:>8} {:>9} {:>9.1f}  {}'.format(
+            fake.maps, fake.datasets, fake.analyses, result['wall'], sum(requests.values()),
+            requests.get('sql', 0), requests.get('viz', 0), requests.get('throttled', 0), result['rss'],
+            ' '.join('{:>9.2f}'.format(result['timings'].get(stage, {}).get('wall', 0)) for stage in stages)))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
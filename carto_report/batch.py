@@ -0,0 +1,262 @@
+import logging
+import warnings
+import os
+import sys
+import csv
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from carto_report.cli import get_log_level
+
+warnings.filterwarnings('ignore')
+
+ROLLUP_COLUMNS = ['user', 'org', 'status', 'date', 'maps', 'datasets', 'tables',
+                  'analysis', 'analysis_size', 'storage_quota', 'storage_used',
+                  'failures', 'duration', 'error']
+NO_ORGANIZATION = '(no organization)'
+
+def parse_arguments():
+    # set input arguments
+    parser = argparse.ArgumentParser(
+        description='CARTO reporting tool, batch mode for many accounts')
+
+    parser.add_argument('accounts', type=argparse.FileType('r'),
+                        help='CSV file with one account per line as' +
+                        ' user,api_key[,api_url[,organization[,quota]]]' +
+                        ' (use - to read from stdin)')
+
+    parser.add_argument('--organization', '-o', type=str, dest='CARTO_ORG',
+                        default=os.getenv('CARTO_ORG'),
+                        help='Default organization for accounts without one' +
+                        ' (defaults to env variable CARTO_ORG)')
+
+    parser.add_argument('--api_url_template', '-u', type=str, dest='api_url_template',
+                        default=os.getenv('CARTO_API_URL_TEMPLATE'),
+                        help='Base URL for accounts without one, {user} and {org}' +
+                        ' are replaced. Defaults to https://{org}.carto.com/user/{user}/' +
+                        ' for organization accounts and https://{user}.carto.com/ otherwise' +
+                        ' (or env variable CARTO_API_URL_TEMPLATE)')
+
+    parser.add_argument('--output-dir', type=str, dest='output_dir',
+                        default='reports',
+                        help='Folder for the reports and the roll-up, defaults to reports')
+
+    parser.add_argument('--charts', type=str, dest='chart_backend',
+                        choices=['mpld3', 'svg'], default='mpld3',
+                        help='How to draw the charts: mpld3 interactive figures' +
+                        ' or lightweight inline SVG, defaults to mpld3')
+
+    parser.add_argument('--template-dir', type=str, dest='template_dir',
+                        default=None,
+                        help='Folder with custom report templates, templates' +
+                        ' not found there are taken from the package')
+
+    parser.add_argument('--quota', '-q', type=int, dest='quota',
+                        default=5000,
+                        help='LDS quota for accounts without one, defaults to 5000')
+
+    parser.add_argument('--workers', '-w', type=int, dest='workers',
+                        default=8,
+                        help='Number of accounts reported at the same time, defaults to 8')
+
+    parser.add_argument('--concurrency', '-c', type=int, dest='concurrency',
+                        default=4,
+                        help='Maximum number of API requests run at the same time' +
+                        ' for every account, defaults to 4')
+
+    parser.add_argument('--rate', type=float, dest='rate',
+                        default=None,
+                        help='Maximum number of SQL API requests per second' +
+                        ' for every account, unlimited by default')
+
+    parser.add_argument('--retries', type=int, dest='retries',
+                        default=5,
+                        help='Times a rate limited or failed SQL API request' +
+                        ' is retried, defaults to 5')
+
+    parser.add_argument('--approximate', action='store_true', dest='approximate',
+                        help='Estimate the tables sizes and the storage from the' +
+                        ' database statistics instead of measuring every table,' +
+                        ' much faster with many tables')
+
+    parser.add_argument('--exact-top', type=int, dest='exact_top',
+                        default=0,
+                        help='With --approximate, measure the exact size of this' +
+                        ' number of largest tables, defaults to 0')
+
+    parser.add_argument('--history', type=str, dest='history',
+                        default=os.getenv('CARTO_REPORT_HISTORY'),
+                        help='SQLite database to append the storage, LDS and tables' +
+                        ' sizes of every account to, see carto_report_history' +
+                        ' (defaults to env variable CARTO_REPORT_HISTORY)')
+
+    parser.add_argument('--loglevel', '-l', type=str, dest='loglevel',
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        default='ERROR', help='How verbose the output should be, default to the most silent'
+                        )
+
+    return parser.parse_args()
+
+
+def read_accounts(lines, org=None, quota=5000, api_url_template=None):
+    '''
+    Read the accounts from CSV lines, skipping blank lines and comments
+    '''
+    accounts = []
+    for row in csv.reader(lines):
+        row = [value.strip() for value in row]
+        if not row or not row[0] or row[0].startswith('#'):
+            continue
+        if len(row) < 2 or not row[1]:
+            raise ValueError('Missing API key for account {}'.format(row[0]))
+
+        row = row + [''] * (5 - len(row))
+        user, api_key, api_url, account_org, account_quota = row[:5]
+        account_org = account_org or org
+
+        accounts.append({
+            'user': user,
+            'api_key': api_key,
+            'api_url': api_url or get_api_url(user, account_org, api_url_template),
+            'org': account_org,
+            'quota': int(account_quota) if account_quota else quota
+        })
+
+    return accounts
+
+
+def get_api_url(user, org=None, template=None):
+    if template is None:
+        template = 'https://{org}.carto.com/user/{user}/' if org else 'https://{user}.carto.com/'
+    return template.format(user=user, org=org)
+
+
+def run_account(account, output_dir, session, concurrency=4, template_dir=None,
+                chart_backend='mpld3', history=None, rate=None, retries=5,
+                approximate=False, exact_top=0):
+    '''
+    Write the report of one account and return its summary for the roll-up
+    '''
+    from carto_report.report import Reporter
+
+    logger = logging.getLogger('carto_report_batch')
+    start = time.time()
+    try:
+        logger.info('Gathering all the information for {}...'.format(account['user']))
+        reporter = Reporter(account['user'], account['api_url'], account['org'],
+                            account['api_key'], account['quota'],
+                            concurrency=concurrency, session=session,
+                            template_dir=template_dir, chart_backend=chart_backend,
+                            rate=rate, retries=retries,
+                            approximate=approximate, exact_top=exact_top)
+        output = os.path.join(output_dir, '{}.html'.format(account['user']))
+        with open(output + '.tmp', 'w') as writer:
+            metrics = reporter.reportTo(writer)
+        os.replace(output + '.tmp', output)
+        logger.info('Stored {} report at {}'.format(account['user'], output))
+        if history is not None:
+            history.append(metrics)
+        summary = dict(reporter.summary, status='ok')
+    except Exception as e:
+        logger.error('{}: {}'.format(account['user'], e))
+        summary = {
+            'user': account['user'],
+            'org': account['org'],
+            'status': 'error',
+            'error': str(e),
+            'duration': round(time.time() - start, 2)
+        }
+    return summary
+
+
+def rollup_totals(rollup_df):
+    '''
+    Get the totals of the successful accounts by organization
+    '''
+    ok_df = rollup_df.loc[rollup_df['status'] == 'ok']
+    # accounts without organization are counted together instead of dropped by groupby
+    orgs = ok_df['org'].fillna(NO_ORGANIZATION).replace('', NO_ORGANIZATION)
+    return ok_df.groupby(orgs).agg({
+        'user': 'count',
+        'maps': 'sum',
+        'datasets': 'sum',
+        'tables': 'sum',
+        'analysis': 'sum',
+        'analysis_size': 'sum',
+        'storage_quota': 'sum',
+        'storage_used': 'sum'
+    }).rename(columns={'user': 'users'})
+
+
+def write_rollup(summaries, output_dir):
+    '''
+    Write the organization roll-up as CSV and HTML
+    '''
+    import pandas as pd
+
+    rollup_df = pd.DataFrame(summaries, columns=ROLLUP_COLUMNS)
+    rollup_df.to_csv(os.path.join(output_dir, 'rollup.csv'), index=False)
+    totals_df = rollup_totals(rollup_df)
+
+    with open(os.path.join(output_dir, 'index.html'), 'w') as writer:
+        writer.write('<!DOCTYPE html>\n<html lang="en">\n<head>\n<meta charset="UTF-8">\n')
+        writer.write('<title>CARTO Metrics Roll-up</title>\n</head>\n<body>\n')
+        writer.write('<h1>Organizations</h1>\n')
+        writer.write(totals_df.to_html())
+        writer.write('\n<h1>Accounts</h1>\n')
+        writer.write(rollup_df.fillna('').to_html(index=False))
+        writer.write('\n</body>\n</html>\n')
+
+
+def main():
+    # Get configuration
+    args = parse_arguments()
+
+    # logger (better than print)
+    logging.basicConfig(
+        level=get_log_level(args.loglevel),
+        format=' %(asctime)s - %(name)-18s - %(levelname)-8s %(message)s',
+        datefmt='%I:%M:%S %p')
+    logger = logging.getLogger('carto_report_batch')
+
+    try:
+        accounts = read_accounts(args.accounts, args.CARTO_ORG, args.quota, args.api_url_template)
+    except ValueError as e:
+        logger.error(e)
+        sys.exit(1)
+
+    if not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    history = None
+    if args.history:
+        from carto_report.history import HistoryStore
+        history = HistoryStore(args.history)
+
+    # keep-alive session shared by all the accounts
+    from carto_report.sqlapi import get_session
+
+    workers = max(1, args.workers)
+    session = get_session(workers * max(1, args.concurrency))
+
+    logger.info('Reporting {} accounts with {} workers...'.format(len(accounts), workers))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        summaries = list(executor.map(
+            lambda account: run_account(account, args.output_dir, session,
+                                        args.concurrency, args.template_dir,
+                                        args.chart_backend, history,
+                                        args.rate, args.retries,
+                                        args.approximate, args.exact_top),
+            accounts))
+
+    write_rollup(summaries, args.output_dir)
+    failed = len([summary for summary in summaries if summary['status'] != 'ok'])
+    logger.info('Finished! {} reports, {} failed'.format(len(summaries) - failed, failed))
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# -*- coding: UTF-8 -*-
+
+import logging
+import os
+import pickle
+import re
+import time
+
+### defaults
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.getenv('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+    'carto_report')
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_SIZE = 500 * 1000000
+
+SNAPSHOT_EXTENSION = '.pkl'
+
+### snapshot store
+
+class SnapshotStore(object):
+    '''
+    Local on-disk store of the data collected by a Reporter.
+
+    Snapshots are pickled under <path>/<org>/<user>/<collection time>.pkl.
+    Entries older than ttl seconds are evicted, and the oldest ones are
+    removed while the store is bigger than max_size bytes.
+    '''
+
+    def __init__(self, path=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+
+        self.logger = logging.getLogger('carto_report')
+        self.logger.addHandler(logging.NullHandler())
+
+    def getFolder(self, user, org):
+        '''
+        Method to get the folder of the snapshots of an account.
+        '''
+
+        return os.path.join(self.path, self._safe(org or '_'), self._safe(user))
+
+    def save(self, user, org, snapshot, collected_at=None):
+        '''
+        Method to store a snapshot, returns its path.
+        '''
+
+        collected_at = time.time() if collected_at is None else collected_at
+        folder = self.getFolder(user, org)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        path = os.path.join(folder, '{:.0f}{}'.format(collected_at * 1000, SNAPSHOT_EXTENSION))
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as writer:
+            pickle.dump(snapshot, writer, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+        self.logger.info('Snapshot stored at {}'.format(path))
+        self.evict()
+
+        return path
+
+    def load(self, user, org, max_age=None):
+        '''
+        Method to get the latest snapshot of an account not older than max_age seconds (nor the TTL).
+        Returns None if there is no such snapshot.
+        '''
+
+        max_age = self.ttl if max_age is None else min(max_age, self.ttl)
+        now = time.time()
+
+        for path, collected_at, _ in reversed(self.entries(self.getFolder(user, org))):
+            if now - collected_at > max_age:
+                break
+            try:
+                with open(path, 'rb') as reader:
+                    return pickle.load(reader)
+            except Exception as e:
+                self.logger.warning('Unable to read snapshot {}: {}'.format(path, e))
+
+        return None
+
+    def loadPrevious(self, user, org):
+        '''
+        Method to get the snapshot stored before the latest one of an account, to compare
+        the latest collection with. Returns None if there is no such snapshot.
+        '''
+
+        for path, _, _ in reversed(self.entries(self.getFolder(user, org))[:-1]):
+            try:
+                with open(path, 'rb') as reader:
+                    return pickle.load(reader)
+            except Exception as e:
+                self.logger.warning('Unable to read snapshot {}: {}'.format(path, e))
+
+        return None
+
+    def entries(self, folder=None):
+        '''
+        Method to list (path, collected_at, size) of the stored snapshots, oldest first.
+        '''
+
+        folder = self.path if folder is None else folder
+        entries = []
+
+        for root, _, files in os.walk(folder):
+            for name in files:
+                if not name.endswith(SNAPSHOT_EXTENSION):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    collected_at = int(name[:-len(SNAPSHOT_EXTENSION)]) / 1000.0
+                    size = os.path.getsize(path)
+                except (ValueError, OSError):
+                    continue
+                entries.append((path, collected_at, size))
+
+        return sorted(entries, key=lambda entry: entry[1])
+
+    def evict(self):
+        '''
+        Method to remove expired snapshots and the oldest ones over the size limit.
+        '''
+
+        now = time.time()
+        entries = self.entries()
+        total_size = sum(size for _, _, size in entries)
+
+        for path, collected_at, size in entries:
+            if now - collected_at <= self.ttl and total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+                total_size -= size
+                self.logger.debug('Snapshot {} evicted'.format(path))
+            except OSError as e:
+                self.logger.warning('Unable to evict snapshot {}: {}'.format(path, e))
+
+    def _safe(self, name):
+        return re.sub(r'[^\w.-]', '_', name)
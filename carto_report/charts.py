@@ -0,0 +1,177 @@
+# -*- coding: UTF-8 -*-
+
+import math
+import sys
+import threading
+from xml.sax.saxutils import escape
+
+### chart backends
+
+# mpld3: matplotlib figures serialized by mpld3, svg: compact inline SVG
+CHART_BACKENDS = ['mpld3', 'svg']
+DEFAULT_CHART_BACKEND = 'mpld3'
+
+LDS_COLORS = {'% Left': '#009392', '% Used': '#cf597e'}
+CARTOCOLORS = ['#7F3C8D', '#11A579', '#3969AC', '#F2B701', '#E73F74', '#80BA5A',
+               '#E68310', '#008695', '#CF1C90', '#f97b72', '#4b4b8f', '#A5AA99']
+
+### matplotlib helpers, matplotlib and mpld3 are only loaded when used
+
+# pyplot keeps global state, so figures are built one at a time across threads
+PLOT_LOCK = threading.Lock()
+
+
+def get_pyplot():
+    '''
+    Import pyplot on first use, forcing a non-interactive backend unless pyplot is already in use.
+    '''
+    if 'matplotlib.pyplot' not in sys.modules:
+        import matplotlib
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def figure_html(fig):
+    '''
+    Serialize a matplotlib figure with mpld3 and close it. Call it holding PLOT_LOCK.
+    '''
+    from mpld3 import fig_to_html
+
+    try:
+        return fig_to_html(fig)
+    finally:
+        get_pyplot().close(fig)
+
+### svg backend
+
+SVG_WIDTH = 640
+SVG_HEIGHT = 480
+SVG_FONT = 'font-family="sans-serif" font-size="12" fill="#2c3032"'
+
+
+def svg_quota(lds_df):
+    '''
+    Stacked bar chart of the used and left percentage of every service as inline SVG.
+    '''
+    names = [str(name) for name in lds_df.index]
+    used = [_number(value) for value in lds_df['% Used']]
+    left = [_number(value) for value in lds_df['% Left']]
+
+    x0, x1, y0, y1 = 50, SVG_WIDTH - 20, 40, SVG_HEIGHT - 60
+    slot = (x1 - x0) / float(max(len(names), 1))
+    width = slot * 0.85
+    scale = (y1 - y0) / 100.0
+
+    parts = [_svg_open()]
+    parts.extend(_y_axis(x0, x1, y0, y1, 100))
+
+    for i, name in enumerate(names):
+        x = x0 + slot * i + (slot - width) / 2
+        used_height = max(min(used[i], 100), 0) * scale
+        left_height = max(min(left[i], 100 - used[i]), 0) * scale
+        parts.append(_rect(x, y1 - used_height, width, used_height, LDS_COLORS['% Used'],
+                           '{}: {}% used'.format(name, used[i])))
+        parts.append(_rect(x, y1 - used_height - left_height, width, left_height, LDS_COLORS['% Left'],
+                           '{}: {}% left'.format(name, left[i])))
+        parts.append('<text x="{:.1f}" y="{}" text-anchor="middle" {}>{}</text>'.format(
+            x + width / 2, y1 + 16, SVG_FONT, escape(name)))
+
+    parts.append(_label(SVG_WIDTH / 2, SVG_HEIGHT - 15, 'Location Data Service'))
+    parts.append(_label(15, (y0 + y1) / 2, '%', rotate=True))
+
+    for i, (label, color) in enumerate([('% Left', LDS_COLORS['% Left']), ('% Used', LDS_COLORS['% Used'])]):
+        parts.append(_rect(x0 + 10, 10 + i * 16, 12, 12, color))
+        parts.append('<text x="{}" y="{}" {}>{}</text>'.format(x0 + 28, 20 + i * 16, SVG_FONT, escape(label)))
+
+    parts.append('</svg>')
+
+    return ''.join(parts)
+
+
+def svg_analysis(analysis_types_df):
+    '''
+    Horizontal bar chart of the number of cached analyses by type as inline SVG.
+    '''
+    names = [str(name) for name in analysis_types_df.index]
+    counts = [_number(value) for value in analysis_types_df['Analysis Count']]
+
+    x0, x1, y0, y1 = 200, SVG_WIDTH - 20, 20, SVG_HEIGHT - 50
+    parts = [_svg_open()]
+
+    if not names:
+        parts.append(_label(SVG_WIDTH / 2, SVG_HEIGHT / 2, 'No cached analyses'))
+        parts.append('</svg>')
+        return ''.join(parts)
+
+    ticks = _ticks(max(counts))
+    scale = (x1 - x0) / float(ticks[-1])
+    slot = (y1 - y0) / float(len(names))
+    height = slot * 0.8
+
+    for tick in ticks:
+        x = x0 + tick * scale
+        parts.append('<line x1="{0:.1f}" y1="{1}" x2="{0:.1f}" y2="{2}" stroke="#e0e0e0"/>'.format(x, y0, y1))
+        parts.append('<text x="{:.1f}" y="{}" text-anchor="middle" {}>{:g}</text>'.format(
+            x, y1 + 16, SVG_FONT, tick))
+
+    for i, name in enumerate(names):
+        y = y0 + slot * i + (slot - height) / 2
+        parts.append(_rect(x0, y, counts[i] * scale, height, CARTOCOLORS[i % len(CARTOCOLORS)],
+                           '{}: {:g}'.format(name, counts[i])))
+        parts.append('<text x="{}" y="{:.1f}" text-anchor="end" dominant-baseline="middle" {}>{}</text>'.format(
+            x0 - 6, y + height / 2, SVG_FONT, escape(name)))
+
+    parts.append('<line x1="{0}" y1="{1}" x2="{0}" y2="{2}" stroke="#2c3032"/>'.format(x0, y0, y1))
+    parts.append(_label((x0 + x1) / 2, SVG_HEIGHT - 10, 'Analysis Count'))
+    parts.append(_label(15, (y0 + y1) / 2, 'Analysis Type', rotate=True))
+    parts.append('</svg>')
+
+    return ''.join(parts)
+
+
+def _svg_open():
+    return ('<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {0} {1}" '
+            'width="100%" style="max-width:{0}px">').format(SVG_WIDTH, SVG_HEIGHT)
+
+
+def _y_axis(x0, x1, y0, y1, top):
+    scale = (y1 - y0) / float(top)
+    parts = []
+    for tick in _ticks(top):
+        y = y1 - tick * scale
+        parts.append('<line x1="{0}" y1="{1:.1f}" x2="{2}" y2="{1:.1f}" stroke="#e0e0e0"/>'.format(x0, y, x1))
+        parts.append('<text x="{}" y="{:.1f}" text-anchor="end" dominant-baseline="middle" {}>{:g}</text>'.format(
+            x0 - 6, y, SVG_FONT, tick))
+    parts.append('<line x1="{0}" y1="{1}" x2="{0}" y2="{2}" stroke="#2c3032"/>'.format(x0, y0, y1))
+    return parts
+
+
+def _rect(x, y, width, height, color, title=None):
+    rect = '<rect x="{:.1f}" y="{:.1f}" width="{:.1f}" height="{:.1f}" fill="{}"'.format(
+        x, y, max(width, 0), max(height, 0), color)
+    if title is None:
+        return rect + '/>'
+    return rect + '><title>{}</title></rect>'.format(escape(title))
+
+
+def _label(x, y, text, rotate=False):
+    transform = ' transform="rotate(-90 {} {})"'.format(x, y) if rotate else ''
+    return '<text x="{}" y="{}" text-anchor="middle"{} {}>{}</text>'.format(
+        x, y, transform, SVG_FONT, escape(text))
+
+
+def _ticks(top, count=5):
+    '''
+    Round tick values from 0 to at least top
+    '''
+    if top <= 0:
+        return [0, 1]
+    magnitude = 10 ** math.floor(math.log10(top / float(count)))
+    step = next(magnitude * factor for factor in (1, 2, 5, 10) if magnitude * factor * count >= top)
+    return [step * i for i in range(int(math.ceil(top / float(step))) + 1)]
+
+
+def _number(value):
+    value = float(value)
+    return 0.0 if math.isnan(value) else value
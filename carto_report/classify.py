@@ -0,0 +1,134 @@
+# -*- coding: UTF-8 -*-
+
+import numpy as np
+import pandas as pd
+
+from carto_report.inventory import positions
+
+### lookup tables, built once at import
+
+# geometry types reported by the datasets API, with and without the ST_ prefix
+GEOMETRY_TYPES = ['point', 'line', 'polygon']
+GEOMETRY_CLASSES = {
+    'ST_Point': 'point',
+    'ST_MultiPoint': 'point',
+    'ST_LineString': 'line',
+    'ST_MultiLineString': 'line',
+    'ST_Polygon': 'polygon',
+    'ST_MultiPolygon': 'polygon'
+}
+GEOMETRY_CLASSES.update(dict((name[3:], value) for name, value in list(GEOMETRY_CLASSES.items())))
+
+# cached analysis tables are named analysis_<id>_<hash>, where the id identifies the analysis type
+ANALYSIS_IDS = [
+    ('b194a8f896', 'aggregate-intersection'),
+    ('5f80bdff9d', 'bounding-box'),
+    ('b7636131b5', 'bounding-circle'),
+    ('2f13a3dbd7', 'buffer'),
+    ('ae64186757', 'centroid'),
+    ('4bd65e58e4', 'closest'),
+    ('259cf96ece', 'concave-hull'),
+    ('779051ec8e', 'contour'),
+    ('05234e7c2a', 'convex-hull'),
+    ('a08f3b6124', 'data-observatory-measure'),
+    ('cd60938c7b', 'data-observatory-multiple-measures'),
+    ('e85ed857c2', 'deprecated-sql-function'),
+    ('83d60eb9fa', 'filter-by-node-column'),
+    ('440d2c1487', 'filter-category'),
+    ('f15fa0b618', 'filter-grouped-rank'),
+    ('942b6fec82', 'filter-range'),
+    ('43155891da', 'filter-rank'),
+    ('a5bdb274e8', 'georeference-admin-region'),
+    ('d5b2dd1672', 'georeference-city'),
+    ('792d8938e3', 'georeference-country'),
+    ('d5b2274cdf', 'georeference-ip-address'),
+    ('0623244fc4', 'georeference-long-lat'),
+    ('1f7c6f9f43', 'georeference-postal-code'),
+    ('1ea6dec9f3', 'georeference-street-address'),
+    ('93ab69856c', 'gravity'),
+    ('971639c870', 'intersection'),
+    ('3c835a874c', 'kmeans'),
+    ('9fd29bd5c0', 'line-sequential'),
+    ('9e88a1147e', 'line-source-to-target'),
+    ('be2ff62ce9', 'line-to-column'),
+    ('eca516b80b', 'line-to-single-point'),
+    ('49ca809a90', 'link-by-line'),
+    ('c38cb847a0', 'merge'),
+    ('91837cbb3c', 'moran'),
+    ('2e94d3858c', 'point-in-polygon'),
+    ('d52251dc01', 'population-in-area'),
+    ('a627e132c2', 'routing-sequential'),
+    ('b70cf71482', 'routing-to-layer-all-to-all'),
+    ('2923729eb9', 'routing-to-single-point'),
+    ('7530d60ffc', 'sampling'),
+    ('fd83c76763', 'source'),
+    ('9c3b798f46', 'spatial-markov-trend'),
+    ('112d4fc091', 'trade-area'),
+    ('1d85314d7a', 'weighted-centroid'),
+]
+ANALYSIS_INDEX = dict(ANALYSIS_IDS)
+ANALYSIS_PREFIX = 'analysis_'
+ANALYSIS_ID_START = len(ANALYSIS_PREFIX)
+ANALYSIS_ID_END = ANALYSIS_ID_START + 10
+ANALYSIS_TYPES = sorted(set(ANALYSIS_INDEX.values()))
+
+### classification
+
+def lookup(values, mapping, categories):
+    '''
+    Map values to a categorical of the given categories, hashing every distinct value only once.
+    Values not found in mapping become NaN.
+    '''
+
+    values = pd.Series(values).astype('category')
+    mapped = pd.Categorical(pd.Series(values.cat.categories).map(mapping), categories=categories)
+    codes = values.cat.codes.values
+    target = np.append(mapped.codes, -1).astype(codes.dtype)
+
+    return pd.Categorical.from_codes(target[codes], categories)
+
+
+def geometry_class(geometry):
+    '''
+    Classify the geometry types lists of the datasets as point, line or polygon.
+    '''
+
+    first = [types[0] if isinstance(types, (list, tuple)) and types else None for types in geometry]
+
+    return lookup(first, GEOMETRY_CLASSES, GEOMETRY_TYPES)
+
+
+def analysis_type(names):
+    '''
+    Get the analysis type from cached analysis table names.
+    '''
+
+    names = pd.Series(names)
+    ids = names.str.slice(ANALYSIS_ID_START, ANALYSIS_ID_END).where(names.str.startswith(ANALYSIS_PREFIX))
+
+    return lookup(ids, ANALYSIS_INDEX, ANALYSIS_TYPES)
+
+
+def classify(names, dataset_names, dataset_geom_types):
+    '''
+    Classify tables in a single pass, joining them with the datasets by name through a hash index.
+    Returns a df aligned with names with the geom_type of their dataset, geocoded, cartodbfied
+    (whether they are registered as datasets) and type (analysis type, only for non cartodbfied tables).
+    '''
+
+    dataset = positions(names, dataset_names)
+    is_cartodbfied = dataset >= 0
+    geom_codes = pd.Categorical(dataset_geom_types, categories=GEOMETRY_TYPES).codes
+    # only matched positions are looked up, -1 would read the last dataset or fail without datasets
+    codes = np.full(len(dataset), -1, dtype=geom_codes.dtype)
+    codes[is_cartodbfied] = geom_codes[dataset[is_cartodbfied]]
+    geom_type = pd.Categorical.from_codes(codes, GEOMETRY_TYPES)
+    types = analysis_type(names)
+    types[is_cartodbfied] = np.nan
+
+    return pd.DataFrame({
+        'geom_type': geom_type,
+        'geocoded': np.asarray(geom_type.codes >= 0),
+        'cartodbfied': is_cartodbfied,
+        'type': types
+    }, index=pd.Series(names).index, columns=['geom_type', 'geocoded', 'cartodbfied', 'type'])
@@ -2,7 +2,8 @@ import logging
 import warnings
 import os
 import argparse
-from carto_report.report import Reporter
+from carto_report import exporters
+from carto_report.cache import SnapshotStore, DEFAULT_CACHE_DIR, DEFAULT_TTL
 
 warnings.filterwarnings('ignore')
 
@@ -16,6 +17,46 @@ def get_log_level(loglevel):
     else:
         return logging.ERROR
 
+def write_timings(timings, path):
+    import json
+    import sys
+
+    if path == '-':
+        json.dump(timings, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(path, 'w') as writer:
+            json.dump(timings, writer, indent=2)
+
+def export_metrics(reporter, args, formats, logger):
+    logger.info(
+        'Gathering all the information for {}...'.format(args.CARTO_USER))
+    metrics = reporter.collect(from_cache=args.from_cache, max_age=args.max_age)
+    logger.info('Storing at {}'.format(args.output))
+    exporters.export(reporter, metrics, formats, args.output)
+    if args.history:
+        from carto_report.history import HistoryStore
+        HistoryStore(args.history).append(metrics)
+        logger.info('History updated at {}'.format(args.history))
+    if args.timings:
+        write_timings(reporter.timings, args.timings)
+
+def watch(reporter, args, formats, logger):
+    import time
+
+    # the previous report is kept when a refresh fails
+    try:
+        while True:
+            start = time.time()
+            try:
+                export_metrics(reporter, args, formats, logger)
+                logger.info('Report refreshed in {:.2f} seconds'.format(time.time() - start))
+            except Exception as e:
+                logger.error(e)
+            time.sleep(max(0, args.watch - (time.time() - start)))
+    except KeyboardInterrupt:
+        logger.info('Stopped watching')
+
 def parse_arguments():
     # set input arguments
     parser = argparse.ArgumentParser(
@@ -46,10 +87,141 @@ def parse_arguments():
                         default='report.html',
                         help='File path for the report, defaults to report.html')
 
+    parser.add_argument('--format', '-f', type=str, dest='formats',
+                        default='html',
+                        help='Comma separated output formats: html, json, csv and' +
+                        ' parquet, for example html,json. Formats other than html' +
+                        ' are written next to the output file, defaults to html')
+
     parser.add_argument('--quota', '-q', type=int, dest='quota',
                         default=5000,
                         help='LDS quota for the user, defaults to 5000')
 
+    parser.add_argument('--charts', type=str, dest='chart_backend',
+                        choices=['mpld3', 'svg'], default='mpld3',
+                        help='How to draw the charts: mpld3 interactive figures' +
+                        ' or lightweight inline SVG, defaults to mpld3')
+
+    parser.add_argument('--template-dir', type=str, dest='template_dir',
+                        default=None,
+                        help='Folder with custom report templates, templates' +
+                        ' not found there are taken from the package')
+
+    parser.add_argument('--concurrency', '-c', type=int, dest='concurrency',
+                        default=4,
+                        help='Maximum number of API requests run at the same time, defaults to 4')
+
+    parser.add_argument('--rate', type=float, dest='rate',
+                        default=None,
+                        help='Maximum number of SQL API requests per second, unlimited by default')
+
+    parser.add_argument('--retries', type=int, dest='retries',
+                        default=5,
+                        help='Times a rate limited or failed SQL API request' +
+                        ' is retried, defaults to 5')
+
+    parser.add_argument('--approximate', action='store_true', dest='approximate',
+                        help='Estimate the tables sizes and the storage from the' +
+                        ' database statistics instead of measuring every table,' +
+                        ' much faster with many tables')
+
+    parser.add_argument('--exact-top', type=int, dest='exact_top',
+                        default=0,
+                        help='With --approximate, measure the exact size of this' +
+                        ' number of largest tables, defaults to 0')
+
+    parser.add_argument('--full-inventory', type=str, dest='full_inventory',
+                        nargs='?', const='gzip', default=None,
+                        choices=['json', 'gzip'],
+                        help='Embed every table, cached analysis and map in the' +
+                        ' report, shown in a sortable and filterable table, as' +
+                        ' JSON or gzipped JSON, defaults to gzip')
+
+    parser.add_argument('--cache-dir', type=str, dest='cache_dir',
+                        default=os.getenv('CARTO_REPORT_CACHE_DIR'),
+                        help='Folder to store the collected data snapshots' +
+                        ' (defaults to env variable CARTO_REPORT_CACHE_DIR or ' +
+                        DEFAULT_CACHE_DIR + ' when using --from-cache, --max-age, --incremental' +
+                        ' or --compare)')
+
+    parser.add_argument('--from-cache', action='store_true', dest='from_cache',
+                        help='Render the report from the latest stored snapshot' +
+                        ' without calling the APIs')
+
+    parser.add_argument('--max-age', type=int, dest='max_age',
+                        default=None,
+                        help='Reuse a stored snapshot if it is not older than' +
+                        ' these seconds, otherwise collect the data again')
+
+    parser.add_argument('--cache-ttl', type=int, dest='cache_ttl',
+                        default=DEFAULT_TTL,
+                        help='Seconds to keep stored snapshots, defaults to a week')
+
+    parser.add_argument('--cache-size', type=int, dest='cache_size',
+                        default=500,
+                        help='Maximum size of the snapshots folder in MB, defaults to 500')
+
+    parser.add_argument('--incremental', action='store_true', dest='incremental',
+                        help='Measure again only the tables that changed since the' +
+                        ' latest stored snapshot, carrying forward the other sizes')
+
+    parser.add_argument('--compare', action='store_true', dest='compare',
+                        help='Add the tables, maps and datasets added, removed,' +
+                        ' grown or shrunk since the previous stored snapshot to' +
+                        ' the report, and write them as JSON next to the output file')
+
+    parser.add_argument('--top-changes', type=int, dest='top_changes',
+                        default=10,
+                        help='Number of tables with the biggest size changes' +
+                        ' shown by --compare, defaults to 10')
+
+    parser.add_argument('--history', type=str, dest='history',
+                        default=os.getenv('CARTO_REPORT_HISTORY'),
+                        help='SQLite database to append the storage, LDS and tables' +
+                        ' sizes of every run to, see carto_report_history' +
+                        ' (defaults to env variable CARTO_REPORT_HISTORY)')
+
+    parser.add_argument('--timings', type=str, dest='timings', nargs='?',
+                        const='-', default=None, metavar='FILE',
+                        help='Write the wall and CPU time, API requests, bytes,' +
+                        ' retries and rows of every stage as JSON to FILE, or' +
+                        ' to the standard output if no FILE is given')
+
+    parser.add_argument('--timings-footer', action='store_true', dest='timings_footer',
+                        help='Add the timings of every stage to the report footer')
+
+    parser.add_argument('--serve', type=int, dest='serve', metavar='PORT',
+                        default=None,
+                        help='Run as a daemon serving OpenMetrics at' +
+                        ' http://BIND:PORT/metrics instead of writing reports')
+
+    parser.add_argument('--bind', type=str, dest='bind',
+                        default='127.0.0.1',
+                        help='Address to listen at with --serve, defaults to 127.0.0.1')
+
+    parser.add_argument('--interval', type=int, dest='interval',
+                        default=300,
+                        help='Seconds between metrics refreshes with --serve, defaults to 300')
+
+    parser.add_argument('--watch', type=int, dest='watch', metavar='INTERVAL',
+                        default=None,
+                        help='Collect the data and write the report again every' +
+                        ' INTERVAL seconds until interrupted, rendering again' +
+                        ' only the report sections whose data changed')
+
+    parser.add_argument('--table-metrics', action='store_true', dest='table_metrics',
+                        help='Expose the size of every table with --serve')
+
+    parser.add_argument('--org-admin', action='store_true', dest='org_admin',
+                        help='Report every user of the organization in a single' +
+                        ' catalog scan, the API key has to be an organization' +
+                        ' admin one. Writes a roll-up by user at the output path' +
+                        ' and as CSV next to it')
+
+    parser.add_argument('--org-tables', action='store_true', dest='org_tables',
+                        help='With --org-admin, also write every scanned table and' +
+                        ' its sizes as CSV next to the output file')
+
     parser.add_argument('--loglevel', '-l', type=str, dest='loglevel',
                         choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
                         default='ERROR', help='How verbose the output should be, default to the most silent'
@@ -69,17 +241,71 @@ def main():
         datefmt='%I:%M:%S %p')
     logger = logging.getLogger('carto_report_cli')
 
+    # Snapshot store
+    store = None
+    if args.cache_dir or args.from_cache or args.max_age is not None or args.incremental or args.compare:
+        store = SnapshotStore(args.cache_dir or DEFAULT_CACHE_DIR,
+                              args.cache_ttl, args.cache_size * 1000000)
+
     # Set authentification to CARTO
-    if args.CARTO_USER and args.CARTO_API_URL and args.CARTO_API_KEY:
+    if args.CARTO_USER and ((args.CARTO_API_URL and args.CARTO_API_KEY) or args.from_cache):
+        # heavy imports (pandas, carto) only once the arguments are valid
+        from carto_report.report import Reporter
+
+        render_cache = None
+        if args.watch is not None:
+            from carto_report.sections import RenderCache
+            render_cache = RenderCache()
+
         reporter = Reporter(args.CARTO_USER, args.CARTO_API_URL,
-                            args.CARTO_ORG, args.CARTO_API_KEY, args.quota)
-        try:
+                            args.CARTO_ORG, args.CARTO_API_KEY, args.quota,
+                            concurrency=args.concurrency, store=store,
+                            incremental=args.incremental,
+                            template_dir=args.template_dir,
+                            chart_backend=args.chart_backend,
+                            timings_footer=args.timings_footer,
+                            rate=args.rate, retries=args.retries,
+                            approximate=args.approximate,
+                            exact_top=args.exact_top,
+                            compare=args.compare,
+                            top_changes=args.top_changes,
+                            render_cache=render_cache,
+                            full_inventory=args.full_inventory)
+        if args.serve is not None:
+            from carto_report.openmetrics import MetricsExporter, serve
+
+            exporter = MetricsExporter(reporter, args.interval, args.table_metrics)
+            serve(exporter, args.serve, args.bind)
+            return
+
+        if args.org_admin:
+            from carto_report.org import TablesWriter, write_report
+
             logger.info(
-                'Gathering all the information for {}...'.format(args.CARTO_USER))
-            result = reporter.report()
-            logger.info('Storing at {}'.format(args.output))
-            with open(args.output, 'w') as writer:
-                writer.write(result)
+                'Scanning all the tables of the organization {}...'.format(args.CARTO_ORG))
+            writer = None
+            if args.org_tables:
+                writer = TablesWriter(os.path.splitext(args.output)[0] + '_tables.csv')
+            try:
+                rollup = reporter.getOrgInventory(writer)
+                if writer is not None:
+                    writer.close()
+                write_report(rollup, args.output)
+                if args.timings:
+                    write_timings(reporter.timings, args.timings)
+                logger.info('Finished!')
+            except Exception as e:
+                if writer is not None and not writer.file.closed:
+                    writer.close(complete=False)
+                logger.error(e)
+            return
+
+        try:
+            formats = exporters.parse_formats(args.formats)
+            if args.watch is not None:
+                watch(reporter, args, formats, logger)
+                return
+            export_metrics(reporter, args, formats, logger)
             logger.info('Finished!')
         except Exception as e:
             logger.error(e)
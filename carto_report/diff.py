@@ -0,0 +1,165 @@
+# -*- coding: UTF-8 -*-
+
+import json
+import logging
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+### identity of every entity between runs
+
+TABLE_KEY = ['schema', 'name']
+MAP_KEY = ['url']
+DATASET_KEY = ['name']
+DEFAULT_TOP = 10
+
+STATUSES = ['added', 'removed', 'grown', 'shrunk']
+
+logger = logging.getLogger('carto_report')
+logger.addHandler(logging.NullHandler())
+
+
+def diff_frames(old_df, new_df, key, value=None, extra=None):
+    '''
+    Hash join two frames by key, returns the entities added, removed and, when value is given,
+    those whose value changed, with a status column, the old and new value and their delta.
+    Keys are factorized together and joined through a hash index, without sorting, and only
+    the changed rows are copied. Extra columns are taken from the newest frame.
+    '''
+    columns = key + (extra or [])
+    old_codes, new_codes = _factorize(old_df, new_df, key)
+
+    # the first row of every key, as relations are unique by key
+    old_rows = np.flatnonzero(~pd.Series(old_codes).duplicated().values)
+    new_rows = np.flatnonzero(~pd.Series(new_codes).duplicated().values)
+    matches = pd.Index(old_codes[old_rows]).get_indexer(new_codes[new_rows])
+
+    added = new_rows[matches < 0]
+    kept_new = new_rows[matches >= 0]
+    kept_old = old_rows[matches[matches >= 0]]
+    removed_mask = np.ones(len(old_rows), dtype=bool)
+    removed_mask[matches[matches >= 0]] = False
+    removed = old_rows[removed_mask]
+
+    frames = [_rows(new_df, added, columns, 'added'), _rows(old_df, removed, columns, 'removed')]
+    if value is not None:
+        old_values = old_df[value].values
+        new_values = new_df[value].values
+        frames[0][value + '_old'] = np.nan
+        frames[0][value + '_new'] = new_values[added]
+        frames[1][value + '_old'] = old_values[removed]
+        frames[1][value + '_new'] = np.nan
+
+        delta = new_values[kept_new] - old_values[kept_old]
+        for status, changed in (('grown', delta > 0), ('shrunk', delta < 0)):
+            frame = _rows(new_df, kept_new[changed], columns, status)
+            frame[value + '_old'] = old_values[kept_old[changed]]
+            frame[value + '_new'] = new_values[kept_new[changed]]
+            frames.append(frame)
+
+    changes = pd.concat(frames, ignore_index=True)
+    if value is not None:
+        changes['delta'] = changes[value + '_new'].fillna(0) - changes[value + '_old'].fillna(0)
+
+    return changes[columns + ([value + '_old', value + '_new', 'delta'] if value is not None else []) + ['status']]
+
+
+def _factorize(old_df, new_df, key):
+    # integer codes of the keys of both frames, equal keys getting equal codes
+    codes = np.zeros(len(old_df) + len(new_df), dtype=np.int64)
+    for column in key:
+        values = pd.concat([old_df[column], new_df[column]], ignore_index=True)
+        column_codes, uniques = pd.factorize(values)
+        codes = codes * (len(uniques) + 1) + column_codes
+    return codes[:len(old_df)], codes[len(old_df):]
+
+
+def _rows(df, rows, columns, status):
+    frame = df[columns].iloc[rows].reset_index(drop=True)
+    frame['status'] = status
+    return frame
+
+
+class SnapshotDiff(object):
+    '''
+    Changes between two snapshots of an account: tables added, removed,
+    grown and shrunk with their size deltas, and maps and datasets added
+    or removed. Tables are identified by schema and name, so a table
+    recreated by a synchronization is the same table, maps by URL and
+    datasets by name.
+    '''
+
+    def __init__(self, old, new, top=DEFAULT_TOP):
+        self.date_from = old['date']
+        self.date_to = new['date']
+        self.top = top
+
+        old_tables, new_tables = old['tables'], new['tables']
+        key = [column for column in TABLE_KEY if column in old_tables.columns and column in new_tables.columns]
+        self.size_before = old_tables['size'].sum()
+        self.size_after = new_tables['size'].sum()
+        self.tables = diff_frames(old_tables, new_tables, key, 'size').rename(
+            columns={'size_old': 'size_before', 'size_new': 'size_after'})
+        self.maps = diff_frames(old['maps'], new['maps'], MAP_KEY, extra=['name'])
+        self.datasets = diff_frames(old['datasets'], new['datasets'], DATASET_KEY)
+
+    def figures(self):
+        '''
+        Method to get the number of changes of every kind and the total size delta as a dict.
+        '''
+
+        tables = self.tables['status'].value_counts()
+        maps = self.maps['status'].value_counts()
+        datasets = self.datasets['status'].value_counts()
+
+        figures = OrderedDict([('from', self.date_from), ('to', self.date_to)])
+        for status in STATUSES:
+            figures['tables_' + status] = int(tables.get(status, 0))
+        figures['size_before'] = int(self.size_before)
+        figures['size_after'] = int(self.size_after)
+        figures['size_delta'] = int(self.size_after - self.size_before)
+        for status in STATUSES[:2]:
+            figures['maps_' + status] = int(maps.get(status, 0))
+            figures['datasets_' + status] = int(datasets.get(status, 0))
+
+        return figures
+
+    def getTop(self, status, top=None):
+        '''
+        Method to get the tables with a status with the biggest size deltas.
+        '''
+
+        top = self.top if top is None else top
+        tables = self.tables.loc[self.tables['status'] == status]
+        return tables.loc[tables['delta'].abs().nlargest(top).index]
+
+    def topChanges(self, top=None):
+        '''
+        Method to get the tables with the biggest size deltas of every status as dfs by status.
+        '''
+
+        return OrderedDict((status, self.getTop(status, top)) for status in STATUSES)
+
+    def write(self, path):
+        '''
+        Method to write the figures, the top changes and every change as JSON at path.
+        '''
+
+        with open(path + '.tmp', 'w') as writer:
+            writer.write('{"figures": ')
+            json.dump(self.figures(), writer)
+            writer.write(', "top": {')
+            for i, (status, df) in enumerate(self.topChanges().items()):
+                writer.write('{}{}: '.format(', ' if i else '', json.dumps(status)))
+                df.to_json(writer, orient='records')
+            writer.write('}')
+            for name in ('tables', 'maps', 'datasets'):
+                writer.write(', {}: '.format(json.dumps(name)))
+                getattr(self, name).to_json(writer, orient='records', date_format='iso')
+            writer.write('}\n')
+        os.replace(path + '.tmp', path)
+
+        logger.info('Changes stored at {}'.format(path))
+        return path
@@ -0,0 +1,139 @@
+# -*- coding: UTF-8 -*-
+
+import json
+import logging
+import os
+from collections import OrderedDict
+
+### output formats
+
+EXPORT_FORMATS = ['html', 'json', 'csv', 'parquet']
+
+logger = logging.getLogger('carto_report')
+logger.addHandler(logging.NullHandler())
+
+
+def parse_formats(formats):
+    '''
+    Parse a comma separated list of formats, like html,json,parquet
+    '''
+    parsed = [value.strip().lower() for value in formats.split(',') if value.strip()]
+    unknown = [value for value in parsed if value not in EXPORT_FORMATS]
+    if unknown or not parsed:
+        raise ValueError('Unknown output format {}, use any of {}'.format(
+            ', '.join(unknown) or formats, ', '.join(EXPORT_FORMATS)))
+    return parsed
+
+
+def export(reporter, metrics, formats, output):
+    '''
+    Write the collected metrics in every format and return the written paths.
+    The HTML report is written at output, the rest of the formats next to it
+    using the output name without extension, like the changes since the
+    previous snapshot when they were compared.
+    '''
+    base = os.path.splitext(output)[0]
+    paths = []
+
+    for output_format in formats:
+        if output_format == 'html':
+            paths.append(write_html(reporter, metrics, output))
+        elif output_format == 'json':
+            paths.append(write_json(metrics, base + '.json'))
+        elif output_format == 'csv':
+            paths.extend(write_csv(metrics, base))
+        elif output_format == 'parquet':
+            paths.extend(write_parquet(metrics, base))
+
+    if metrics.changes is not None:
+        paths.append(metrics.changes.write(base + '_changes.json'))
+
+    return paths
+
+
+def write_html(reporter, metrics, path):
+    '''
+    Stream the HTML report to path
+    '''
+    with open(path + '.tmp', 'w') as writer:
+        reporter.renderSnapshot(metrics.snapshot, writer, metrics.counts, metrics.changes)
+    os.replace(path + '.tmp', path)
+
+    logger.info('HTML report stored at {}'.format(path))
+    return path
+
+
+def write_json(metrics, path):
+    '''
+    Write a JSON document with the figures and one list of records per DataFrame
+    '''
+    with open(path + '.tmp', 'w') as writer:
+        writer.write('{"figures": ')
+        json.dump(_json_figures(metrics.figures()), writer, default=_json_default, allow_nan=False)
+        for name, df in metrics.frames().items():
+            writer.write(', {}: '.format(json.dumps(name)))
+            df.to_json(writer, orient='records', date_format='iso')
+        writer.write('}\n')
+    os.replace(path + '.tmp', path)
+
+    logger.info('JSON export stored at {}'.format(path))
+    return path
+
+
+def write_csv(metrics, base):
+    '''
+    Write one CSV file per DataFrame, plus the figures, named <base>_<name>.csv
+    '''
+    import pandas as pd
+
+    paths = []
+    frames = metrics.frames()
+    frames['figures'] = pd.DataFrame([metrics.figures()])
+    for name, df in frames.items():
+        path = '{}_{}.csv'.format(base, name)
+        df.to_csv(path, index=False)
+        paths.append(path)
+
+    logger.info('CSV export stored at {}_*.csv'.format(base))
+    return paths
+
+
+def write_parquet(metrics, base):
+    '''
+    Write one Parquet file per DataFrame, plus the figures, named <base>_<name>.parquet.
+    Needs pyarrow or fastparquet.
+    '''
+    import pandas as pd
+
+    paths = []
+    frames = metrics.frames()
+    frames['figures'] = pd.DataFrame([metrics.figures()])
+    for name, df in frames.items():
+        path = '{}_{}.parquet'.format(base, name)
+        try:
+            df.reset_index(drop=True).to_parquet(path)
+        except ImportError as e:
+            raise ValueError('Parquet export needs pyarrow or fastparquet installed: {}'.format(e))
+        paths.append(path)
+
+    logger.info('Parquet export stored at {}_*.parquet'.format(base))
+    return paths
+
+
+def _json_figures(figures):
+    # missing figures, like the storage when its query failed, as null: NaN is not valid JSON
+    return OrderedDict((name, None if _is_nan(value) else value) for name, value in figures.items())
+
+
+def _is_nan(value):
+    try:
+        return bool(value != value)
+    except (TypeError, ValueError):
+        return False
+
+
+def _json_default(value):
+    # numpy scalars
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError('{!r} is not JSON serializable'.format(value))
@@ -0,0 +1,326 @@
+# -*- coding: UTF-8 -*-
+
+import argparse
+import datetime as dt
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+
+from carto_report.cli import get_log_level
+
+warnings.filterwarnings('ignore')
+
+### history database
+
+SCHEMA = '''
+    create table if not exists runs (
+        id integer primary key,
+        user text not null,
+        org text not null,
+        collected_at real not null,
+        storage_quota real,
+        storage_used real,
+        maps integer,
+        datasets integer,
+        tables integer,
+        analysis integer,
+        analysis_size real,
+        unique (user, org, collected_at)
+    );
+    create table if not exists services (
+        run_id integer not null,
+        service text not null,
+        provider text,
+        monthly_quota real,
+        used real,
+        primary key (run_id, service)
+    ) without rowid;
+    create table if not exists table_names (
+        id integer primary key,
+        user text not null,
+        org text not null,
+        schema text,
+        name text not null,
+        unique (user, org, schema, name)
+    );
+    create table if not exists table_sizes (
+        run_id integer not null,
+        table_id integer not null,
+        size integer,
+        primary key (run_id, table_id)
+    ) without rowid;
+    create index if not exists table_sizes_table on table_sizes (table_id, run_id);
+'''
+
+DATE_FORMAT = '%Y-%m-%d %H:%M'
+DAY = 24 * 3600
+
+
+class HistoryStore(object):
+    '''
+    Local SQLite store with a row per run (storage and counts), its LDS
+    services and the size of every table, indexed by user, table and time.
+    Tables names are stored once, sizes reference them by id.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.logger = logging.getLogger('carto_report')
+        self.logger.addHandler(logging.NullHandler())
+
+        with self.connect() as connection:
+            connection.execute('pragma journal_mode=wal')
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def connect(self):
+        '''
+        Method to open a connection, committed and closed on exit.
+        '''
+
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def append(self, metrics, collected_at=None):
+        '''
+        Method to append the storage, LDS and table sizes of a Metrics object.
+        Runs already stored (same user, org and collection time) are skipped.
+        Returns the run id, or None if it was already stored.
+        '''
+
+        user, org = metrics.user, metrics.org or ''
+        if collected_at is None:
+            collected_at = time.mktime(dt.datetime.strptime(metrics.date, DATE_FORMAT).timetuple())
+        summary = metrics.summary
+
+        with self.lock, self.connect() as connection:
+            cursor = connection.execute(
+                'insert or ignore into runs (user, org, collected_at, storage_quota, storage_used,'
+                ' maps, datasets, tables, analysis, analysis_size) values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (user, org, collected_at) + tuple(_value(summary.get(key)) for key in (
+                    'storage_quota', 'storage_used', 'maps', 'datasets', 'tables', 'analysis', 'analysis_size')))
+            if not cursor.rowcount:
+                self.logger.info('Run of {} at {} already in the history'.format(user, metrics.date))
+                return None
+            run_id = cursor.lastrowid
+
+            services = metrics.quota.drop('storage', errors='ignore')
+            connection.executemany(
+                'insert into services (run_id, service, provider, monthly_quota, used) values (?, ?, ?, ?, ?)',
+                [(run_id, str(service), row['Provider'], _value(row['Monthly Quota']), _value(row['Used']))
+                 for service, row in services.iterrows()])
+
+            tables = metrics.tables
+            schemas = tables['schema'] if 'schema' in tables.columns else [None] * len(tables)
+            names = list(zip([None if schema is None else str(schema) for schema in schemas], tables['name']))
+            connection.executemany(
+                'insert or ignore into table_names (user, org, schema, name) values (?, ?, ?, ?)',
+                [(user, org, schema, name) for schema, name in names])
+            ids = dict(((schema, name), table_id) for table_id, schema, name in connection.execute(
+                'select id, schema, name from table_names where user = ? and org = ?', (user, org)))
+            connection.executemany(
+                'insert or replace into table_sizes (run_id, table_id, size) values (?, ?, ?)',
+                [(run_id, ids[key], _value(size)) for key, size in zip(names, tables['size'])])
+
+        self.logger.info('Run of {} at {} appended to the history'.format(user, metrics.date))
+        return run_id
+
+    def runs(self, user, org=None, days=None):
+        '''
+        Method to get the runs of an account, optionally only the last days, as a df.
+        '''
+
+        import pandas as pd
+
+        with self.connect() as connection:
+            return pd.read_sql_query(
+                'select * from runs where user = ? and org = ? and collected_at >= ? order by collected_at',
+                connection, params=(user, org or '', self._since(days)))
+
+    def growth(self, user, org=None, days=30):
+        '''
+        Method to get the storage and tables growth of an account over the last days as a dict,
+        comparing its first and last runs in that window. Rates are per day.
+        '''
+
+        with self.connect() as connection:
+            first, last = self._window(connection, user, org, days)
+            if first is None:
+                return None
+
+            columns = ['id', 'collected_at', 'storage_used', 'tables']
+            first = dict(zip(columns, first))
+            last = dict(zip(columns, last))
+
+        elapsed = max(last['collected_at'] - first['collected_at'], 1) / float(DAY)
+        storage_delta = (last['storage_used'] or 0) - (first['storage_used'] or 0)
+
+        return {
+            'user': user,
+            'org': org,
+            'start': _date(first['collected_at']),
+            'end': _date(last['collected_at']),
+            'storage_start': first['storage_used'],
+            'storage_end': last['storage_used'],
+            'storage_delta': round(storage_delta, 2),
+            'storage_rate': round(storage_delta / elapsed, 2),
+            'tables_start': first['tables'],
+            'tables_end': last['tables'],
+            'tables_delta': (last['tables'] or 0) - (first['tables'] or 0)
+        }
+
+    def topGrowers(self, user, org=None, days=30, limit=10):
+        '''
+        Method to get the tables that grew the most over the last days as a df,
+        comparing their sizes in the first and last runs of the window.
+        '''
+
+        import pandas as pd
+
+        with self.connect() as connection:
+            first, last = self._window(connection, user, org, days)
+            if first is None:
+                return pd.DataFrame(columns=['schema', 'name', 'size_start', 'size_end', 'growth'])
+
+            return pd.read_sql_query(
+                'select n.schema, n.name, coalesce(a.size, 0) as size_start, b.size as size_end,'
+                ' b.size - coalesce(a.size, 0) as growth'
+                ' from table_sizes b'
+                ' join table_names n on n.id = b.table_id'
+                ' left join table_sizes a on a.run_id = ? and a.table_id = b.table_id'
+                ' where b.run_id = ?'
+                ' order by growth desc limit ?',
+                connection, params=(first[0], last[0], limit))
+
+    def tableSizes(self, user, name, org=None, schema=None, days=None):
+        '''
+        Method to get the size of a table in every run as a df.
+        '''
+
+        import pandas as pd
+
+        query = ('select r.collected_at, s.size from table_names n'
+                 ' join table_sizes s on s.table_id = n.id'
+                 ' join runs r on r.id = s.run_id'
+                 ' where n.user = ? and n.org = ? and n.name = ? and r.collected_at >= ?')
+        params = [user, org or '', name, self._since(days)]
+        if schema is not None:
+            query += ' and n.schema = ?'
+            params.append(schema)
+
+        with self.connect() as connection:
+            return pd.read_sql_query(query + ' order by r.collected_at', connection, params=params)
+
+    def _window(self, connection, user, org, days):
+        query = ('select id, collected_at, storage_used, tables from runs'
+                 ' where user = ? and org = ? and collected_at >= ? order by collected_at {} limit 1')
+        params = (user, org or '', self._since(days))
+        first = connection.execute(query.format('asc'), params).fetchone()
+        last = connection.execute(query.format('desc'), params).fetchone()
+        return first, last
+
+    def _since(self, days):
+        return 0 if days is None else time.time() - days * DAY
+
+
+def _value(value):
+    # numpy scalars and NaN to plain python values
+    if value is None:
+        return None
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def _date(timestamp):
+    return dt.datetime.fromtimestamp(timestamp).strftime(DATE_FORMAT)
+
+### command line
+
+def parse_arguments():
+    # set input arguments
+    parser = argparse.ArgumentParser(
+        description='CARTO reporting tool, storage and tables growth from the history')
+
+    parser.add_argument('history', type=str,
+                        help='History database, as written with --history')
+
+    parser.add_argument('--user-name', '-U', dest='CARTO_USER',
+                        default=os.getenv('CARTO_USER'),
+                        help='Account user name' +
+                        ' (defaults to env variable CARTO_USER)')
+
+    parser.add_argument('--organization', '-o', type=str, dest='CARTO_ORG',
+                        default=os.getenv('CARTO_ORG'),
+                        help='Set the name of the organization' +
+                        ' account (defaults to env variable CARTO_ORG)')
+
+    parser.add_argument('--days', '-d', type=float, dest='days',
+                        default=30,
+                        help='Window of the last days to compare, defaults to 30')
+
+    parser.add_argument('--top', '-t', type=int, dest='top',
+                        default=10,
+                        help='Number of top growing tables, defaults to 10')
+
+    parser.add_argument('--json', action='store_true', dest='json',
+                        help='Print the result as JSON')
+
+    parser.add_argument('--loglevel', '-l', type=str, dest='loglevel',
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        default='ERROR', help='How verbose the output should be, default to the most silent'
+                        )
+
+    return parser.parse_args()
+
+
+def main():
+    # Get configuration
+    args = parse_arguments()
+
+    # logger (better than print)
+    logging.basicConfig(
+        level=get_log_level(args.loglevel),
+        format=' %(asctime)s - %(name)-18s - %(levelname)-8s %(message)s',
+        datefmt='%I:%M:%S %p')
+    logger = logging.getLogger('carto_report_history')
+
+    if not args.CARTO_USER or not os.path.exists(args.history):
+        logger.error('You need to provide a user name and an existing history database')
+        sys.exit(1)
+
+    store = HistoryStore(args.history)
+    growth = store.growth(args.CARTO_USER, args.CARTO_ORG, args.days)
+    if growth is None:
+        logger.error('No runs of {} in the last {} days'.format(args.CARTO_USER, args.days))
+        sys.exit(1)
+    top_df = store.topGrowers(args.CARTO_USER, args.CARTO_ORG, args.days, args.top)
+
+    if args.json:
+        growth['top_growers'] = json.loads(top_df.to_json(orient='records'))
+        print(json.dumps(growth, indent=2))
+    else:
+        print('{user} from {start} to {end}'.format(**growth))
+        print('Storage: {storage_start} MB to {storage_end} MB, {storage_delta:+} MB'
+              ' ({storage_rate:+} MB/day)'.format(**growth))
+        print('Tables: {tables_start} to {tables_end}, {tables_delta:+}'.format(**growth))
+        print('')
+        print(top_df.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
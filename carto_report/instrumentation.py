@@ -0,0 +1,116 @@
+# -*- coding: UTF-8 -*-
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+### per-stage instrumentation
+
+COUNTERS = ['wall', 'cpu', 'requests', 'bytes', 'retries', 'rows']
+
+# instrumentation and stage of the running thread, shared by all the instances
+# so a single response hook serves every reporter using the same session
+_current = threading.local()
+
+
+class Instrumentation(object):
+    '''
+    Wall and CPU seconds, API requests, bytes received, retries and rows
+    returned by every stage of a run.
+
+    Stages are measured in the thread running them: the counters recorded
+    while a stage is active, also from the HTTP response hook installed with
+    instrument(session), are added to that stage.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = OrderedDict()
+        self.span = None
+
+    @contextmanager
+    def stage(self, name):
+        '''
+        Measure the code run in the block as stage name.
+        '''
+        previous = getattr(_current, 'stage', None)
+        _current.stage = (self, name)
+        start = time.time()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            end = time.time()
+            self.record(name, wall=end - start, cpu=time.thread_time() - cpu_start)
+            with self.lock:
+                self.span = (start, end) if self.span is None else (min(self.span[0], start), max(self.span[1], end))
+            _current.stage = previous
+
+    def record(self, name=None, **counters):
+        '''
+        Add counters to a stage, the one active in this thread by default.
+        '''
+        if name is None:
+            current = getattr(_current, 'stage', None)
+            if current is None or current[0] is not self:
+                return
+            name = current[1]
+
+        with self.lock:
+            stage = self.stages.setdefault(name, OrderedDict((counter, 0) for counter in COUNTERS))
+            for counter, value in counters.items():
+                stage[counter] += value
+
+    def asDict(self):
+        '''
+        Get the counters of every stage plus their total, wall and CPU seconds rounded to milliseconds.
+        As stages run concurrently the total wall time is the span from the first stage to the last one.
+        '''
+        with self.lock:
+            stages = OrderedDict((name, OrderedDict(stage)) for name, stage in self.stages.items())
+            span = self.span
+
+        total = OrderedDict((counter, 0) for counter in COUNTERS)
+        for stage in stages.values():
+            for counter in COUNTERS[1:]:
+                total[counter] += stage[counter]
+            for counter in ('wall', 'cpu'):
+                stage[counter] = round(stage[counter], 3)
+        total['wall'] = round(span[1] - span[0], 3) if span is not None else 0
+        total['cpu'] = round(total['cpu'], 3)
+
+        return OrderedDict([('stages', stages), ('total', total)])
+
+    def reset(self):
+        with self.lock:
+            self.stages = OrderedDict()
+            self.span = None
+
+
+def record(**counters):
+    '''
+    Add counters to the stage active in this thread, if any.
+    '''
+    current = getattr(_current, 'stage', None)
+    if current is not None:
+        current[0].record(current[1], **counters)
+
+
+def response_hook(response, *args, **kwargs):
+    '''
+    requests response hook counting every API request and the bytes received.
+    '''
+    length = response.headers.get('Content-Length')
+    record(requests=1, bytes=int(length) if length is not None else len(response.content))
+    return response
+
+
+def instrument(session):
+    '''
+    Install the response hook in a requests session, only once.
+    '''
+    hooks = session.hooks.setdefault('response', [])
+    if response_hook not in hooks:
+        hooks.append(response_hook)
+    return session
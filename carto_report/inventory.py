@@ -0,0 +1,80 @@
+# -*- coding: UTF-8 -*-
+
+import numpy as np
+import pandas as pd
+
+### typed columns of the tables inventory
+
+# columns not listed here, like the table names, are kept as they come. Counters and
+# sizes are integers, or floats while any of them is missing (like unmeasured sizes)
+INTEGER_COLUMNS = ['oid', 'relfilenode', 'index_count', 'index_relfilenodes']
+NUMBER_COLUMNS = ['n_tup_ins', 'n_tup_upd', 'n_tup_del', 'n_live_tup', 'n_dead_tup', 'estimated_rows',
+                  'size', 'table_size', 'indexes_size', 'toast_size']
+DATE_COLUMNS = ['last_vacuum', 'last_autovacuum', 'last_analyze', 'last_autoanalyze']
+CATEGORY_COLUMNS = ['schema']
+BOOLEAN_COLUMNS = ['approximate']
+
+
+def chunk_frame(rows, columns):
+    '''
+    Build a typed df from a chunk of row dicts, column by column, so the dicts can be freed
+    as soon as the chunk is converted. Numbers that may be missing (counters, sizes) are
+    floats until compacted, dates are UTC timestamps and flags booleans.
+    '''
+    data = {}
+    for column in columns:
+        values = [row.get(column) for row in rows]
+        if column in INTEGER_COLUMNS:
+            data[column] = np.array(values, dtype=np.int64)
+        elif column in NUMBER_COLUMNS:
+            data[column] = np.array(values, dtype=np.float64)
+        elif column in DATE_COLUMNS:
+            data[column] = pd.to_datetime(pd.Series(values, dtype=object), utc=True)
+        elif column in BOOLEAN_COLUMNS:
+            data[column] = np.array(values, dtype=bool)
+        else:
+            data[column] = pd.Series(values, dtype=object)
+
+    return pd.DataFrame(data, columns=columns)
+
+
+def concat(frames, columns):
+    '''
+    Concatenate the chunk dfs of an inventory in a single compacted df.
+    '''
+    if not frames:
+        frames = [chunk_frame([], columns)]
+
+    inventory_df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    return compact(inventory_df)
+
+
+def compact(inventory_df):
+    '''
+    Turn the numbers of an inventory with no missing values into integers and the schemas
+    into a category, in place.
+    '''
+    for column in NUMBER_COLUMNS:
+        if column in inventory_df.columns and not inventory_df[column].isnull().any():
+            inventory_df[column] = inventory_df[column].astype(np.int64)
+    for column in CATEGORY_COLUMNS:
+        if column in inventory_df.columns:
+            inventory_df[column] = inventory_df[column].astype('category')
+
+    return inventory_df
+
+
+def positions(values, index_values):
+    '''
+    Position in index_values of the first occurrence of every value, or -1, through a hash index.
+    '''
+    index_values = pd.Series(index_values)
+    first = np.flatnonzero(~index_values.duplicated().values)
+    found = pd.Index(index_values.values[first]).get_indexer(pd.Series(values).values)
+
+    matched = found >= 0
+    result = np.full(len(found), -1, dtype=np.int64)
+    result[matched] = first[found[matched]]
+
+    return result
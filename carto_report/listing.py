@@ -0,0 +1,76 @@
+# -*- coding: UTF-8 -*-
+
+import base64
+import gzip
+import json
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+### columns of every full listing embedded in the report
+
+LISTINGS = OrderedDict([
+    # cached analyses are the tables not registered as datasets, as in the report figures
+    ('tables', ['name', 'schema', 'size', 'table_size', 'indexes_size', 'toast_size', 'n_live_tup',
+                'n_dead_tup', 'cartodbfied', 'geom_type', 'type', 'approximate', 'last_autovacuum']),
+    ('maps', ['name', 'created', 'url'])
+])
+ENCODINGS = ['json', 'gzip']
+
+
+def encode_column(series):
+    '''
+    Encode a column as a JSON array and its kind: numbers and texts as they are, booleans as 0/1,
+    dates as seconds since the epoch and categories, or texts repeated in most rows, as codes
+    (-1 when missing) with their categories.
+    '''
+    if series.dtype == object and len(series) > 0 and series.nunique() * 2 < len(series):
+        series = series.astype('category')
+    if pd.api.types.is_bool_dtype(series):
+        return {'kind': 'bool'}, pd.Series(series.values.astype(np.int8)).to_json(orient='values')
+    if isinstance(series.dtype, pd.api.types.CategoricalDtype):
+        categories = [str(category) for category in series.cat.categories]
+        return ({'kind': 'category', 'categories': categories},
+                pd.Series(series.cat.codes.values).to_json(orient='values'))
+    if pd.api.types.is_datetime64_any_dtype(series):
+        seconds = pd.Series(series.values.astype('datetime64[s]').astype(np.int64).astype(np.float64))
+        seconds[series.isnull().values] = np.nan
+        return {'kind': 'date'}, seconds.to_json(orient='values', double_precision=0)
+    if pd.api.types.is_numeric_dtype(series):
+        return {'kind': 'number'}, series.reset_index(drop=True).to_json(orient='values')
+    return {'kind': 'text'}, series.reset_index(drop=True).astype(object).to_json(orient='values')
+
+
+def encode_frame(df, columns):
+    '''
+    Encode the columns of df found in columns as a compact column oriented JSON document.
+    '''
+    columns = [column for column in columns if column in df.columns]
+    meta = []
+    data = []
+    for column in columns:
+        kind, values = encode_column(df[column])
+        kind['name'] = column
+        meta.append(kind)
+        data.append(values)
+
+    return '{{"rows": {}, "columns": {}, "data": [{}]}}'.format(len(df), json.dumps(meta), ', '.join(data))
+
+
+def encode_listings(snapshot, encoding='gzip'):
+    '''
+    Encode the full listings of tables, with the cached analyses, and maps of a snapshot to be embedded in the
+    report: JSON safe to place in a script element, or that JSON gzipped and base64 encoded.
+    '''
+    if encoding not in ENCODINGS:
+        raise ValueError('Unknown listing encoding {}, use one of {}'.format(encoding, ', '.join(ENCODINGS)))
+
+    document = '{' + ', '.join('{}: {}'.format(json.dumps(name), encode_frame(snapshot[name], columns))
+                               for name, columns in LISTINGS.items()) + '}'
+    # < only appears inside JSON strings, escaped it can never close the script element
+    document = document.replace('<', '\\u003c')
+
+    if encoding == 'json':
+        return document
+    return base64.b64encode(gzip.compress(document.encode('utf-8'), 6)).decode('ascii')
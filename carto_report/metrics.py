@@ -0,0 +1,49 @@
+# -*- coding: UTF-8 -*-
+
+from collections import OrderedDict
+
+### collected metrics
+
+class Metrics(object):
+    '''
+    Everything a Reporter collects for an account: the snapshot DataFrames
+    (maps, datasets, tables, quota, analysis and analysis types), the
+    derived counts (sync, privacy and geometry) and the summary figures,
+    plus the changes since the previous snapshot when they were compared.
+    '''
+
+    FRAMES = ['maps', 'datasets', 'tables', 'quota', 'analysis', 'analysis_types']
+
+    def __init__(self, user, org, snapshot, counts, summary, changes=None):
+        self.user = user
+        self.org = org
+        self.date = snapshot['date']
+        self.snapshot = snapshot
+        self.counts = counts
+        self.summary = summary
+        self.changes = changes
+
+        self.maps = snapshot['maps']
+        self.datasets = snapshot['datasets']
+        self.tables = snapshot['tables']
+        self.quota = snapshot['quota']
+        self.analysis = snapshot['analysis']
+        self.analysis_types = snapshot['analysis_types']
+
+    def frames(self):
+        '''
+        Get the DataFrames by name, with their index as a regular column.
+        '''
+        frames = OrderedDict((name, getattr(self, name)) for name in self.FRAMES)
+        frames['quota'] = frames['quota'].reset_index()
+        frames['analysis_types'] = frames['analysis_types'].rename_axis('type').reset_index()
+        return frames
+
+    def figures(self):
+        '''
+        Get the summary and the counts as a single dict.
+        '''
+        figures = OrderedDict([('user', self.user), ('org', self.org), ('date', self.date)])
+        figures.update(self.summary)
+        figures.update(self.counts)
+        return figures
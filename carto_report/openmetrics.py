@@ -0,0 +1,216 @@
+# -*- coding: UTF-8 -*-
+
+import logging
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+### OpenMetrics exposition
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+DEFAULT_INTERVAL = 300
+MEGABYTE = 1000000
+
+logger = logging.getLogger('carto_report')
+logger.addHandler(logging.NullHandler())
+
+
+def format_metrics(metrics, table_sizes=False):
+    '''
+    Format a Metrics object as OpenMetrics metric families, returns a list of lines.
+    Storage is exposed in bytes, per-table sizes only with table_sizes.
+    '''
+    account = {'user': metrics.user, 'org': metrics.org or ''}
+    summary = metrics.summary
+    counts = metrics.counts
+
+    lines = []
+    lines += _family('carto_storage_used', 'gauge', 'Storage used by the account tables', [
+        (account, summary['storage_used'] * MEGABYTE)], unit='bytes')
+    lines += _family('carto_storage_quota', 'gauge', 'Storage quota of the account', [
+        (account, summary['storage_quota'] * MEGABYTE)], unit='bytes')
+
+    services = metrics.quota.drop('storage', errors='ignore')
+    lines += _family('carto_lds_used', 'gauge', 'Location Data Services used this month', [
+        (dict(account, service=str(service), provider=str(row['Provider'])), row['Used'])
+        for service, row in services.iterrows()])
+    lines += _family('carto_lds_quota', 'gauge', 'Location Data Services monthly quota', [
+        (dict(account, service=str(service), provider=str(row['Provider'])), row['Monthly Quota'])
+        for service, row in services.iterrows()])
+
+    lines += _family('carto_maps', 'gauge', 'Number of maps', [(account, summary['maps'])])
+    lines += _family('carto_datasets', 'gauge', 'Number of datasets by privacy', [
+        (dict(account, privacy=privacy), counts[privacy]) for privacy in ('private', 'link', 'public')])
+    lines += _family('carto_datasets_geometry', 'gauge', 'Number of datasets by geometry', [
+        (dict(account, geometry=geometry), counts[key])
+        for geometry, key in (('point', 'points'), ('line', 'lines'), ('polygon', 'polys'), ('none', 'none_tbls'))])
+    lines += _family('carto_datasets_sync', 'gauge', 'Number of sync datasets', [(account, counts['sync'])])
+
+    cartodbfied = int(metrics.tables['cartodbfied'].sum())
+    lines += _family('carto_tables', 'gauge', 'Number of tables by cartodbfication', [
+        (dict(account, cartodbfied='yes'), cartodbfied),
+        (dict(account, cartodbfied='no'), len(metrics.tables) - cartodbfied)])
+
+    lines += _family('carto_cached_analyses', 'gauge', 'Number of cached analysis tables by type', [
+        (dict(account, type=str(analysis_type)), count)
+        for analysis_type, count in metrics.analysis_types['Analysis Count'].items()])
+    lines += _family('carto_cached_analyses_size', 'gauge', 'Size of the cached analysis tables', [
+        (account, summary['analysis_size'])], unit='bytes')
+    lines += _family('carto_reclaimable', 'gauge', 'Estimated size taken by dead tuples', [
+        (account, summary.get('reclaimable', 0))], unit='bytes')
+
+    if table_sizes:
+        tables = metrics.tables
+        schemas = tables['schema'] if 'schema' in tables.columns else [''] * len(tables)
+        lines += _family('carto_table_size', 'gauge', 'Size of every table', [
+            (dict(account, schema=str(schema), table=str(name)), size)
+            for schema, name, size in zip(schemas, tables['name'], tables['size'])], unit='bytes')
+
+    return lines
+
+
+def _family(name, kind, description, samples, unit=None):
+    if unit is not None:
+        name = '{}_{}'.format(name, unit)
+    lines = ['# TYPE {} {}'.format(name, kind)]
+    if unit is not None:
+        lines.append('# UNIT {} {}'.format(name, unit))
+    lines.append('# HELP {} {}'.format(name, description))
+    suffix = '_total' if kind == 'counter' else ''
+    for labels, value in samples:
+        lines.append('{}{}{} {}'.format(name, suffix, _labels(labels), _number(value)))
+    return lines
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                          for key, value in sorted(labels.items())) + '}'
+
+
+def _number(value):
+    value = float(value)
+    if math.isnan(value):
+        return 'NaN'
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+### background exporter
+
+class MetricsExporter(object):
+    '''
+    Keeps the OpenMetrics exposition of a Reporter in memory, refreshed by a
+    background thread every interval seconds. Scrapes are answered from the
+    last successful collection and never wait for the CARTO APIs.
+    '''
+
+    def __init__(self, reporter, interval=DEFAULT_INTERVAL, table_sizes=False):
+        self.reporter = reporter
+        self.interval = interval
+        self.table_sizes = table_sizes
+
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+        self.lines = []
+        self.last_success = None
+        self.duration = None
+        self.refreshes = 0
+        self.errors = 0
+
+    def refresh(self):
+        '''
+        Method to collect the metrics again, keeping the previous ones if it fails.
+        '''
+
+        start = time.time()
+        try:
+            lines = format_metrics(self.reporter.collect(), self.table_sizes)
+        except Exception as e:
+            logger.error('Unable to refresh the metrics of {}: {}'.format(self.reporter.CARTO_USER, e))
+            with self.lock:
+                self.refreshes += 1
+                self.errors += 1
+            return False
+
+        with self.lock:
+            self.lines = lines
+            self.last_success = time.time()
+            self.duration = self.last_success - start
+            self.refreshes += 1
+        logger.info('Metrics of {} refreshed in {:.2f} seconds'.format(self.reporter.CARTO_USER, self.duration))
+        return True
+
+    def start(self):
+        '''
+        Method to start refreshing in a daemon thread, the first refresh starts right away.
+        '''
+
+        def loop():
+            while not self.stopped.is_set():
+                self.refresh()
+                self.stopped.wait(self.interval)
+
+        self.thread = threading.Thread(target=loop, name='carto_report_refresh')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def getPayload(self):
+        '''
+        Method to get the current exposition as UTF-8 bytes.
+        '''
+
+        with self.lock:
+            lines = list(self.lines)
+            lines += _family('carto_report_up', 'gauge', 'Whether the metrics were collected at least once', [
+                ({}, 1 if self.last_success is not None else 0)])
+            if self.last_success is not None:
+                lines += _family('carto_report_last_success', 'gauge', 'Time of the last successful collection', [
+                    ({}, self.last_success)], unit='seconds')
+                lines += _family('carto_report_refresh_duration', 'gauge', 'Duration of the last successful collection', [
+                    ({}, self.duration)], unit='seconds')
+            lines += _family('carto_report_refreshes', 'counter', 'Collections attempted', [({}, self.refreshes)])
+            lines += _family('carto_report_refresh_errors', 'counter', 'Collections failed', [({}, self.errors)])
+
+        lines.append('# EOF')
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def serve(exporter, port, bind='127.0.0.1'):
+    '''
+    Serve the exporter at http://bind:port/metrics until interrupted.
+    '''
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            payload = exporter.getPayload()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            logger.debug('%s - ' + format, self.address_string(), *args)
+
+    server = ThreadingHTTPServer((bind, port), Handler)
+    exporter.start()
+    logger.info('Serving metrics at http://{}:{}/metrics'.format(bind, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        exporter.stop()
+        server.server_close()
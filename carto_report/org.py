@@ -0,0 +1,123 @@
+# -*- coding: UTF-8 -*-
+
+import csv
+import logging
+import os
+from collections import OrderedDict
+
+from carto_report.classify import ANALYSIS_PREFIX
+
+### organization roll-up
+
+ROLLUP_COLUMNS = ['tables', 'size', 'table_size', 'indexes_size', 'toast_size',
+                  'analysis', 'analysis_size']
+TABLE_COLUMNS = ['oid', 'schema', 'owner', 'name', 'size', 'table_size', 'indexes_size', 'toast_size']
+
+logger = logging.getLogger('carto_report')
+logger.addHandler(logging.NullHandler())
+
+
+class OrgRollup(object):
+    '''
+    Per user (schema) and organization totals of a catalog scan, updated
+    chunk by chunk so the relations themselves never need to be kept.
+    '''
+
+    def __init__(self, org):
+        self.org = org
+        self.users = OrderedDict()
+        self.owners = {}
+
+    def add(self, rows):
+        '''
+        Method to add a chunk of relations to the roll-up.
+        '''
+
+        for row in rows:
+            user = self.users.get(row['schema'])
+            if user is None:
+                user = self.users[row['schema']] = OrderedDict((column, 0) for column in ROLLUP_COLUMNS)
+                self.owners[row['schema']] = row.get('owner')
+
+            size = row.get('size') or 0
+            user['tables'] += 1
+            for column in ROLLUP_COLUMNS[1:5]:
+                user[column] += row.get(column) or 0
+            if row['name'].startswith(ANALYSIS_PREFIX):
+                user['analysis'] += 1
+                user['analysis_size'] += size
+
+    def frame(self):
+        '''
+        Method to get the roll-up by user as a df, biggest first.
+        '''
+        import pandas as pd
+
+        users_df = pd.DataFrame.from_records(
+            [[self.org, user, self.owners[user]] + list(totals.values()) for user, totals in self.users.items()],
+            columns=['org', 'user', 'owner'] + ROLLUP_COLUMNS)
+
+        return users_df.sort_values('size', ascending=False).reset_index(drop=True)
+
+    def totals(self):
+        '''
+        Method to get the organization totals as a dict.
+        '''
+
+        totals = OrderedDict([('org', self.org), ('users', len(self.users))])
+        for column in ROLLUP_COLUMNS:
+            totals[column] = sum(user[column] for user in self.users.values())
+        return totals
+
+
+class TablesWriter(object):
+    '''
+    Streams every scanned relation to a CSV file, written to a temporary
+    file and moved to path when closed.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path + '.tmp', 'w', newline='')
+        self.writer = csv.DictWriter(self.file, TABLE_COLUMNS, extrasaction='ignore')
+        self.writer.writeheader()
+
+    def __call__(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self, complete=True):
+        '''
+        Method to close the file, moving it to path only when the scan is complete.
+        '''
+
+        self.file.close()
+        if complete:
+            os.replace(self.path + '.tmp', self.path)
+        else:
+            os.remove(self.path + '.tmp')
+
+
+def write_report(rollup, output):
+    '''
+    Write the organization roll-up as HTML at output and as CSV next to it, returns the written paths.
+    '''
+    import pandas as pd
+
+    base = os.path.splitext(output)[0]
+    users_df = rollup.frame()
+    totals_df = pd.DataFrame([rollup.totals()])
+
+    users_df.to_csv(base + '_users.csv', index=False)
+
+    with open(output + '.tmp', 'w') as writer:
+        writer.write('<!DOCTYPE html>\n<html lang="en">\n<head>\n<meta charset="UTF-8">\n')
+        writer.write('<title>CARTO Organization Metrics</title>\n</head>\n<body>\n')
+        writer.write('<h1>Organization {}</h1>\n'.format(rollup.org))
+        writer.write(totals_df.to_html(index=False))
+        writer.write('\n<h1>Users</h1>\n')
+        writer.write(users_df.to_html(index=False))
+        writer.write('\n</body>\n</html>\n')
+    os.replace(output + '.tmp', output)
+
+    logger.info('Organization report stored at {}'.format(output))
+    return [output, base + '_users.csv']
@@ -1,94 +1,559 @@
 # -*- coding: UTF-8 -*-
 
+import functools
+import io
 import logging
 import re
 import time
 import datetime as dt
 
 import pandas as pd
-from pandas.io.json import json_normalize
 import numpy as np
-import matplotlib.pyplot as plt
-
-import mpld3
-from mpld3 import fig_to_html
-
-from jinja2 import Environment, BaseLoader
 
 from carto.sql import SQLClient
 from carto.auth import APIKeyAuthClient, AuthAPIClient
-from carto.visualizations import VisualizationManager
-from carto.datasets import DatasetManager
 from carto.maps import NamedMapManager, NamedMap
 
+from carto_report import charts, classify, diff, inventory, listing, sections, templating, vizapi
+from carto_report.charts import PLOT_LOCK, get_pyplot
+from carto_report.instrumentation import Instrumentation, instrument, record
+from carto_report.metrics import Metrics
+from carto_report.sqlapi import DEFAULT_RETRIES, QueryBatch, QueryError, SQLScheduler, get_session
+from carto_report.stages import StageGraph
+
+### catalog queries
+
+SIZES_CHUNK_SIZE = 5000
+STAGE_WORKERS = 4
+STREAM_BUFFER = 5
+REPORT_TEMPLATE = 'report.html'
+
+SIZE_COLUMNS = ['size', 'table_size', 'indexes_size', 'toast_size']
+CHANGE_COLUMNS = ['relfilenode', 'index_count', 'index_relfilenodes', 'n_tup_ins', 'n_tup_upd', 'n_tup_del',
+                  'last_vacuum', 'last_autovacuum', 'last_analyze', 'last_autoanalyze']
+STATS_COLUMNS = ['n_live_tup', 'n_dead_tup']
+ESTIMATE_COLUMNS = ['estimated_rows', 'approximate']
+INVENTORY_COLUMNS = ['oid', 'name', 'schema'] + CHANGE_COLUMNS + STATS_COLUMNS + SIZE_COLUMNS + ESTIMATE_COLUMNS
+CLASSIFICATION_COLUMNS = ['geom_type', 'geocoded', 'cartodbfied', 'type']
+DATASET_COLUMNS = ['created', 'geom_type', 'geocoded', 'name', 'privacy', 'synchronization']
+
+SIZE_EXPRESSIONS = """
+        pg_total_relation_size(c.oid) as size,
+        pg_relation_size(c.oid) as table_size,
+        pg_indexes_size(c.oid) as indexes_size,
+        coalesce(pg_total_relation_size(nullif(c.reltoastrelid, 0)), 0) as toast_size"""
+
+# sizes estimated from the pages counted by the last vacuum or analyze, read from the catalog without
+# touching the relation files: the table, its indexes and its TOAST table with the TOAST index
+BLOCK_SIZE = "current_setting('block_size')::bigint"
+APPROXIMATE_TABLE_SIZE = "c.relpages::bigint * " + BLOCK_SIZE
+APPROXIMATE_INDEXES_SIZE = """coalesce((select sum(i.relpages) from pg_index x join pg_class i on i.oid = x.indexrelid
+            where x.indrelid = c.oid), 0)::bigint * """ + BLOCK_SIZE
+APPROXIMATE_TOAST_SIZE = """coalesce((select sum(t.relpages) from pg_class t where t.oid = c.reltoastrelid
+            or t.oid in (select x.indexrelid from pg_index x where x.indrelid = c.reltoastrelid)), 0)::bigint * """ + BLOCK_SIZE
+APPROXIMATE_SIZE = '(' + ' + '.join([APPROXIMATE_TABLE_SIZE, APPROXIMATE_INDEXES_SIZE, APPROXIMATE_TOAST_SIZE]) + ')'
+APPROXIMATE_SIZE_EXPRESSIONS = """
+        {} as size,
+        {} as table_size,
+        {} as indexes_size,
+        {} as toast_size""".format(APPROXIMATE_SIZE, APPROXIMATE_TABLE_SIZE, APPROXIMATE_INDEXES_SIZE, APPROXIMATE_TOAST_SIZE)
+
+# relfilenode, the pg_stat_user_tables counters and the indexes signature (their number and the sum of
+# their relfilenodes, changed by CREATE, DROP and REINDEX) tell whether a table changed since the last run
+INDEX_SIGNATURE = """
+        (select count(*) from pg_index x where x.indrelid = c.oid)::bigint as index_count,
+        coalesce((select sum(i.relfilenode::bigint) from pg_index x join pg_class i on i.oid = x.indexrelid
+            where x.indrelid = c.oid), 0)::bigint as index_relfilenodes,"""
+INVENTORY_QUERY = """
+    select c.oid::bigint as oid, c.relname as name, n.nspname as schema,
+        c.relfilenode::bigint as relfilenode,""" + INDEX_SIGNATURE + """
+        s.n_tup_ins, s.n_tup_upd, s.n_tup_del,
+        s.last_vacuum, s.last_autovacuum, s.last_analyze, s.last_autoanalyze,
+        s.n_live_tup, s.n_dead_tup,
+        nullif(c.reltuples::bigint, -1) as estimated_rows{sizes}
+    from pg_class c
+    join pg_namespace n on n.oid = c.relnamespace
+    join pg_roles r on r.oid = c.relowner
+    left join pg_stat_user_tables s on s.relid = c.oid
+    where r.rolname = current_user and c.relkind = 'r' and c.oid > {last_oid}
+    order by c.oid
+    limit {limit}
+"""
+
+# every relation of the organization schemas, for an organization admin key
+ORG_EXCLUDED_SCHEMAS = ['information_schema', 'cartodb', 'cdb_importer', 'topology']
+ORG_INVENTORY_QUERY = """
+    select c.oid::bigint as oid, c.relname as name, n.nspname as schema, r.rolname as owner,""" + SIZE_EXPRESSIONS + """
+    from pg_class c
+    join pg_namespace n on n.oid = c.relnamespace
+    join pg_roles r on r.oid = c.relowner
+    where c.relkind = 'r' and c.oid > {last_oid}
+        and n.nspname not like 'pg\\_%' and n.nspname not in ({excluded})
+    order by c.oid
+    limit {limit}
+"""
+
+SIZES_QUERY = "select c.oid::bigint as oid," + SIZE_EXPRESSIONS + " from pg_class c where c.oid in ({oids})"
+
+STORAGE_QUERY = """SELECT SUM(pg_total_relation_size(quote_ident(schemaname) || '.' || quote_ident(tablename)))/1000000 as total FROM pg_tables WHERE schemaname = '{user}'"""
+LDS_QUERY = 'SELECT * FROM cdb_service_quota_info()'
+APPROXIMATE_STORAGE_QUERY = """
+    select sum(""" + APPROXIMATE_SIZE + """)/1000000.0 as total
+    from pg_class c
+    join pg_namespace n on n.oid = c.relnamespace
+    where n.nspname = '{user}' and c.relkind = 'r'
+"""
+
+# reclaim opportunities: dead tuples ratio worth a VACUUM, like the autovacuum default scale factor,
+# and indexes bigger than this ratio of the heap (and than the minimum size) worth a REINDEX
+RECLAIM_TOP = 10
+VACUUM_DEAD_RATIO = 0.2
+REINDEX_RATIO = 2.0
+REINDEX_MIN_SIZE = 1000000
+RECLAIM_COLUMNS = ['table_size', 'indexes_size', 'toast_size', 'n_live_tup', 'n_dead_tup',
+                   'dead_pc', 'last_autovacuum', 'reclaimable', 'action']
+
 ### printer constructor
 
 class Reporter(object):
 
-    def __init__(self, CARTO_USER, CARTO_API_URL, CARTO_ORG, CARTO_API_KEY, USER_QUOTA):
+    def __init__(self, CARTO_USER, CARTO_API_URL, CARTO_ORG, CARTO_API_KEY, USER_QUOTA,
+                 chunk_size=SIZES_CHUNK_SIZE, concurrency=STAGE_WORKERS, session=None, store=None,
+                 incremental=False, template_dir=None, chart_backend=charts.DEFAULT_CHART_BACKEND,
+                 timings_footer=False, rate=None, retries=DEFAULT_RETRIES,
+                 page_size=vizapi.DEFAULT_PAGE_SIZE, approximate=False, exact_top=0,
+                 compare=False, top_changes=diff.DEFAULT_TOP, render_cache=None, full_inventory=None):
         self.CARTO_USER = CARTO_USER
         self.CARTO_ORG = CARTO_ORG
         self.USER_QUOTA = USER_QUOTA
-
-        ### CARTO clients
-        auth_client = APIKeyAuthClient(CARTO_API_URL, CARTO_API_KEY, CARTO_ORG)
-        self.sql = SQLClient(auth_client)
-        self.vm = VisualizationManager(auth_client)
-        self.dm = DatasetManager(auth_client)
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.store = store
+        self.incremental = incremental
+        self.template_dir = template_dir
+        self.chart_backend = chart_backend
+        self.timings_footer = timings_footer
+        self.page_size = page_size
+        self.approximate = approximate
+        self.exact_top = exact_top
+        self.compare = compare
+        self.top_changes = top_changes
+        self.render_cache = render_cache
+        self.full_inventory = full_inventory
+        self.summary = {}
+        self.instrumentation = Instrumentation()
+        self.batch = None
+
+        ### CARTO clients, not available when only rendering from snapshots
+        self.sql = self.auth_client = None
+        if CARTO_API_URL and CARTO_API_KEY:
+            if session is None:
+                session = get_session(concurrency)
+            auth_client = APIKeyAuthClient(CARTO_API_URL, CARTO_API_KEY, CARTO_ORG, session=session)
+            instrument(auth_client.session)
+            self.sql = SQLScheduler(SQLClient(auth_client), concurrency, rate, retries)
+            self.auth_client = auth_client
 
         ### logger, variables and CARTO clients
         self.logger = logging.getLogger('carto_report')
         self.logger.addHandler(logging.NullHandler())
 
-    def report(self):
+    def report(self, from_cache=False, max_age=None):
+        '''
+        Main method to get the full report.
+        With from_cache it is rendered from the latest stored snapshot without any API call,
+        with max_age a stored snapshot is reused if it is not older than max_age seconds.
+        '''
+
+        output = io.StringIO()
+        self.reportTo(output, from_cache, max_age)
+
+        return output.getvalue()
+
+    def reportTo(self, fp, from_cache=False, max_age=None):
         '''
-        Main method to get the full report
+        Method to write the full report to a file-like object section by section,
+        without holding the whole document in memory. Same options as report.
+        Returns the collected Metrics.
         '''
         start = time.time()
 
-        vizs = self.vm.all()
-        dsets = self.dm.all()
+        metrics = self.collect(from_cache, max_age)
+        self.renderSnapshot(metrics.snapshot, fp, metrics.counts, metrics.changes)
+
+        end = time.time()
+        duration = end - start
+
+        self.logger.info('Time: start at {}, end at {}, duration: {}'.format(start, end, duration))
+
+        self.summary['duration'] = round(duration, 2)
+
+        return metrics
+
+    def collect(self, from_cache=False, max_age=None):
+        '''
+        Method to collect all the metrics without rendering them, returns a Metrics object
+        that can be rendered as HTML or exported in several formats. Same options as report.
+        With compare, the changes since the previous stored snapshot are added.
+        '''
+
+        self.instrumentation.reset()
+        if self.sql is not None:
+            self.sql.reset()
+        snapshot = self.getSnapshot(from_cache, max_age)
+        self.summary = self.getSummary(snapshot)
+        self.summary['failures'] = len(self.failures)
+        for failure in self.failures:
+            self.logger.warning('Query failed: {}'.format(failure))
+
+        changes = self.getChanges(snapshot) if self.compare else None
+
+        return Metrics(self.CARTO_USER, self.CARTO_ORG, snapshot, self.getCounts(snapshot), dict(self.summary), changes)
+
+    def getChanges(self, snapshot):
+        '''
+        Method to compare a snapshot with the one stored before it, returns a SnapshotDiff
+        or None if there is no previous snapshot.
+        '''
+
+        previous = None if self.store is None else self.store.loadPrevious(self.CARTO_USER, self.CARTO_ORG)
+        if previous is None:
+            self.logger.info('No previous snapshot to compare with')
+            return None
+
+        self.logger.info('Comparing with the snapshot collected at {}'.format(previous['date']))
+        with self.instrumentation.stage('diff'):
+            return diff.SnapshotDiff(previous, snapshot, self.top_changes)
+
+    ### get collected data, from the snapshot store or the APIs
+
+    def getSnapshot(self, from_cache=False, max_age=None):
+        '''
+        Method to get a snapshot of the collected data, reusing a stored one when possible.
+        '''
+
+        if self.store is not None and (from_cache or max_age is not None):
+            snapshot = self.store.load(self.CARTO_USER, self.CARTO_ORG, max_age)
+            if snapshot is not None:
+                self.logger.info('Using snapshot collected at {}'.format(snapshot['date']))
+                return self.upgradeSnapshot(snapshot)
+
+        if from_cache:
+            raise ValueError('No stored snapshot for {} fresh enough to render the report'.format(self.CARTO_USER))
+
+        return self.collectSnapshot()
+
+    def upgradeSnapshot(self, snapshot):
+        '''
+        Method to convert a snapshot stored by previous versions, with Yes/No cartodbfied tables
+        and datasets with geometry lists, to the typed inventory model.
+        '''
+
+        tables_df = snapshot['tables']
+        if tables_df['cartodbfied'].dtype != bool:
+            tables_df['cartodbfied'] = (tables_df['cartodbfied'] == 'Yes').values
+        if 'geometry' in snapshot['datasets'].columns:
+            datasets_df = snapshot['datasets'][vizapi.DATASET_FIELDS]
+            snapshot['datasets'] = self.getDatasets(list(datasets_df.itertuples(index=False, name=None)))
+            tables_df.drop(['geometry', 'privacy', 'synchronization', 'created'], axis=1, errors='ignore', inplace=True)
+
+        return snapshot
+
+    def collectSnapshot(self):
+        '''
+        Method to collect all the report data from the APIs, storing it when there is a snapshot store.
+        '''
+
+        if self.sql is None:
+            raise ValueError('API URL and API key are needed to collect data for {}'.format(self.CARTO_USER))
+
         user = self.CARTO_USER
         org = self.CARTO_ORG
+
+        previous_df = self.getPreviousInventory() if self.incremental else None
+
+        #the cheap fixed queries of the storage and lds stages share a single request
+        self.batch = QueryBatch(self.sql)
+        for query in self.batchQueries(user):
+            self.batch.add(query)
+
+        #independent API calls, run concurrently
+        graph = StageGraph(self.concurrency, self.instrumentation)
+        graph.add('vizs', lambda: self.getAll(vizapi.MAP_PARAMS, vizapi.project_map))
+        graph.add('dsets', lambda: self.getAll(vizapi.DATASET_PARAMS, vizapi.project_dataset))
+        graph.add('inventory', lambda: self.getInventory(previous_df))
+        graph.add('storage', lambda: self.getStorage(user))
+        graph.add('lds', self.getLDS)
+        try:
+            results = graph.run()
+        finally:
+            self.batch = None
+
+        with self.instrumentation.stage('process'):
+            snapshot = self.processResults(results)
+
+        if self.store is not None:
+            self.store.save(user, org, snapshot)
+
+        return snapshot
+
+    def batchQueries(self, user):
+        '''
+        Method to get the cheap fixed queries sent as a single request: the LDS quotas and the
+        catalog storage estimate. The exact storage sum and the sized inventory scan keep their own
+        requests and statement timeouts, running concurrently in their stages.
+        '''
+
+        queries = [LDS_QUERY]
+        if self.approximate:
+            queries.append(self.storageQuery(user))
+        return queries
+
+    def processResults(self, results):
+        '''
+        Method to build a snapshot from the results of the collection stages.
+        '''
+
+        user = self.CARTO_USER
         quota = self.USER_QUOTA
 
+        #date
+        today = self.getDate()
+
         #maps
-        maps_df = self.getMaps(vizs)
-        top_5_maps_date = self.getTop5(maps_df, 'created', 'name')
+        maps_df = self.getMaps(results['vizs'])
 
         #datasets
-        dsets_df = self.getDatasets(dsets)
-        top_5_dsets_date = self.getTop5(dsets_df, 'created', 'name')
-        sync =  self.getSync(dsets_df)
-        (private, link, public) = self.getPrivacy(dsets_df)
-        (points, lines, polys, none_tbls, geo) = self.getGeometry(dsets_df)
-        all_tables_df = self.getSizes(dsets_df)
-        tables_sizes = all_tables_df.loc[all_tables_df['cartodbfied'] == 'Yes']
-        top_5_dsets_size = self.getTop5(all_tables_df, 'size', 'name')
+        dsets_df = self.getDatasets(results['dsets'])
+        all_tables_df = self.getSizes(dsets_df, results['inventory'])
 
         #lds
-        (lds_df) = self.getQuota(user, quota)
+        (lds_df) = self.getQuota(user, quota, results['storage'], results['lds'])
 
         #analysis
         (analysis_df, analysis_types_df) = self.getCachedAnalysisNames(all_tables_df)
 
-        #plots
-        fig_analysis = self.plotAnalysis(analysis_types_df)
-        fig_lds = self.plotQuota(lds_df)
+        snapshot = {
+            'date': today,
+            'maps': maps_df,
+            'datasets': dsets_df,
+            'tables': all_tables_df,
+            'quota': lds_df,
+            'analysis': analysis_df,
+            'analysis_types': analysis_types_df
+        }
 
-        #date
-        today = self.getDate()
+        return snapshot
 
-        #report
-        report = self.generateReport(user, org, today, lds_df, maps_df, top_5_maps_date, analysis_types_df, analysis_df, dsets_df, tables_sizes, top_5_dsets_date, top_5_dsets_size, sync, private, link, public, geo, none_tbls, points, lines, polys,fig_analysis,fig_lds)
+    def getAll(self, params, project):
+        '''
+        Method to get all the maps or datasets page by page, keeping only the fields
+        returned by project for every item as it arrives. Counted as rows of the current stage.
+        '''
 
-        end = time.time()
-        duration = end - start
+        records = [project(item) for item in vizapi.iter_items(self.auth_client, params, self.page_size, self.sql)]
+        record(rows=len(records))
 
-        self.logger.info('Time: start at {}, end at {}, duration: {}'.format(start, end, duration))
+        return records
+
+    def query(self, sql):
+        '''
+        Method to run a query with the SQL API and get its rows, counted in the current stage.
+        Queries registered in the current batch are answered from it.
+        '''
+
+        batch = self.batch
+        if batch is not None and batch.pending(sql):
+            rows = batch.result(sql)
+        else:
+            rows = self.sql.send(sql)['rows']
+        record(rows=len(rows))
+
+        return rows
+
+    @property
+    def failures(self):
+        '''
+        Queries of the last run that failed after all the retries, as QueryError.
+        '''
+        return [] if self.sql is None else list(self.sql.failures)
+
+    @property
+    def timings(self):
+        '''
+        Wall and CPU seconds, API requests, bytes, retries and rows of every stage of the last run.
+        '''
+        return self.instrumentation.asDict()
+
+    ### render a snapshot as HTML
+
+    def renderSnapshot(self, snapshot, fp=None, counts=None, changes=None):
+        '''
+        Method to render the HTML report from a snapshot of the collected data, with a section
+        for the changes (a SnapshotDiff) if given. It is returned as a string, or streamed to fp if given.
+        '''
+
+        user = self.CARTO_USER
+        org = self.CARTO_ORG
+        today = snapshot['date']
+        lds_df = snapshot['quota']
+        analysis_df = snapshot['analysis']
+        analysis_types_df = snapshot['analysis_types']
+
+        #maps
+        maps_df = snapshot['maps']
+        top_5_maps_date = self.getTop5(maps_df, 'created', 'name')
+
+        #datasets
+        dsets_df = snapshot['datasets']
+        top_5_dsets_date = self.getTop5(dsets_df, 'created', 'name')
+        if counts is None:
+            counts = self.getCounts(snapshot)
+        all_tables_df = snapshot['tables']
+        tables_sizes = all_tables_df.loc[all_tables_df['cartodbfied']]
+        top_5_dsets_size = self.getTop5(all_tables_df, 'size', 'name')
+        approximate = self.isApproximate(all_tables_df)
+        reclaim_df = self.getReclaim(all_tables_df)
+        reclaimable = self.getReclaimable(all_tables_df).sum()
+        listings = self.getListings(snapshot)
+
+        #plots
+        with self.instrumentation.stage('charts'):
+            (html_fig_analysis, html_fig_lds) = self.getCharts(analysis_types_df, lds_df)
+
+        #report
+        with self.instrumentation.stage('render'):
+            report = self.generateReport(user, org, today, lds_df, maps_df, top_5_maps_date, analysis_types_df, analysis_df, dsets_df, tables_sizes, top_5_dsets_date, top_5_dsets_size, counts['sync'], counts['private'], counts['link'], counts['public'], counts['geo'], counts['none_tbls'], counts['points'], counts['lines'], counts['polys'], html_fig_analysis, html_fig_lds, fp, approximate, changes, reclaim_df, reclaimable, listings)
 
         return report
 
+    def getListings(self, snapshot):
+        '''
+        Method to encode the full listings of tables and maps of a snapshot to embed them in the report,
+        as JSON or gzipped JSON depending on full_inventory. None if they are not embedded.
+        '''
+
+        if self.full_inventory is None:
+            return None
+
+        def encode():
+            with self.instrumentation.stage('listings'):
+                return listing.encode_listings(snapshot, self.full_inventory)
+
+        if self.render_cache is None:
+            data = encode()
+        else:
+            key = sections.digest(self.full_inventory, [snapshot[name] for name in listing.LISTINGS])
+            data = self.render_cache.get('listings', key, encode)
+
+        return {'encoding': self.full_inventory, 'data': data}
+
+    ### helper - get counts
+
+    def getCounts(self, snapshot):
+        '''
+        Method to get the sync, privacy and geometry counts of the datasets of a snapshot as a dict.
+        '''
+
+        dsets_df = snapshot['datasets']
+        sync = self.getSync(dsets_df)
+        (private, link, public) = self.getPrivacy(dsets_df)
+        (points, lines, polys, none_tbls, geo) = self.getGeometry(dsets_df)
+
+        return {
+            'sync': sync,
+            'private': private,
+            'link': link,
+            'public': public,
+            'geo': geo,
+            'none_tbls': none_tbls,
+            'points': points,
+            'lines': lines,
+            'polys': polys
+        }
+
+    ### helper - get summary
+
+    def getSummary(self, snapshot):
+        '''
+        Method to get the main figures of a snapshot as a dict.
+        '''
+
+        lds_df = snapshot['quota']
+        analysis_df = snapshot['analysis']
+
+        return {
+            'user': self.CARTO_USER,
+            'org': self.CARTO_ORG,
+            'date': snapshot['date'],
+            'maps': len(snapshot['maps']),
+            'datasets': len(snapshot['datasets']),
+            'tables': len(snapshot['tables']),
+            'analysis': len(analysis_df),
+            'analysis_size': analysis_df['size'].sum(),
+            'storage_quota': lds_df.loc['storage', 'Monthly Quota'],
+            'storage_used': lds_df.loc['storage', 'Used'],
+            'approximate': self.isApproximate(snapshot['tables']),
+            'reclaimable': self.getReclaimable(snapshot['tables']).sum()
+        }
+
+    ### helper - reclaim opportunities
+
+    def getReclaimable(self, tables_df):
+        '''
+        Method to estimate the bytes of every table taken by dead tuples, that a VACUUM FULL would give back:
+        the heap and indexes sizes times the ratio of dead tuples. Empty for inventories without tuple counts.
+        '''
+        if not set(STATS_COLUMNS).issubset(tables_df.columns):
+            return pd.Series(dtype=float)
+
+        live = tables_df['n_live_tup'].fillna(0).astype(float)
+        dead = tables_df['n_dead_tup'].fillna(0).astype(float)
+        dead_ratio = (dead / (live + dead)).fillna(0)
+
+        return ((tables_df['table_size'].fillna(0) + tables_df['indexes_size'].fillna(0)) * dead_ratio).round()
+
+    def getReclaim(self, tables_df, top=RECLAIM_TOP):
+        '''
+        Method to get the tables with the most reclaimable bytes as df, with their heap, indexes
+        and TOAST sizes, tuple counts, last autovacuum and the suggested VACUUM or REINDEX.
+        Tables with nothing to reclaim but oversized indexes follow the ones with dead tuples.
+        '''
+        reclaimable = self.getReclaimable(tables_df)
+        if reclaimable.empty:
+            return pd.DataFrame(columns=RECLAIM_COLUMNS)
+
+        live = tables_df['n_live_tup'].fillna(0)
+        dead = tables_df['n_dead_tup'].fillna(0)
+        dead_pc = (dead * 100.0 / (live + dead)).fillna(0).round(2)
+        vacuum = dead_pc >= VACUUM_DEAD_RATIO * 100
+        reindex = (tables_df['indexes_size'] > REINDEX_RATIO * tables_df['table_size']) & \
+            (tables_df['indexes_size'] >= REINDEX_MIN_SIZE)
+        excess = (tables_df['indexes_size'] - REINDEX_RATIO * tables_df['table_size']).where(reindex, 0)
+
+        candidates = (vacuum & (reclaimable > 0)) | reindex
+        reclaim_df = tables_df.loc[candidates, ['name'] + RECLAIM_COLUMNS[:5] + ['last_autovacuum']].copy()
+        reclaim_df['dead_pc'] = dead_pc[candidates]
+        reclaim_df['reclaimable'] = reclaimable[candidates].astype('int64')
+        reclaim_df['last_autovacuum'] = reclaim_df['last_autovacuum'].fillna('never')
+        reclaim_df['action'] = np.where(vacuum[candidates] & reindex[candidates], 'VACUUM, REINDEX',
+                                        np.where(vacuum[candidates], 'VACUUM', 'REINDEX'))
+        reclaim_df['excess'] = excess[candidates]
+
+        reclaim_df = reclaim_df.sort_values(['reclaimable', 'excess'], ascending=False).head(top)
+
+        return reclaim_df.set_index('name')[RECLAIM_COLUMNS]
+
+    ### helper - approximate sizes
+
+    def isApproximate(self, tables_df):
+        '''
+        Method to know whether the sizes of a tables df, and so the storage, were estimated from the catalog.
+        '''
+        if 'approximate' not in tables_df.columns:
+            return False
+        return bool(tables_df['approximate'].fillna(False).astype(bool).any())
+
     ### helper - get date
     def getDate(self):
         '''
@@ -102,23 +567,18 @@ class Reporter(object):
 
     def getMaps(self, vizs):
         '''
-        Method to get a df with the list of maps with names, urls and date of creation.
+        Method to get a df with the list of maps with names, urls and date of creation,
+        from the map records projected by vizapi.project_map, latest updated first.
         '''
 
         self.logger.info('Getting all maps data...')
 
-        # helper - get key
-        def getKey(obj):
-            return obj.updated_at
-
-        maps = [{
-            'name': viz.name, 
-            'created': viz.created_at, 
-            'url': viz.url
-        } for viz in sorted(vizs, key=getKey, reverse=True)]
+        maps_df = pd.DataFrame.from_records(vizs, columns=vizapi.MAP_FIELDS)
+        maps_df['created'] = pd.to_datetime(maps_df['created'], utc=True)
+        maps_df['updated'] = pd.to_datetime(maps_df['updated'], utc=True)
+        maps_df = maps_df.sort_values('updated', ascending=False, kind='mergesort')
+        maps_df = maps_df[['created', 'name', 'url']].reset_index(drop=True)
 
-        maps_df = json_normalize(maps)
-        
         self.logger.info('Retrieved {} maps'.format(len(maps_df)))
 
         return maps_df
@@ -127,20 +587,20 @@ class Reporter(object):
 
     def getDatasets(self, dsets):
         '''
-        Method to get a df with the list of dsets with names, privacy, sync, geometry and date of creation.
+        Method to get a df with the list of dsets with names, privacy, sync, geometry and date of creation,
+        from the dataset records projected by vizapi.project_dataset. The geometry types lists are
+        classified once as a geom_type category, with a geocoded flag.
         '''
 
         self.logger.info('Getting all datasets data...')
 
-        tables = [{
-            'name': table.name, 
-            'privacy' : table.privacy,
-            'created': table.created_at, 
-            'synchronization': table.synchronization.updated_at,
-            'geometry': table.table.geometry_types
-        } for table in dsets]
-        
-        tables_df = json_normalize(tables)
+        tables_df = pd.DataFrame.from_records(dsets, columns=vizapi.DATASET_FIELDS)
+        tables_df['created'] = pd.to_datetime(tables_df['created'], utc=True)
+        tables_df['synchronization'] = pd.to_datetime(tables_df['synchronization'], utc=True)
+        tables_df['privacy'] = tables_df['privacy'].astype('category')
+        tables_df['geom_type'] = classify.geometry_class(tables_df['geometry'])
+        tables_df['geocoded'] = tables_df['geom_type'].notnull()
+        tables_df = tables_df[DATASET_COLUMNS]
 
         self.logger.info('Retrieved {} datasets'.format(len(tables_df)))
 
@@ -154,8 +614,7 @@ class Reporter(object):
         self.logger.info('Getting privacy and sync information...')
 
         try:
-            tables_df.synchronization = tables_df.synchronization.fillna('None Sync')
-            sync = len(dsets) - len(tables_df.loc[tables_df['synchronization'] == 'None Sync'])
+            sync = int(tables_df['synchronization'].notnull().sum())
             self.logger.info('{} sync tables'.format(sync))
         except:
             self.logger.info('Sync tables unable to be retrieved.')
@@ -173,9 +632,10 @@ class Reporter(object):
 
         self.logger.info('Getting privacy information...')
 
-        private = len(tables_df.loc[tables_df['privacy'] == 'PRIVATE'])
-        link = len(tables_df.loc[tables_df['privacy'] == 'LINK'])
-        public = len(tables_df.loc[tables_df['privacy'] == 'PUBLIC'])
+        privacy = tables_df['privacy'].value_counts()
+        private = int(privacy.get('PRIVATE', 0))
+        link = int(privacy.get('LINK', 0))
+        public = int(privacy.get('PUBLIC', 0))
         
         self.logger.info('{} private tables, {} tables shared with link and {} public tables'.format(private, link, public))
 
@@ -189,21 +649,13 @@ class Reporter(object):
         '''
 
         self.logger.info('Getting geometry information...')
-        
-        tables_df['geom_type'] = tables_df.geometry.str[0]
-
-        tables_df['geocoded'] = False
-        for i in range(len(tables_df)):
-            if tables_df.geom_type[i] in ('ST_Point', 'ST_MultiPolygon', 'ST_Polygon', 'ST_MultiLineString', 'ST_LineString'):
-                tables_df['geocoded'][i] = True
-            else:
-                tables_df['geocoded'][i] = False
 
-        none_tbls = len(tables_df.loc[tables_df['geocoded'] == False])
-        geo = len(tables_df.loc[tables_df['geocoded'] == True])
-        polys = len(tables_df.loc[tables_df['geom_type'].isin(['ST_MultiPolygon', 'Polygon'])])
-        lines = len(tables_df.loc[tables_df['geom_type'].isin(['ST_LineString', 'MultiLineString'])])
-        points = len(tables_df.loc[tables_df['geom_type'].isin(['ST_Point'])])
+        geom_types = tables_df['geom_type'].value_counts()
+        geo = int(tables_df['geocoded'].sum())
+        none_tbls = len(tables_df) - geo
+        polys = int(geom_types['polygon'])
+        lines = int(geom_types['line'])
+        points = int(geom_types['point'])
 
         self.logger.info('{} non-geocoded datasets retrieved'.format(none_tbls)) 
         self.logger.info('{} geocoded datasets'.format(geo))
@@ -228,19 +680,19 @@ class Reporter(object):
 
     ### get quota information
 
-    def getQuota(self, user, quota):
+    def getQuota(self, user, quota, dsets_size=None, lds=None):
         '''
         Method to get storage quota and LDS (geocoding, routing, isolines) information as df.
+        Already retrieved storage size and LDS info can be passed to avoid querying them again.
         '''
 
         self.logger.info('Getting storage quota and geocoding, routing and isolines quota information...')
 
-        dsets_size = pd.DataFrame(self.sql.send(
-            "SELECT SUM(pg_total_relation_size(quote_ident(schemaname) || '.' || quote_ident(tablename)))/1000000 as total FROM pg_tables WHERE schemaname = '" + user + "'")['rows'])['total'][0]
-        self.logger.info('Retrieved {} MB as storage quota'.format(dsets_size))
+        if dsets_size is None:
+            dsets_size = self.getStorage(user)
 
-        lds = pd.DataFrame(self.sql.send('SELECT * FROM cdb_service_quota_info()')['rows'])
-        self.logger.info('Retrieved {} Location Data Services'.format(len(lds)))
+        if lds is None:
+            lds = self.getLDS()
 
         lds = lds[0:3] #leave DO out
         lds['pc_used'] = round(lds['used_quota']*100.00/lds['monthly_quota'],2)
@@ -259,45 +711,278 @@ class Reporter(object):
 
         return lds_df
 
+    def getStorage(self, user):
+        '''
+        Method to get the storage used by the user tables in MB, estimated from the catalog when approximate.
+        '''
+
+        try:
+            dsets_size = pd.DataFrame(self.query(self.storageQuery(user)))['total'][0]
+        except QueryError as e:
+            self.logger.error('Unable to get the storage: {}'.format(e))
+            return np.nan
+        self.logger.info('Retrieved {} MB as storage quota'.format(dsets_size))
+
+        return dsets_size
+
+    def storageQuery(self, user):
+        '''
+        Method to get the query of the storage used by the user tables.
+        '''
+
+        query = APPROXIMATE_STORAGE_QUERY if self.approximate else STORAGE_QUERY
+        return query.format(user=user)
+
+    def getLDS(self):
+        '''
+        Method to get the raw Location Data Services quota information as df.
+        '''
+
+        try:
+            lds = pd.DataFrame(self.query(LDS_QUERY))
+        except QueryError as e:
+            self.logger.error('Unable to get the Location Data Services: {}'.format(e))
+            lds = pd.DataFrame(columns=['monthly_quota', 'provider', 'service', 'soft_limit', 'used_quota'])
+        self.logger.info('Retrieved {} Location Data Services'.format(len(lds)))
+
+        return lds
+
     ### get analysis and tables data
 
-    def getSizes(self, dsets_df):
+    def getSizes(self, dsets_df, inventory_df=None):
         '''
         Method to get all tables sizes, know cartodbfied and non cartodbfied tables (analysis).
+        An already retrieved inventory can be passed to avoid querying it again. Tables are
+        classified in place, joined with the datasets by name, without copying the datasets columns.
         '''
         
-        self.logger.info('Getting list of tables...')
-        
-        all_tables = self.sql.send(
-                    "select pg_class.relname as name from pg_class, pg_roles, pg_namespace" +
-                    " where pg_roles.oid = pg_class.relowner and " +
-                    "pg_roles.rolname = current_user " +
-                    "and pg_namespace.oid = pg_class.relnamespace and pg_class.relkind = 'r'")['rows']
-
-        all_tables_df = json_normalize(all_tables)
+        self.logger.info('Getting list of tables and sizes...')
         
+        if inventory_df is None:
+            all_tables_df = self.getInventory()
+        else:
+            all_tables_df = inventory_df
         
         self.logger.info('Retrieved {} tables.'.format(len(all_tables_df)))
         
-        dsets_df['cartodbfied'] = 'Yes'
-        all_tables_df = all_tables_df.merge(dsets_df, on='name', how='left')
-        all_tables_df['cartodbfied'] = all_tables_df['cartodbfied'].fillna('No')
-        all_tables_df['size'] = 0
-        
-        self.logger.info('Getting table sizes...')
-        
-        for index, row in all_tables_df.iterrows():
-            try:
-                size = self.sql.send("select pg_total_relation_size('" + row['name'] + "') as size")['rows'][0].get('size')
-            except:
-                self.logger.warning('Error at: ' + str(row['name']))
-            
-            all_tables_df.set_value(index,'size',size)
+        classified_df = classify.classify(all_tables_df['name'], dsets_df['name'], dsets_df['geom_type'])
+        for column in CLASSIFICATION_COLUMNS:
+            all_tables_df[column] = classified_df[column]
             
         self.logger.info('Table sizes retrieved with a sum of {} MB'.format(all_tables_df['size'].sum()))
             
         return all_tables_df
 
+    ### get tables inventory
+
+    def getInventory(self, previous_df=None):
+        '''
+        Method to get name, schema and size (total, table, indexes and TOAST) of all the user tables
+        using set-based queries over the catalog, chunked by oid.
+        With a previous inventory only new or changed tables are measured again.
+        When approximate, sizes are estimated from the catalog, which is cheap enough to do
+        for every table on every run, and only the exact_top largest tables are measured.
+        '''
+
+        if self.approximate:
+            inventory_df = self.measureLargest(self.listTables(sizes=True), self.exact_top)
+        elif previous_df is None:
+            inventory_df = self.listTables(sizes=True)
+        else:
+            inventory_df = self.refreshSizes(self.listTables(sizes=False), previous_df)
+
+        # tables that could not be measured keep null sizes instead of pretending to be empty
+        for name in inventory_df['name'].values[inventory_df['size'].isnull().values]:
+            self.logger.warning('Error at: ' + str(name))
+
+        return inventory_df
+
+    def listTables(self, sizes=True):
+        '''
+        Method to list all the user tables in chunks, optionally with their sizes, estimated when approximate.
+        Every chunk is converted to a typed df as it arrives, so its row dicts are freed right away.
+        '''
+
+        frames = []
+        listed = 0
+        last_oid = 0
+
+        while True:
+            approximate = self.approximate and sizes
+            if sizes:
+                try:
+                    chunk = self.query(self.inventoryQuery(last_oid))
+                except QueryError as e:
+                    self.logger.warning('Bulk size query failed after oid {}: {}'.format(last_oid, e))
+                    chunk = self.measureSizes(self.query(self.inventoryQuery(last_oid, sizes=False)), bulk=False)
+                    approximate = False
+            else:
+                chunk = self.query(self.inventoryQuery(last_oid, sizes=False))
+
+            for row in chunk:
+                row.setdefault('approximate', approximate)
+            frames.append(inventory.chunk_frame(chunk, INVENTORY_COLUMNS))
+            listed += len(chunk)
+            self.logger.debug('Retrieved {} tables so far...'.format(listed))
+
+            if len(chunk) < self.chunk_size:
+                break
+            last_oid = chunk[-1]['oid']
+
+        return inventory.concat(frames, INVENTORY_COLUMNS)
+
+    def inventoryQuery(self, last_oid, sizes=True):
+        '''
+        Method to get the query listing the chunk of user tables after last_oid,
+        optionally with their sizes, estimated when approximate.
+        '''
+
+        if not sizes:
+            expressions = ''
+        elif self.approximate:
+            expressions = ',' + APPROXIMATE_SIZE_EXPRESSIONS
+        else:
+            expressions = ',' + SIZE_EXPRESSIONS
+
+        return INVENTORY_QUERY.format(sizes=expressions, last_oid=last_oid, limit=self.chunk_size)
+
+    def getOrgInventory(self, writer=None):
+        '''
+        Method to scan the relations of every user of the organization in chunks, with an
+        organization admin key, rolling up their sizes by user as every chunk arrives.
+        Chunks are passed to writer, when given, and not kept.
+        '''
+        from carto_report.org import OrgRollup
+
+        rollup = OrgRollup(self.CARTO_ORG)
+        excluded = ', '.join("'{}'".format(schema) for schema in ORG_EXCLUDED_SCHEMAS)
+        last_oid = 0
+        scanned = 0
+
+        self.instrumentation.reset()
+        with self.instrumentation.stage('org_inventory'):
+            while True:
+                chunk = self.query(ORG_INVENTORY_QUERY.format(
+                    last_oid=last_oid, excluded=excluded, limit=self.chunk_size))
+                rollup.add(chunk)
+                if writer is not None:
+                    writer(chunk)
+
+                scanned += len(chunk)
+                self.logger.debug('Scanned {} organization tables so far...'.format(scanned))
+
+                if len(chunk) < self.chunk_size:
+                    break
+                last_oid = chunk[-1]['oid']
+
+        return rollup
+
+    def refreshSizes(self, inventory_df, previous_df):
+        '''
+        Method to carry forward the sizes of the tables unchanged since the previous inventory
+        and measure only the new or changed ones. Tables are matched by oid through a hash index.
+        '''
+
+        matches = inventory.positions(inventory_df['oid'], previous_df['oid'])
+        found = matches >= 0
+        previous = matches[found]
+
+        unchanged = found.copy()
+        unchanged[found] = (previous_df['size'].values[previous] > 0) & ~previous_df['approximate'].values[previous].astype(bool)
+        for column in CHANGE_COLUMNS:
+            values = inventory_df[column].values[found]
+            previous_values = previous_df[column].values[previous]
+            unchanged[found] &= (values == previous_values) | (pd.isnull(values) & pd.isnull(previous_values))
+
+        kept = unchanged[found]
+        for column in SIZE_COLUMNS:
+            sizes = inventory_df[column].values.astype(np.float64)
+            sizes[np.flatnonzero(found)[kept]] = previous_df[column].values[previous[kept]]
+            inventory_df[column] = sizes
+
+        changed = np.flatnonzero(~unchanged)
+        self.logger.info('Measuring {} new or changed tables out of {}'.format(len(changed), len(inventory_df)))
+
+        return self.measureRows(inventory_df, changed)
+
+    def measureLargest(self, inventory_df, top):
+        '''
+        Method to measure the exact sizes of the top largest tables by estimated size.
+        '''
+
+        largest = inventory_df['size'].reset_index(drop=True).nlargest(top).index.values
+        self.logger.info('Measuring the {} largest tables out of {}'.format(len(largest), len(inventory_df)))
+
+        return self.measureRows(inventory_df, largest)
+
+    def measureRows(self, inventory_df, positions):
+        '''
+        Method to measure the exact sizes of the tables at positions of an inventory, in chunks,
+        writing them back into its size columns.
+        '''
+
+        updates = dict((column, inventory_df[column].values.copy()) for column in ['oid', 'name', 'approximate'])
+        updates.update((column, inventory_df[column].values.astype(np.float64)) for column in SIZE_COLUMNS)
+
+        for start in range(0, len(positions), self.chunk_size):
+            chunk = positions[start:start + self.chunk_size]
+            rows = [{'oid': int(updates['oid'][i]), 'name': updates['name'][i]} for i in chunk]
+            for i, row in zip(chunk, self.measureSizes(rows)):
+                if row.get('approximate') is False:
+                    for column in SIZE_COLUMNS + ['approximate']:
+                        value = row.get(column)
+                        updates[column][i] = np.nan if value is None else value
+
+        for column in SIZE_COLUMNS + ['approximate']:
+            inventory_df[column] = updates[column]
+
+        return inventory.compact(inventory_df)
+
+    def measureSizes(self, rows, bulk=True):
+        '''
+        Method to add the exact sizes to a chunk of tables, one by one if bulk is False or the bulk query fails.
+        '''
+
+        if bulk and rows:
+            try:
+                sizes = self.query(SIZES_QUERY.format(
+                    oids=','.join(str(row['oid']) for row in rows)))
+                sizes = dict((size['oid'], size) for size in sizes)
+                for row in rows:
+                    if row['oid'] in sizes:
+                        row.update(sizes[row['oid']], approximate=False)
+                return rows
+            except QueryError as e:
+                self.logger.warning('Bulk size query failed: {}'.format(e))
+
+        for row in rows:
+            try:
+                row.update(self.query(SIZES_QUERY.format(oids=row['oid']))[0], approximate=False)
+            except (QueryError, IndexError) as e:
+                self.logger.debug('Size query failed for {}: {}'.format(row['name'], e))
+
+        return rows
+
+    def getPreviousInventory(self):
+        '''
+        Method to get the tables inventory of the latest stored snapshot, if any.
+        '''
+
+        if self.store is None:
+            return None
+
+        snapshot = self.store.load(self.CARTO_USER, self.CARTO_ORG)
+        if snapshot is None or not set(INVENTORY_COLUMNS).issubset(snapshot['tables'].columns):
+            self.logger.info('No previous inventory, measuring all tables')
+            return None
+
+        # dates of snapshots stored by previous versions are strings
+        previous_df = snapshot['tables'][INVENTORY_COLUMNS].copy()
+        for column in inventory.DATE_COLUMNS:
+            previous_df[column] = pd.to_datetime(previous_df[column], utc=True)
+
+        return previous_df
+
     ### get analysis names table
 
     def getCachedAnalysisNames(self, all_tables_df):
@@ -307,31 +992,62 @@ class Reporter(object):
 
         self.logger.info('Getting analysis from tables information...')
 
-        analysis_df = all_tables_df.loc[all_tables_df['cartodbfied'] == 'No']
+        analysis_df = all_tables_df.loc[~all_tables_df['cartodbfied']]
 
-        if len(analysis_df) > 0:
+        if 'type' not in analysis_df.columns:
+            analysis_df = analysis_df.assign(type=classify.analysis_type(analysis_df['name']))
 
-            #get analysis id
-            self.logger.info('Replacing analysis id with proper names...')
-            analysis_df['id'] = analysis_df['name'].str.split("_", n = 3, expand = True)[1] 
+        #get analysis summary
+        analysis_types = analysis_df['type'].value_counts()
+        analysis_types_df = analysis_types[analysis_types > 0].to_frame('Analysis Count')
 
-            #convert equivalences object to a df
-            equivalences = [{"type": "aggregate-intersection", "id": "b194a8f896"},{ "type": "bounding-box", "id": "5f80bdff9d"},{ "type": "bounding-circle", "id": "b7636131b5"},{ "type": "buffer", "id": "2f13a3dbd7"},{ "type": "centroid", "id": "ae64186757"},{ "type": "closest", "id": "4bd65e58e4"},{ "type": "concave-hull", "id": "259cf96ece"},{ "type": "contour", "id": "779051ec8e"},{ "type": "convex-hull", "id": "05234e7c2a"},{ "type": "data-observatory-measure", "id": "a08f3b6124"},{ "type": "data-observatory-multiple-measures", "id": "cd60938c7b"},{ "type": "deprecated-sql-function", "id": "e85ed857c2"},{ "type": "filter-by-node-column", "id": "83d60eb9fa"},{ "type": "filter-category", "id": "440d2c1487"},{ "type": "filter-grouped-rank", "id": "f15fa0b618"},{ "type": "filter-range", "id": "942b6fec82"},{ "type": "filter-rank", "id": "43155891da"},{ "type": "georeference-admin-region", "id": "a5bdb274e8"},{ "type": "georeference-city", "id": "d5b2dd1672"},{ "type": "georeference-country", "id": "792d8938e3"},{ "type": "georeference-ip-address", "id": "d5b2274cdf"},{ "type": "georeference-long-lat", "id": "0623244fc4"},{ "type": "georeference-postal-code", "id": "1f7c6f9f43"},{ "type": "georeference-street-address", "id": "1ea6dec9f3"},{ "type": "gravity", "id": "93ab69856c"},{ "type": "intersection", "id": "971639c870"},{ "type": "kmeans", "id": "3c835a874c"},{ "type": "line-sequential", "id": "9fd29bd5c0"},{ "type": "line-source-to-target", "id": "9e88a1147e"},{ "type": "line-to-column", "id": "be2ff62ce9"},{ "type": "line-to-single-point", "id": "eca516b80b"},{ "type": "link-by-line", "id": "49ca809a90"},{ "type": "merge", "id": "c38cb847a0"},{ "type": "moran", "id": "91837cbb3c"},{ "type": "point-in-polygon", "id": "2e94d3858c"},{ "type": "population-in-area", "id": "d52251dc01"},{ "type": "routing-sequential", "id": "a627e132c2"},{ "type": "routing-to-layer-all-to-all", "id": "b70cf71482"},{ "type": "routing-to-single-point", "id": "2923729eb9"},{ "type": "sampling", "id": "7530d60ffc"},{ "type": "source", "id": "fd83c76763"},{ "type": "spatial-markov-trend", "id": "9c3b798f46"},{ "type": "trade-area", "id": "112d4fc091"},{ "type": "weighted-centroid", "id": "1d85314d7a"}]
-            equivalences_df = json_normalize(equivalences)
+        if len(analysis_df) > 0:
+            self.logger.info('{} analysis retrieved, {} different types. '.format(len(analysis_df), len(analysis_types_df)))
+        else:
+            self.logger.warning('No analysis found.')
+                                                
+        return (analysis_df, analysis_types_df)
 
-            #join equivalences to analysis table
-            analysis_df = pd.merge(analysis_df, equivalences_df, on='id', how='left')
+    ### render charts as HTML
 
-            #get analysis summuary
-            analysis_types = analysis_df['type'].value_counts()
-            analysis_types_df = analysis_types.to_frame()
-            analysis_types_df = analysis_types_df.rename(columns={'type': 'Analysis Count'})
+    def getCharts(self, analysis_types_df, lds_df):
+        '''
+        Method to render the analysis and LDS charts as HTML with the chart backend of the reporter.
+        With a render cache, charts are only drawn again when their data changed.
+        '''
 
-            self.logger.info('{} analysis retrieved, {} different types. '.format(len(analysis_df), analysis_types_df.nunique()))         
+        self.logger.info('Rendering charts with {}...'.format(self.chart_backend))
+
+        if self.chart_backend == 'svg':
+            draw_analysis, draw_lds = charts.svg_analysis, charts.svg_quota
+        elif self.chart_backend == 'mpld3':
+            draw_analysis = functools.partial(self.drawFigure, self.plotAnalysis)
+            draw_lds = functools.partial(self.drawFigure, self.plotQuota)
         else:
-            self.logger.warning('No analysis found.')   
-                                                
-        return (analysis_df, analysis_types_df)
+            raise ValueError('Unknown chart backend {}, use one of {}'.format(
+                self.chart_backend, ', '.join(charts.CHART_BACKENDS)))
+
+        return (self.getChart('analysis', analysis_types_df, draw_analysis),
+                self.getChart('lds', lds_df, draw_lds))
+
+    def getChart(self, name, df, draw):
+        '''
+        Method to draw the chart name of df, reusing the one drawn from the same data with a render cache.
+        '''
+
+        if self.render_cache is None:
+            return draw(df)
+
+        key = sections.digest(self.chart_backend, df)
+        return self.render_cache.get('chart:' + name, key, lambda: draw(df))
+
+    def drawFigure(self, plot, df):
+        '''
+        Method to draw a matplotlib figure of df as HTML with mpld3.
+        '''
+
+        with PLOT_LOCK:
+            return charts.figure_html(plot(df))
 
     ### plot LDS figure
 
@@ -348,12 +1064,13 @@ class Reporter(object):
         names = lds_df.index.tolist()
 
         # create a plot
+        plt = get_pyplot()
         fig_lds, ax_lds = plt.subplots()
 
         # create used quota / red bars
-        ax_lds.bar(r, lds_df['% Left'], bottom=lds_df['% Used'], color='#009392', edgecolor='white', width=barWidth, label='% Left')
+        ax_lds.bar(r, lds_df['% Left'], bottom=lds_df['% Used'], color=charts.LDS_COLORS['% Left'], edgecolor='white', width=barWidth, label='% Left')
         # create quota left / red bars
-        ax_lds.bar(r, lds_df['% Used'], color='#cf597e', edgecolor='white', width=barWidth, label='% Used')
+        ax_lds.bar(r, lds_df['% Used'], color=charts.LDS_COLORS['% Used'], edgecolor='white', width=barWidth, label='% Used')
 
         # customize ticks and labels
         ax_lds.set_xticks(r)
@@ -382,10 +1099,11 @@ class Reporter(object):
         # plot properties
         analysis_names = analysis_types_df.index.tolist()
         analysis_portions = analysis_types_df['Analysis Count']
-        cartocolors = ['#7F3C8D','#11A579','#3969AC','#F2B701','#E73F74','#80BA5A','#E68310','#008695','#CF1C90','#f97b72','#4b4b8f','#A5AA99']
+        cartocolors = charts.CARTOCOLORS
         names_positions = [i for i, _ in enumerate(analysis_names)]
 
         # create plot
+        plt = get_pyplot()
         fig_analysis, ax_analysis = plt.subplots()
 
         # plot bars
@@ -412,167 +1130,23 @@ class Reporter(object):
         dsets_df, tables_sizes, top_5_dsets_date, top_5_dsets_size,
         sync, private, link, public,
         geo, none_tbls, points, lines, polys,
-        fig_analysis,fig_lds):
+        html_fig_analysis, html_fig_lds, fp=None, approximate=False, changes=None,
+        reclaim_df=None, reclaimable=0, listings=None):
 
         '''
-        Method to generate a HTML report.
+        Method to generate a HTML report. It is returned as a string, or streamed to fp if given.
+        With approximate, storage and table sizes are marked as estimated. With listings, the full
+        tables and maps listings are embedded and shown in a virtualized table. With a render cache,
+        only the blocks of the template whose data changed since the last report are rendered.
         '''
 
         self.logger.info('Generating HTML template...')
 
-        template = """
-            <!DOCTYPE html>
-            <html lang="en">
-            <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <meta http-equiv="X-UA-Compatible" content="ie=edge">
-            <title>CARTO Database Metrics Report Template</title>
-            <link rel="stylesheet" href="https://libs.cartocdn.com/airship-style/v1.0.3/airship.css">
-            <script src="https://libs.cartocdn.com/airship-components/v1.0.3/airship.js"></script>
-            <style>
-            .as-sidebar{
-                width: 33.33%;
-            }
-            .as-box{
-                border-bottom: 1px solid #F5F5F5;
-            }
-            </style>
-            </head>                   
-            <body class="as-app-body as-app">
-            <header class="as-toolbar">
-                <div class="as-toolbar__item as-title">
-                    CARTO Metrics Report 
-                </div>
-                <div class="as-toolbar__item as-display--block as-p--12 as-subheader as-bg--complementary">
-                    {{ user }} from {{org}} at {{today}}
-                </div>
-            </header>
-            <div class="as-content">
-                <aside class="as-sidebar as-sidebar--left">
-                <div class="as-container">
-                    <h1 class="as-box as-title as-font--medium">
-                    Maps and Analysis
-                    </h1>
-                    <div class="as-box">
-                        <h2 class="as-title">
-                            Maps
-                        </h2>
-                        <p class="as-body as-font--medium">Number of maps: {{total_maps}}</p>
-                        <div class="as-box" id="maps-table">
-                            <h3 class="as-subheader">Top 5 Maps by Date</h3>
-                            {{top_5_maps_date.to_html()}}
-                        </div>
-                    </div>
-
-                    <div class="as-box">
-                    <h2 class="as-title">
-                        Builder Cached Analysis
-                    </h2>
-                    <ul class="as-list">
-                        <li class="as-list__item">Number of cached analyses: {{total_analysis}}</li>
-                        <li class="as-list__item">Cached Analyses Size: {{total_size_analysis}} MB</li>
-                    </ul>
-                    <div class="as-box" id="analysis-table">
-                        {{analysis_types_df.to_html()}}
-                    </div>
-                    <div class="as-box" id="analysis-fig">
-                        {{html_fig_analysis}}
-                    </div>
-                    </div>
-                </div>
-                </aside>
-                <main class="as-main">
-                    <h1 class="as-box as-title as-font--medium">
-                        Storage Quota & LDS
-                    </h1>
-                    <div class="as-box">
-                        <h2 class="as-title">
-                            Storage Quota
-                        </h2>
-                        <ul class="as-list">
-                            <li class="as-list__item as-font--medium">Account Storage: {{real_storage}} MB</li>
-                            <li class="as-list__item as-color--support-01">Used Quota: {{used_storage}} MB, {{pc_used}} %</li>
-                            <li class="as-list__item as-color--complementary">Quota Left: {{left_storage}} MB, {{pc_left}} %</li>
-                        </ul>
-                    </div>
-                    <div class="as-box">
-                        <h2 class="as-title">
-                            Location Data Services
-                        </h2>
-                        <div class="as-box" id="lds-table">
-                            {{lds.to_html()}}
-                        </div>
-                        <div class="as-box" id="lds-fig">
-                            {{html_fig_lds}}
-                        </div>
-                    </div>
-                </main>
-                <aside class="as-sidebar as-sidebar--right">
-                <div class="as-container">
-                    <div class="as-box as-title as-font--medium">
-                    Datasets
-                    </div>
-                    <div class="as-box">
-                        <h2 class="as-title">
-                            Datasets Summary
-                        </h2>
-                        <ul class="as-list">
-                            <li class="as-list__item as-font--medium">Number of tables: {{total_dsets}}</li>
-                            <li class="as-list__item">Sync tables: {{sync}}</li>
-                            <li class="as-list__item">Tables Size: {{total_size_tbls}} MB</li>
-                        </ul>
-                    </div>
-                    <div class="as-box">
-                    <h2 class="as-title">
-                        Privacy
-                    </h2>
-                    <ul class="as-list">
-                        <li class="as-list__item as-color--support-01">🔒 Private: {{private}} tables</li>
-                        <li class="as-list__item as-color--support-02">🔗 Shared with link: {{link}} tables</li>
-                        <li class="as-list__item as-color--support-03">🔓 Public: {{public}} tables</li>
-                    </ul>
-                    </div>
-                    <div class="as-box">
-                    <h2 class="as-title">
-                        Geometry
-                    </h2>
-                    <p class="as-body">
-                        Number of geocoded tables: {{geo}}
-                    </p>
-                    <ul class="as-list">
-                        <li class="as-list__item">📌 Points: {{points}} tables</li>
-                        <li class="as-list__item">〰️ Lines: {{lines}} tables</span></li>
-                        <li class="as-list__item">⬛ Polygons: {{polys}} tables</li>
-                    </ul>
-                    <p class="as-body">
-                        Number of non-geocoded tables: {{none_tbls}}
-                    </p>
-                    </div>
-                    <div class="as-box" id="tables-size">
-                        <h3 class="as-subheader">Top 5 Datasets by Size</h3>
-                        {{top_5_dsets_size.to_html()}}
-                    </div>
-                    <div class="as-box" id="tables-date">
-                        <h3 class="as-subheader">Top 5 Datasets by Date</h3>
-                        {{top_5_dsets_date.to_html()}}
-                    </div>
-                </div>
-                </aside>
-            </div>
-            <script>
-                // add airship class to tables 
-                const tableElements = document.querySelectorAll('table');
-                tableElements.forEach(element => element.classList.add("as-table"));
-            </script>
-            </body>
-            </html>
-        """
-        rtemplate = Environment(loader=BaseLoader()).from_string(template)
+        rtemplate = templating.get_environment(self.template_dir).get_template(REPORT_TEMPLATE)
 
         self.logger.info('Rendering HTML report...')
 
-        report = rtemplate.render({
+        context = {
 
                 # user and date info
                 'user': user,
@@ -581,11 +1155,11 @@ class Reporter(object):
 
                 # lds and storage info
                 'lds': lds_df,
-                'real_storage':lds_df.iloc[3]['Monthly Quota'],
-                'used_storage':lds_df.iloc[3]['Used'],
-                'pc_used':lds_df.iloc[3]['% Used'],
-                'left_storage':lds_df.iloc[3]['Left'],
-                'pc_left':round(lds_df.iloc[3]['% Left'],2),
+                'real_storage':lds_df.loc['storage', 'Monthly Quota'],
+                'used_storage':lds_df.loc['storage', 'Used'],
+                'pc_used':lds_df.loc['storage', '% Used'],
+                'left_storage':lds_df.loc['storage', 'Left'],
+                'pc_left':round(lds_df.loc['storage', '% Left'],2),
 
                 # maps info
                 'total_maps': len(maps_df),
@@ -598,7 +1172,7 @@ class Reporter(object):
                 'sync': sync,
                 'total_dsets': len(dsets_df),
                 'total_size_tbls': tables_sizes['size'].sum(),
-                'top_5_dsets_size': top_5_dsets_size[['size']],
+                'top_5_dsets_size': top_5_dsets_size[['size', 'approximate'] if approximate else ['size']],
                 'top_5_dsets_date': top_5_dsets_date[['created']],
 
                 # privacy info
@@ -614,9 +1188,38 @@ class Reporter(object):
                 'none_tbls':none_tbls,
 
                 # figures
-                'html_fig_analysis': fig_to_html(fig_analysis),
-                'html_fig_lds': fig_to_html(fig_lds)
-            })
-        
-        return report
+                'html_fig_analysis': html_fig_analysis,
+                'html_fig_lds': html_fig_lds,
+
+                # sizes estimated from the catalog
+                'approximate': approximate,
+
+                # biggest reclaim opportunities
+                'reclaim': reclaim_df,
+                'reclaimable': round(reclaimable / 1000000, 2),
+
+                # changes since the previous snapshot
+                'changes': None if changes is None else {
+                    'figures': changes.figures(),
+                    'top': changes.topChanges()
+                },
+
+                # full listings, encoded
+                'inventory': listings,
+
+                # instrumentation of the stages run so far
+                'timings': self.timings['stages'] if self.timings_footer else None
+            }
+
+        if self.render_cache is not None:
+            stream = self.render_cache.stream(rtemplate, context)
+            if fp is None:
+                return ''.join(stream)
+        elif fp is None:
+            return rtemplate.render(context)
+        else:
+            stream = rtemplate.stream(context)
+
+        stream.enable_buffering(STREAM_BUFFER)
+        stream.dump(fp)
 
@@ -0,0 +1,111 @@
+# -*- coding: UTF-8 -*-
+
+import hashlib
+import logging
+import threading
+
+import pandas as pd
+from jinja2 import nodes
+from jinja2.environment import TemplateStream
+
+logger = logging.getLogger('carto_report')
+logger.addHandler(logging.NullHandler())
+
+
+def digest(*values):
+    '''
+    Content hash of values: dfs and series by their data, index and columns,
+    dicts, lists and tuples by their items and anything else by its repr.
+    '''
+    hasher = hashlib.sha1()
+    for value in values:
+        _update(hasher, value)
+    return hasher.hexdigest()
+
+
+def _update(hasher, value):
+    hasher.update(type(value).__name__.encode('utf-8'))
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        hasher.update(repr(list(value.columns) if isinstance(value, pd.DataFrame) else value.name).encode('utf-8'))
+        hasher.update(repr(list(value.index.names)).encode('utf-8'))
+        hasher.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    elif isinstance(value, dict):
+        for key in sorted(value, key=str):
+            _update(hasher, key)
+            _update(hasher, value[key])
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _update(hasher, item)
+    else:
+        hasher.update(repr(value).encode('utf-8'))
+
+
+class RenderCache(object):
+    '''
+    Rendered HTML fragments of the report, every block of the template and
+    every chart, keyed by a content hash of the data they are rendered from.
+    Only the latest fragment of every block or chart is kept, so a refreshed
+    report only renders again the sections whose data changed. The data of a
+    block are the template variables it reads, found in the template source.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fragments = {}
+        self.variables = {}
+        self.rendered = 0
+        self.reused = 0
+
+    def get(self, name, key, render):
+        '''
+        Method to get the fragment name rendered for the content hash key, rendering it again
+        with render if the fragment kept was rendered from different data.
+        '''
+
+        with self.lock:
+            cached = self.fragments.get(name)
+        if cached is not None and cached[0] == key:
+            self.reused += 1
+            return cached[1]
+
+        fragment = render()
+        with self.lock:
+            self.fragments[name] = (key, fragment)
+        self.rendered += 1
+        return fragment
+
+    def getVariables(self, template):
+        '''
+        Method to get the names of the variables read by every block of a template, parsed once.
+        '''
+
+        with self.lock:
+            if template.name not in self.variables:
+                environment = template.environment
+                source = environment.loader.get_source(environment, template.name)[0]
+                self.variables[template.name] = dict(
+                    (block.name, sorted(set(name.name for name in block.find_all(nodes.Name) if name.ctx == 'load')))
+                    for block in environment.parse(source).find_all(nodes.Block))
+            return self.variables[template.name]
+
+    def stream(self, template, context):
+        '''
+        Method to get a stream of the template rendered with context, reusing the
+        blocks rendered before from the same data.
+        '''
+
+        self.rendered = self.reused = 0
+        variables = self.getVariables(template)
+        render_context = template.new_context(context)
+
+        for name, render_block in template.blocks.items():
+            if name not in variables:
+                continue
+            key = digest(name, [context.get(variable) for variable in variables[name]])
+            fragment = self.get(template.name + ':' + name, key,
+                                lambda render_block=render_block: ''.join(render_block(render_context)))
+            render_context.blocks[name] = [lambda block_context, fragment=fragment: iter([fragment])]
+
+        logger.info('Reusing {} of {} report sections'.format(self.reused, self.reused + self.rendered))
+
+        return TemplateStream(template.root_render_func(render_context))
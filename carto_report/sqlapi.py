@@ -0,0 +1,306 @@
+# -*- coding: UTF-8 -*-
+
+import json
+import logging
+import random
+import threading
+import time
+
+from carto.exceptions import CartoException, CartoRateLimitException
+
+from carto_report.instrumentation import instrument, record
+
+### request layer defaults
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF = 1.0
+DEFAULT_MAX_BACKOFF = 60.0
+DEFAULT_TIMEOUT = 300
+
+# HTTP status codes worth retrying, as reported by pyrestcli exceptions
+RETRY_STATUS = [429, 500, 502, 503, 504]
+
+# every query of a batch becomes a column with its rows as a JSON array
+BATCH_COLUMN = """
+    (select coalesce(json_agg(q), '[]'::json) from (
+{query}
+    ) q) as {name}"""
+
+logger = logging.getLogger('carto_report')
+logger.addHandler(logging.NullHandler())
+
+
+class QueryError(Exception):
+    '''
+    A query or API request that failed permanently, after all the retries.
+    '''
+
+    def __init__(self, query, cause, attempts):
+        super(QueryError, self).__init__('{} (after {} attempts)'.format(cause, attempts))
+        self.query = query
+        self.cause = cause
+        self.attempts = attempts
+
+
+def get_session(pool_size=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT):
+    '''
+    Keep-alive requests session with pool_size pooled connections per host,
+    gzip compressed responses and a default timeout for every request.
+    '''
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    class TimeoutAdapter(HTTPAdapter):
+
+        def send(self, request, **kwargs):
+            if kwargs.get('timeout') is None:
+                kwargs['timeout'] = timeout
+            return super(TimeoutAdapter, self).send(request, **kwargs)
+
+    session = requests.Session()
+    session.headers['Accept-Encoding'] = 'gzip, deflate'
+    adapter = TimeoutAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return instrument(session)
+
+### scheduler
+
+class RateLimiter(object):
+    '''
+    Token bucket allowing rate requests per second, with bursts of up to burst requests.
+    It can also be paused, for example until a rate limit resets.
+    '''
+
+    def __init__(self, rate=None, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate or 1.0)
+        self.tokens = self.capacity
+        self.updated = time.time()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        Method to wait for a request slot.
+        '''
+
+        while True:
+            with self.lock:
+                now = time.time()
+                wait = self.paused_until - now
+                if wait <= 0:
+                    if self.rate is None:
+                        return
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        '''
+        Method to hold every request for some seconds.
+        '''
+
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.time() + seconds)
+
+
+class SQLScheduler(object):
+    '''
+    Request layer in front of a carto SQLClient, with the same send method,
+    that other API requests can also go through with call.
+
+    At most concurrency queries run at the same time and at most rate per
+    second are started. Rate limited (429), server errors and network
+    failures are retried with jittered exponential backoff, waiting at least
+    what the Retry-After header asks, and rate limits pause all the queries.
+    Queries that still fail are kept in failures and raise QueryError.
+    '''
+
+    def __init__(self, sql_client, concurrency=DEFAULT_CONCURRENCY, rate=None, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, max_backoff=DEFAULT_MAX_BACKOFF):
+        self.sql_client = sql_client
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.slots = threading.BoundedSemaphore(max(1, concurrency))
+        self.limiter = RateLimiter(rate)
+        self.lock = threading.Lock()
+        self.failures = []
+
+    def send(self, sql, **kwargs):
+        '''
+        Method to run a query, returns the SQL API response like SQLClient.send.
+        '''
+
+        return self.call(self.sql_client.send, sql, label=sql, **kwargs)
+
+    def call(self, func, *args, **kwargs):
+        '''
+        Method to run any API request func(*args, **kwargs) with the same limits and retries,
+        func has to raise CartoException on errors. label names the request in failures,
+        keep_failure=False raises QueryError without keeping it, for requests with a fallback.
+        '''
+
+        label = kwargs.pop('label', None)
+        keep_failure = kwargs.pop('keep_failure', True)
+        attempt = 0
+        while True:
+            attempt += 1
+            self.limiter.acquire()
+            try:
+                with self.slots:
+                    return func(*args, **kwargs)
+            except CartoException as e:
+                error = e
+
+            if attempt > self.retries or not self.retryable(error):
+                failure = QueryError(label, error, attempt)
+                if keep_failure:
+                    with self.lock:
+                        self.failures.append(failure)
+                raise failure
+
+            retry_after = getattr(error, 'retry_after', None)
+            delay = self.delay(attempt, retry_after)
+            if retry_after is not None:
+                self.limiter.pause(delay)
+            record(retries=1)
+            logger.warning('Request failed with {}, retrying in {:.1f}s ({}/{})'.format(
+                self.describe(error), delay, attempt, self.retries))
+            time.sleep(delay)
+
+    def retryable(self, e):
+        '''
+        Method to know whether a failed query is worth retrying.
+        '''
+
+        if isinstance(e, CartoRateLimitException):
+            return True
+
+        import requests
+
+        cause = self.cause(e)
+        if isinstance(cause, requests.exceptions.RequestException):
+            return True
+        return getattr(cause, 'status_code', None) in RETRY_STATUS
+
+    def cause(self, e):
+        '''
+        Method to get the original error wrapped by carto exceptions.
+        '''
+
+        while isinstance(e, CartoException) and e.args and isinstance(e.args[0], Exception):
+            e = e.args[0]
+        return e
+
+    def delay(self, attempt, retry_after=None):
+        '''
+        Method to get the seconds to wait before an attempt: exponential backoff with full jitter,
+        but never less than retry_after.
+        '''
+
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            delay += retry_after
+        return delay
+
+    def describe(self, e):
+        if isinstance(e, CartoRateLimitException):
+            return 'rate limit, {} requests left'.format(e.remaining)
+        cause = self.cause(e)
+        return '{}: {}'.format(type(cause).__name__, str(cause)[:200])
+
+    def reset(self):
+        with self.lock:
+            self.failures = []
+
+### batches
+
+class QueryBatch(object):
+    '''
+    Independent queries combined into a single SQL API request.
+
+    Queries are registered with add and sent together the first time the
+    result of any of them is asked for, as one statement returning the rows of
+    every query as a JSON array. Each result is handed out once. If the
+    combined request fails every query is sent on its own, so a failing query
+    only fails its caller.
+    '''
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.lock = threading.Lock()
+        self.queries = []
+        self.results = {}
+
+    def add(self, sql):
+        '''
+        Method to register a query for the next request.
+        '''
+
+        with self.lock:
+            if sql not in self.queries and sql not in self.results:
+                self.queries.append(sql)
+
+    def pending(self, sql):
+        '''
+        Method to know whether the result of a query is, or will be, in the batch.
+        '''
+
+        with self.lock:
+            return sql in self.queries or sql in self.results
+
+    def result(self, sql):
+        '''
+        Method to get the rows of a registered query, sending the batch if needed.
+        Raises QueryError if that query failed.
+        '''
+
+        with self.lock:
+            if sql in self.queries:
+                self.flush()
+            result = self.results.pop(sql)
+
+        if isinstance(result, QueryError):
+            raise result
+        return result
+
+    def flush(self):
+        '''
+        Method to send the registered queries, called with the lock held.
+        '''
+
+        queries, self.queries = self.queries, []
+        if len(queries) == 1:
+            self.results.update(self.sendEach(queries))
+            return
+
+        names = ['q{}'.format(i) for i in range(len(queries))]
+        combined = 'select' + ','.join(
+            BATCH_COLUMN.format(query=query.strip().rstrip(';'), name=name) for query, name in zip(queries, names))
+        try:
+            row = self.scheduler.send(combined, keep_failure=False)['rows'][0]
+        except QueryError as e:
+            logger.warning('Batch of {} queries failed, sending them one by one: {}'.format(len(queries), e))
+            self.results.update(self.sendEach(queries))
+            return
+
+        for query, name in zip(queries, names):
+            rows = row[name]
+            self.results[query] = json.loads(rows) if isinstance(rows, str) else rows
+
+    def sendEach(self, queries):
+        results = {}
+        for query in queries:
+            try:
+                results[query] = self.scheduler.send(query)['rows']
+            except QueryError as e:
+                results[query] = e
+        return results
@@ -0,0 +1,81 @@
+# -*- coding: UTF-8 -*-
+
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+### stage graph
+
+class StageGraph(object):
+    '''
+    Small dependency graph of named stages run on a bounded thread pool.
+
+    Every stage is a callable that receives the results of the stages it
+    requires as positional arguments, in the same order they were declared.
+    A stage is submitted as soon as all its requirements are done.
+    The seconds taken by every stage are kept in timings, and measured by
+    instrumentation if given.
+    '''
+
+    def __init__(self, workers=4, instrumentation=None):
+        self.workers = max(1, workers)
+        self.stages = OrderedDict()
+        self.timings = OrderedDict()
+        self.instrumentation = instrumentation
+
+        self.logger = logging.getLogger('carto_report')
+        self.logger.addHandler(logging.NullHandler())
+
+    def add(self, name, func, requires=()):
+        '''
+        Method to register a stage. Required stages have to be registered first.
+        '''
+
+        if name in self.stages:
+            raise ValueError('Stage {} already registered'.format(name))
+
+        for required in requires:
+            if required not in self.stages:
+                raise ValueError('Stage {} requires unknown stage {}'.format(name, required))
+
+        self.stages[name] = (func, tuple(requires))
+
+        return self
+
+    def run(self):
+        '''
+        Method to run all the stages and get a dict with their results by name.
+        '''
+
+        results = {}
+        pending = OrderedDict(self.stages)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while pending or running:
+                for name, (func, requires) in list(pending.items()):
+                    if all(required in results for required in requires):
+                        del pending[name]
+                        args = [results[required] for required in requires]
+                        self.logger.debug('Starting stage {}...'.format(name))
+                        running[executor.submit(self._timed, name, func, *args)] = name
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    name = running.pop(future)
+                    results[name] = future.result()
+
+        return results
+
+    def _timed(self, name, func, *args):
+        start = time.time()
+        if self.instrumentation is None:
+            result = func(*args)
+        else:
+            with self.instrumentation.stage(name):
+                result = func(*args)
+        self.timings[name] = time.time() - start
+        self.logger.debug('Stage {} finished in {:.2f}s'.format(name, self.timings[name]))
+        return result
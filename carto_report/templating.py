@@ -0,0 +1,57 @@
+# -*- coding: UTF-8 -*-
+
+import logging
+import os
+import threading
+
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+
+from carto_report.cache import DEFAULT_CACHE_DIR
+
+### templates locations
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+BYTECODE_CACHE_DIR = os.getenv('CARTO_REPORT_BYTECODE_CACHE_DIR',
+                               os.path.join(DEFAULT_CACHE_DIR, 'templates'))
+
+### shared environments
+
+# one environment per templates folder, so compiled templates are reused by all the reporters
+_environments = {}
+_environments_lock = threading.Lock()
+
+logger = logging.getLogger('carto_report')
+logger.addHandler(logging.NullHandler())
+
+
+def get_environment(template_dir=None):
+    '''
+    Get the shared Jinja environment for a templates folder. Templates not
+    found in template_dir are loaded from the package templates, and
+    compiled templates are kept in a persistent bytecode cache.
+    '''
+    with _environments_lock:
+        if template_dir not in _environments:
+            search_path = [TEMPLATES_DIR]
+            if template_dir is not None:
+                search_path.insert(0, template_dir)
+
+            _environments[template_dir] = Environment(
+                loader=FileSystemLoader(search_path),
+                bytecode_cache=get_bytecode_cache())
+
+        return _environments[template_dir]
+
+
+def get_bytecode_cache(directory=BYTECODE_CACHE_DIR):
+    '''
+    Get a bytecode cache in directory, or None if it can not be created
+    '''
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    except OSError as e:
+        logger.warning('Templates bytecode cache disabled: {}'.format(e))
+        return None
+
+    return FileSystemBytecodeCache(directory)
@@ -0,0 +1,78 @@
+# -*- coding: UTF-8 -*-
+
+from carto.exceptions import CartoException
+
+### visualizations API
+
+VIZ_ENDPOINT = 'api/v1/viz/'
+DEFAULT_PAGE_SIZE = 100
+
+# nested resources and counters not used by the report are not requested
+LEAN_PARAMS = {
+    'exclude_shared': 'true',
+    'show_stats': 'false',
+    'show_likes': 'false',
+    'show_liked': 'false',
+    'show_permission': 'false',
+    'show_auth_tokens': 'false',
+    'show_user_basemaps': 'false',
+    'show_uses_builder_features': 'false',
+    'show_table_size_and_row_count': 'false'
+}
+MAP_PARAMS = dict(LEAN_PARAMS, type='derived', show_table='false', show_synchronization='false')
+DATASET_PARAMS = dict(LEAN_PARAMS, type='table', show_table='true', show_synchronization='true')
+
+# fields kept from every item, in the order of the projected tuples
+MAP_FIELDS = ['name', 'created', 'url', 'updated']
+DATASET_FIELDS = ['name', 'privacy', 'created', 'synchronization', 'geometry']
+
+
+def iter_items(auth_client, params, page_size=DEFAULT_PAGE_SIZE, scheduler=None):
+    '''
+    Iterate over all the items of the visualizations API, one page in memory at a time.
+    Pages are requested through scheduler (a SQLScheduler) when given, to share its
+    rate limits and retries.
+    '''
+    page = 1
+    seen = 0
+    while True:
+        if scheduler is None:
+            body = get_page(auth_client, params, page, page_size)
+        else:
+            body = scheduler.call(get_page, auth_client, params, page, page_size,
+                                  label='{}{} page {}'.format(VIZ_ENDPOINT, params.get('type'), page))
+        items = body.get('visualizations') or []
+        total = int(body.get('total_entries', 0))
+        del body
+
+        for item in items:
+            yield item
+        seen += len(items)
+
+        if not items or seen >= total:
+            return
+        page += 1
+
+
+def get_page(auth_client, params, page, page_size):
+    '''
+    Get one page of the visualizations API as parsed JSON.
+    '''
+    try:
+        response = auth_client.send(VIZ_ENDPOINT, 'GET', params=dict(params, page=page, per_page=page_size))
+        return auth_client.get_response_data(response)
+    except CartoException:
+        raise
+    except Exception as e:
+        raise CartoException(e)
+
+
+def project_map(item):
+    return (item.get('name'), item.get('created_at'), item.get('url'), item.get('updated_at'))
+
+
+def project_dataset(item):
+    synchronization = item.get('synchronization') or {}
+    table = item.get('table') or {}
+    return (item.get('name'), item.get('privacy'), item.get('created_at'),
+            synchronization.get('updated_at'), table.get('geometry_types'))
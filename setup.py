@@ -35,4 +35,6 @@ setup(name="carto-report",
       entry_points='''
 [console_scripts]
 carto_report=carto_report.cli:main
+carto_report_batch=carto_report.batch:main
+carto_report_history=carto_report.history:main
       ''')
@@ -0,0 +1,47 @@
+# -*- coding: UTF-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from carto_report import batch
+
+
+def summary(user, org, status='ok', maps=1):
+    return {'user': user, 'org': org, 'status': status, 'maps': maps, 'datasets': 2, 'tables': 3,
+            'analysis': 1, 'analysis_size': 10, 'storage_quota': 100, 'storage_used': 50}
+
+
+SUMMARIES = [
+    summary('alice', 'team'), summary('bob', 'team'),
+    summary('carol', None, maps=4), summary('dave', float('nan'), maps=5), summary('frank', '', maps=6),
+    summary('erin', None, status='error')
+]
+
+
+class RollupTest(unittest.TestCase):
+
+    def test_accounts_without_organization(self):
+        totals_df = batch.rollup_totals(pd.DataFrame(SUMMARIES, columns=batch.ROLLUP_COLUMNS))
+
+        self.assertEqual(sorted(totals_df.index), [batch.NO_ORGANIZATION, 'team'])
+        self.assertEqual(totals_df.loc['team', 'users'], 2)
+        self.assertEqual(totals_df.loc[batch.NO_ORGANIZATION, 'users'], 3)
+        self.assertEqual(totals_df.loc[batch.NO_ORGANIZATION, 'maps'], 15)
+        self.assertEqual(totals_df['users'].sum(), 5)
+
+    def test_write_rollup(self):
+        output_dir = tempfile.mkdtemp()
+        try:
+            batch.write_rollup(SUMMARIES, output_dir)
+            with open(os.path.join(output_dir, 'index.html')) as reader:
+                self.assertIn(batch.NO_ORGANIZATION, reader.read())
+        finally:
+            shutil.rmtree(output_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+# -*- coding: UTF-8 -*-
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from carto_report.cache import SnapshotStore
+
+HOUR = 3600
+
+
+class SnapshotStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_latest_snapshot(self):
+        store = SnapshotStore(self.path)
+        now = time.time()
+        store.save('alice', None, {'run': 1}, now - 2 * HOUR)
+        store.save('alice', None, {'run': 2}, now - HOUR)
+        store.save('bob', 'team', {'run': 3}, now)
+
+        self.assertEqual(store.load('alice', None), {'run': 2})
+        self.assertEqual(store.loadPrevious('alice', None), {'run': 1})
+        self.assertEqual(store.load('bob', 'team'), {'run': 3})
+        self.assertIsNone(store.loadPrevious('bob', 'team'))
+        self.assertIsNone(store.load('bob', None))
+
+    def test_max_age(self):
+        store = SnapshotStore(self.path)
+        store.save('alice', None, {'run': 1}, time.time() - 2 * HOUR)
+
+        self.assertIsNone(store.load('alice', None, max_age=HOUR))
+        self.assertEqual(store.load('alice', None, max_age=3 * HOUR), {'run': 1})
+
+    def test_ttl_eviction(self):
+        store = SnapshotStore(self.path, ttl=HOUR)
+        now = time.time()
+        store.save('alice', None, {'run': 1}, now - 2 * HOUR)
+        store.save('alice', None, {'run': 2}, now)
+
+        self.assertEqual(len(store.entries()), 1)
+        self.assertIsNone(store.loadPrevious('alice', None))
+
+    def test_size_eviction(self):
+        store = SnapshotStore(self.path)
+        now = time.time()
+        for run in range(3):
+            store.save('alice', None, {'run': run, 'data': 'x' * 1000}, now - (3 - run) * HOUR)
+        size = store.entries()[0][2]
+
+        store.max_size = 2 * size
+        store.save('bob', None, {'run': 3, 'data': 'x' * 1000}, now)
+
+        # the two oldest snapshots are removed, whatever their account
+        entries = store.entries()
+        self.assertEqual(len(entries), 2)
+        self.assertGreater(entries[0][1], now - 2 * HOUR)
+        self.assertEqual(store.load('alice', None)['run'], 2)
+
+    def test_unreadable_snapshot(self):
+        store = SnapshotStore(self.path)
+        now = time.time()
+        store.save('alice', None, {'run': 1}, now - HOUR)
+        path = store.save('alice', None, {'run': 2}, now)
+        with open(path, 'wb') as writer:
+            writer.write(b'not a pickle')
+
+        self.assertEqual(store.load('alice', None), {'run': 1})
+
+    def test_unsafe_names(self):
+        store = SnapshotStore(self.path)
+        store.save('../alice', 'team/a', {'run': 1})
+
+        folder = store.getFolder('../alice', 'team/a')
+        self.assertTrue(os.path.dirname(os.path.dirname(folder)) == self.path)
+        self.assertEqual(store.load('../alice', 'team/a'), {'run': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
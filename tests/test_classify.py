@@ -0,0 +1,41 @@
+# -*- coding: UTF-8 -*-
+
+import unittest
+
+import pandas as pd
+
+from carto_report import classify
+from carto_report.inventory import positions
+
+
+class ClassifyTest(unittest.TestCase):
+
+    def test_without_datasets(self):
+        names = pd.Series(['table_a', 'analysis_{}_0123456789'.format(classify.ANALYSIS_IDS[0][0])])
+        no_datasets = pd.Series([], dtype=object)
+
+        classified_df = classify.classify(names, no_datasets, classify.geometry_class(no_datasets))
+
+        self.assertEqual(len(classified_df), 2)
+        self.assertFalse(classified_df['cartodbfied'].any())
+        self.assertFalse(classified_df['geocoded'].any())
+        self.assertTrue(classified_df['geom_type'].isnull().all())
+        self.assertEqual(classified_df['type'].iloc[1], classify.ANALYSIS_IDS[0][1])
+
+    def test_unmatched_tables_get_no_geometry(self):
+        # the last dataset is geocoded, unmatched tables must not read its geometry
+        names = pd.Series(['table_a', 'table_b', 'table_c'])
+        dataset_names = pd.Series(['table_b', 'table_z'])
+        geom_types = classify.geometry_class([[], ['ST_Point']])
+
+        classified_df = classify.classify(names, dataset_names, geom_types)
+
+        self.assertEqual(list(classified_df['cartodbfied']), [False, True, False])
+        self.assertEqual(list(classified_df['geocoded']), [False, False, False])
+
+    def test_positions_without_index_values(self):
+        self.assertEqual(list(positions(['a', 'b'], [])), [-1, -1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# -*- coding: UTF-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from carto_report.diff import SnapshotDiff, diff_frames
+
+
+def snapshot(date, tables, maps=(), datasets=()):
+    return {
+        'date': date,
+        'tables': pd.DataFrame([{'schema': schema, 'name': name, 'size': size} for schema, name, size in tables],
+                               columns=['schema', 'name', 'size']),
+        'maps': pd.DataFrame([{'name': url.upper(), 'url': url} for url in maps], columns=['name', 'url']),
+        'datasets': pd.DataFrame({'name': list(datasets)}, columns=['name'])
+    }
+
+
+OLD = snapshot('2018-12-01 10:00', [
+    ('public', 'kept', 100), ('public', 'grows', 100), ('public', 'shrinks', 100),
+    ('public', 'dropped', 50), ('other', 'kept', 10)
+], maps=['m1', 'm2'], datasets=['kept', 'dropped'])
+NEW = snapshot('2018-12-02 10:00', [
+    ('other', 'kept', 10), ('public', 'shrinks', 40), ('public', 'kept', 100),
+    ('public', 'grows', 300), ('other', 'grows', 7)
+], maps=['m2', 'm3'], datasets=['kept', 'new'])
+
+
+class SnapshotDiffTest(unittest.TestCase):
+
+    def test_statuses(self):
+        changes = SnapshotDiff(OLD, NEW)
+        tables = changes.tables.set_index(['schema', 'name'])
+
+        self.assertEqual(len(tables), 4)
+        self.assertEqual(tables.loc[('other', 'grows'), 'status'], 'added')
+        self.assertEqual(tables.loc[('public', 'dropped'), 'status'], 'removed')
+        self.assertEqual(tables.loc[('public', 'grows'), 'status'], 'grown')
+        self.assertEqual(tables.loc[('public', 'grows'), 'delta'], 200)
+        self.assertEqual(tables.loc[('public', 'shrinks'), 'status'], 'shrunk')
+        self.assertEqual(tables.loc[('public', 'shrinks'), 'delta'], -60)
+        self.assertEqual(tables.loc[('public', 'dropped'), 'delta'], -50)
+
+        self.assertEqual(list(changes.maps.sort_values('url')[['url', 'status']].itertuples(index=False, name=None)),
+                         [('m1', 'removed'), ('m3', 'added')])
+        self.assertEqual(list(changes.maps.loc[changes.maps['url'] == 'm3', 'name']), ['M3'])
+        self.assertEqual(sorted(changes.datasets['name'] + ':' + changes.datasets['status']),
+                         ['dropped:removed', 'new:added'])
+
+    def test_figures(self):
+        figures = SnapshotDiff(OLD, NEW).figures()
+
+        self.assertEqual([figures['tables_' + status] for status in ('added', 'removed', 'grown', 'shrunk')],
+                         [1, 1, 1, 1])
+        self.assertEqual(figures['size_before'], 360)
+        self.assertEqual(figures['size_after'], 457)
+        self.assertEqual(figures['size_delta'], 97)
+        self.assertEqual(figures['maps_added'], 1)
+        self.assertEqual(figures['datasets_removed'], 1)
+
+    def test_identical_snapshots(self):
+        changes = SnapshotDiff(OLD, OLD)
+
+        self.assertTrue(changes.tables.empty)
+        self.assertTrue(changes.maps.empty)
+        self.assertEqual(changes.figures()['size_delta'], 0)
+
+    def test_duplicated_keys(self):
+        old_df = pd.DataFrame({'name': ['a', 'a', 'b'], 'size': [1, 5, 2]})
+        new_df = pd.DataFrame({'name': ['a', 'b', 'b'], 'size': [3, 2, 9]})
+
+        changes = diff_frames(old_df, new_df, ['name'], 'size')
+        self.assertEqual(list(changes['status']), ['grown'])
+        self.assertEqual(list(changes['delta']), [2])
+
+    def test_write(self):
+        folder = tempfile.mkdtemp()
+        try:
+            path = SnapshotDiff(OLD, NEW, top=1).write(os.path.join(folder, 'changes.json'))
+            with open(path) as reader:
+                document = json.load(reader)
+        finally:
+            shutil.rmtree(folder)
+
+        self.assertEqual(document['figures']['tables_grown'], 1)
+        self.assertEqual(len(document['top']['grown']), 1)
+        self.assertEqual(len(document['tables']), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+# -*- coding: UTF-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from carto_report import exporters
+from carto_report.metrics import Metrics
+from carto_report.report import Reporter
+from carto_report.sqlapi import QueryError
+
+DATE = '2018-12-01T10:00:00+00:00'
+
+
+def failing_storage(sql):
+    raise QueryError(sql, 'canceling statement due to statement timeout', 3)
+
+
+def reject_constant(constant):
+    raise ValueError('{} is not valid JSON'.format(constant))
+
+
+class JsonExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_failed_storage_query(self):
+        reporter = Reporter('tester', None, None, None, 5000)
+        reporter.query = failing_storage
+        storage = reporter.getStorage('tester')
+
+        inventory_df = pd.DataFrame({'oid': [1, 2], 'name': ['table_a', 'table_b'], 'schema': 'public',
+                                     'size': [8192, 16384], 'approximate': False})
+        lds = pd.DataFrame([{'monthly_quota': 5000, 'provider': 'heremaps', 'service': 'routing',
+                             'soft_limit': False, 'used_quota': 10}])
+        snapshot = reporter.processResults({'vizs': [], 'dsets': [('table_a', 'PRIVATE', DATE, None, ['ST_Point'])],
+                                            'inventory': inventory_df, 'storage': storage, 'lds': lds})
+        metrics = Metrics('tester', None, snapshot, reporter.getCounts(snapshot), reporter.getSummary(snapshot))
+
+        path = exporters.write_json(metrics, os.path.join(self.output_dir, 'report.json'))
+        with open(path) as reader:
+            document = json.load(reader, parse_constant=reject_constant)
+
+        self.assertIsNone(document['figures']['storage_used'])
+        self.assertEqual(document['figures']['tables'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
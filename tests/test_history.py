@@ -0,0 +1,79 @@
+# -*- coding: UTF-8 -*-
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from carto_report.history import DAY, HistoryStore
+
+
+def metrics(storage_used, tables, user='alice', org=None, date='2018-12-01 10:00'):
+    quota = pd.DataFrame({
+        'Monthly Quota': [5000, 1000], 'Provider': ['carto', 'heremaps'], 'Used': [storage_used, 10]
+    }, index=pd.Index(['storage', 'routing'], name='Service'))
+    tables_df = pd.DataFrame({'schema': 'public', 'name': list(tables), 'size': list(tables.values())})
+    summary = {'storage_quota': np.float64(5000), 'storage_used': storage_used, 'maps': 1, 'datasets': 2,
+               'tables': np.int64(len(tables)), 'analysis': 0, 'analysis_size': 0}
+    return SimpleNamespace(user=user, org=org, date=date, summary=summary, quota=quota, tables=tables_df)
+
+
+class HistoryStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.store = HistoryStore(os.path.join(self.folder, 'history.db'))
+        self.now = time.time()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_duplicate_runs_skipped(self):
+        run = metrics(100.0, {'a': 10})
+
+        self.assertIsNotNone(self.store.append(run, self.now))
+        self.assertIsNone(self.store.append(run, self.now))
+        self.assertEqual(len(self.store.runs('alice')), 1)
+        self.assertEqual(len(self.store.tableSizes('alice', 'a')), 1)
+
+    def test_accounts_kept_apart(self):
+        self.store.append(metrics(100.0, {'a': 10}), self.now)
+        self.store.append(metrics(300.0, {'a': 30}, org='team'), self.now)
+
+        self.assertEqual(list(self.store.runs('alice')['storage_used']), [100.0])
+        self.assertEqual(list(self.store.runs('alice', 'team')['storage_used']), [300.0])
+
+    def test_growth(self):
+        self.store.append(metrics(50.0, {'a': 5}), self.now - 40 * DAY)
+        self.store.append(metrics(100.0, {'a': 10, 'b': 100}), self.now - 10 * DAY)
+        self.store.append(metrics(np.nan, {'a': 15}), self.now - 5 * DAY)
+        self.store.append(metrics(200.0, {'a': 10, 'b': 400, 'c': 50}), self.now)
+
+        growth = self.store.growth('alice', days=30)
+        self.assertEqual(growth['storage_start'], 100.0)
+        self.assertEqual(growth['storage_end'], 200.0)
+        self.assertEqual(growth['storage_delta'], 100.0)
+        self.assertEqual(growth['storage_rate'], 10.0)
+        self.assertEqual(growth['tables_delta'], 1)
+
+        # the failed storage of a run is kept empty
+        self.assertTrue(self.store.runs('alice')['storage_used'].isnull().any())
+
+        top_df = self.store.topGrowers('alice', days=30, limit=2)
+        self.assertEqual(list(top_df['name']), ['b', 'c'])
+        self.assertEqual(list(top_df['growth']), [300, 50])
+
+    def test_no_runs(self):
+        self.store.append(metrics(100.0, {'a': 10}), self.now - 40 * DAY)
+
+        self.assertIsNone(self.store.growth('alice', days=30))
+        self.assertTrue(self.store.topGrowers('alice', days=30).empty)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+# -*- coding: UTF-8 -*-
+
+import re
+import unittest
+
+from carto_report import inventory
+from carto_report.report import INVENTORY_COLUMNS, SIZE_COLUMNS, Reporter
+
+DATE = '2018-12-01T10:00:00+00:00'
+
+
+def table(oid, **values):
+    row = {
+        'oid': oid, 'name': 'table_{}'.format(oid), 'schema': 'public', 'relfilenode': oid,
+        'index_count': 1, 'index_relfilenodes': oid + 1, 'n_tup_ins': 10, 'n_tup_upd': 0, 'n_tup_del': 0,
+        'last_vacuum': None, 'last_autovacuum': DATE, 'last_analyze': None, 'last_autoanalyze': DATE,
+        'n_live_tup': 10, 'n_dead_tup': 0, 'estimated_rows': 10, 'approximate': False
+    }
+    row.update(values)
+    return row
+
+
+def measured(size):
+    return dict(size=size * 3, table_size=size, indexes_size=size * 2, toast_size=0)
+
+
+class RefreshSizesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.reporter = Reporter('tester', None, None, None, 5000)
+        self.measured = []
+        self.reporter.query = self.sizes
+
+        self.previous_df = inventory.concat([inventory.chunk_frame(
+            [table(oid, **measured(8192)) for oid in (1, 2, 3)], INVENTORY_COLUMNS)], INVENTORY_COLUMNS)
+
+    def sizes(self, sql):
+        oids = [int(oid) for oid in re.search(r'in \(([\d,]+)\)', sql).group(1).split(',')]
+        self.measured.extend(oids)
+        return [dict(oid=oid, **measured(16384)) for oid in oids]
+
+    def refresh(self, rows):
+        inventory_df = inventory.concat([inventory.chunk_frame(rows, INVENTORY_COLUMNS)], INVENTORY_COLUMNS)
+        return self.reporter.refreshSizes(inventory_df, self.previous_df)
+
+    def test_unchanged_tables_keep_their_sizes(self):
+        inventory_df = self.refresh([table(oid) for oid in (1, 2, 3)])
+
+        self.assertEqual(self.measured, [])
+        self.assertEqual(list(inventory_df['indexes_size']), [16384] * 3)
+
+    def test_index_changes(self):
+        rows = [
+            table(1, index_count=2, index_relfilenodes=5),   # CREATE INDEX
+            table(2, index_relfilenodes=9),                  # REINDEX
+            table(3),
+            table(4)                                          # new table
+        ]
+        inventory_df = self.refresh(rows)
+
+        self.assertEqual(sorted(self.measured), [1, 2, 4])
+        self.assertEqual(list(inventory_df['indexes_size']), [32768, 32768, 16384, 32768])
+        for column in SIZE_COLUMNS:
+            self.assertFalse(inventory_df[column].isnull().any())
+
+
+if __name__ == '__main__':
+    unittest.main()
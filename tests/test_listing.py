@@ -0,0 +1,36 @@
+# -*- coding: UTF-8 -*-
+
+import json
+import unittest
+
+import pandas as pd
+
+from carto_report import listing
+from carto_report.report import Reporter
+
+DATE = '2018-12-01T10:00:00+00:00'
+
+
+class ListingTest(unittest.TestCase):
+
+    def test_cached_analyses_match_the_report(self):
+        # an analysis table with an unknown analysis id is still a cached analysis
+        reporter = Reporter('tester', None, None, None, 5000)
+        inventory_df = pd.DataFrame({'oid': [1, 2, 3], 'name': ['table_a', 'analysis_0000000000_1', 'other'],
+                                     'schema': 'public', 'size': [8192, 16384, 4096], 'approximate': False})
+        lds = pd.DataFrame([{'monthly_quota': 5000, 'provider': 'heremaps', 'service': 'routing',
+                             'soft_limit': False, 'used_quota': 10}])
+        snapshot = reporter.processResults({'vizs': [], 'dsets': [('table_a', 'PRIVATE', DATE, None, ['ST_Point'])],
+                                            'inventory': inventory_df, 'storage': 1.0, 'lds': lds})
+
+        document = json.loads(listing.encode_listings(snapshot, 'json'))
+        tables = document['tables']
+        names = [column['name'] for column in tables['columns']]
+        cartodbfied = tables['data'][names.index('cartodbfied')]
+
+        self.assertEqual(cartodbfied.count(0), len(snapshot['analysis']))
+        self.assertEqual(cartodbfied.count(0), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
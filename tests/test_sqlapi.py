@@ -0,0 +1,191 @@
+# -*- coding: UTF-8 -*-
+
+import json
+import time
+import unittest
+
+import requests
+from carto.exceptions import CartoException, CartoRateLimitException
+
+from carto_report import report
+from carto_report.report import Reporter
+from carto_report.sqlapi import QueryBatch, QueryError, RateLimiter, SQLScheduler
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status_code):
+        super(HTTPError, self).__init__('HTTP {}'.format(status_code))
+        self.status_code = status_code
+
+
+def rate_limited(retry_after=0):
+    response = requests.Response()
+    response.status_code = 429
+    response.headers.update({'Carto-Rate-Limit-Limit': '10', 'Carto-Rate-Limit-Remaining': '0',
+                             'Retry-After': str(retry_after), 'Carto-Rate-Limit-Reset': '0'})
+    return CartoRateLimitException(response)
+
+
+class FakeClient(object):
+    '''
+    SQL client raising the given errors in order before answering.
+    '''
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def send(self, sql):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {'rows': [{'sql': sql}]}
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_unlimited(self):
+        limiter = RateLimiter()
+        start = time.time()
+        for _ in range(100):
+            limiter.acquire()
+        self.assertLess(time.time() - start, 0.1)
+
+    def test_token_bucket(self):
+        limiter = RateLimiter(rate=20, burst=2)
+        start = time.time()
+        limiter.acquire()
+        limiter.acquire()
+        self.assertLess(time.time() - start, 0.04)
+
+        # the bucket is empty, every request waits for a new token
+        limiter.acquire()
+        limiter.acquire()
+        self.assertGreaterEqual(time.time() - start, 0.09)
+
+    def test_pause(self):
+        limiter = RateLimiter()
+        limiter.pause(0.1)
+        start = time.time()
+        limiter.acquire()
+        self.assertGreaterEqual(time.time() - start, 0.09)
+
+
+class SQLSchedulerTest(unittest.TestCase):
+
+    def scheduler(self, client, retries=3):
+        return SQLScheduler(client, concurrency=2, retries=retries, backoff=0.0)
+
+    def test_retries_transient_errors(self):
+        client = FakeClient(rate_limited(), CartoException(requests.exceptions.ConnectionError('reset')),
+                            CartoException(HTTPError(503)))
+        scheduler = self.scheduler(client)
+
+        self.assertEqual(scheduler.send('select 1'), {'rows': [{'sql': 'select 1'}]})
+        self.assertEqual(client.calls, 4)
+        self.assertEqual(scheduler.failures, [])
+
+    def test_permanent_error(self):
+        client = FakeClient(CartoException(HTTPError(400)))
+        scheduler = self.scheduler(client)
+
+        with self.assertRaises(QueryError) as raised:
+            scheduler.send('select broken')
+        self.assertEqual(client.calls, 1)
+        self.assertEqual(raised.exception.attempts, 1)
+        self.assertEqual(raised.exception.query, 'select broken')
+        self.assertEqual(scheduler.failures, [raised.exception])
+
+    def test_retries_exhausted(self):
+        client = FakeClient(*[CartoException(HTTPError(502)) for _ in range(3)])
+        scheduler = self.scheduler(client, retries=2)
+
+        with self.assertRaises(QueryError) as raised:
+            scheduler.send('select 1')
+        self.assertEqual(raised.exception.attempts, 3)
+        self.assertEqual(len(scheduler.failures), 1)
+
+        scheduler.reset()
+        self.assertEqual(scheduler.failures, [])
+
+    def test_failure_not_kept(self):
+        scheduler = self.scheduler(FakeClient(CartoException(HTTPError(400))))
+
+        with self.assertRaises(QueryError):
+            scheduler.send('select 1', keep_failure=False)
+        self.assertEqual(scheduler.failures, [])
+
+    def test_delay(self):
+        scheduler = SQLScheduler(FakeClient(), backoff=1.0, max_backoff=4.0)
+
+        for attempt in range(1, 6):
+            self.assertLessEqual(scheduler.delay(attempt), min(4.0, 2 ** (attempt - 1)))
+        self.assertGreaterEqual(scheduler.delay(1, retry_after=2), 2)
+
+
+class FakeScheduler(object):
+    '''
+    Answers every query with one row naming it, failing the queries in fail and
+    the combined ones when fail_batch is set.
+    '''
+
+    def __init__(self, fail=(), fail_batch=False):
+        self.fail = fail
+        self.fail_batch = fail_batch
+        self.sent = []
+
+    def send(self, sql, keep_failure=True):
+        self.sent.append(sql)
+        if sql.startswith('select') and 'json_agg' in sql:
+            if self.fail_batch:
+                raise QueryError(sql, 'canceling statement due to statement timeout', 1)
+            return {'rows': [{'q0': json.dumps([{'query': 'a'}]), 'q1': [{'query': 'b'}]}]}
+        if sql in self.fail:
+            raise QueryError(sql, 'function does not exist', 1)
+        return {'rows': [{'query': sql}]}
+
+
+class QueryBatchTest(unittest.TestCase):
+
+    def test_single_request(self):
+        scheduler = FakeScheduler()
+        batch = QueryBatch(scheduler)
+        batch.add('a')
+        batch.add('b')
+        batch.add('a')
+
+        self.assertEqual(batch.result('b'), [{'query': 'b'}])
+        self.assertEqual(batch.result('a'), [{'query': 'a'}])
+        self.assertEqual(len(scheduler.sent), 1)
+        self.assertFalse(batch.pending('a'))
+
+    def test_fallback_one_by_one(self):
+        scheduler = FakeScheduler(fail=['b'], fail_batch=True)
+        batch = QueryBatch(scheduler)
+        batch.add('a')
+        batch.add('b')
+
+        self.assertEqual(batch.result('a'), [{'query': 'a'}])
+        with self.assertRaises(QueryError):
+            batch.result('b')
+        self.assertEqual(scheduler.sent[1:], ['a', 'b'])
+
+
+class BatchQueriesTest(unittest.TestCase):
+
+    def test_heavy_queries_not_batched(self):
+        reporter = Reporter('tester', None, None, None, 5000)
+
+        self.assertEqual(reporter.batchQueries('tester'), [report.LDS_QUERY])
+
+    def test_approximate_storage_batched(self):
+        reporter = Reporter('tester', None, None, None, 5000, approximate=True)
+        queries = reporter.batchQueries('tester')
+
+        self.assertEqual(queries, [report.LDS_QUERY, reporter.storageQuery('tester')])
+        self.assertNotIn(reporter.inventoryQuery(0, sizes=True), queries)
+
+
+if __name__ == '__main__':
+    unittest.main()